@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+import json
+from pathlib import Path
+from typing import List, Dict, Any, Optional, Callable, Iterable
+from constants import ARCHIVE_DIR, ARCHIVE_INDEX
+import storage
+from storage import NEEDS_LISTS, atomic_write_json
+
+# kind -> record field holding the date ("YYYY-MM-DD")
+DATE_FIELDS = {"issues": "date", "store_requests": "created", "qa_overflow_requests": "created"}
+OPEN_STATUS = "pending"
+
+_segment_cache: Dict[str, tuple] = {}
+
+def load_index() -> List[Dict[str, Any]]:
+    if not ARCHIVE_INDEX.exists():
+        return []
+    return json.loads(ARCHIVE_INDEX.read_text(encoding="utf-8"))
+
+def _save_index(index: List[Dict[str, Any]]) -> None:
+    ARCHIVE_DIR.mkdir(parents=True, exist_ok=True)
+    atomic_write_json(ARCHIVE_INDEX, sorted(index, key=lambda s: (s["kind"], s["year"])))
+
+def _year(rec: Dict[str, Any], kind: str) -> Optional[int]:
+    d = str(rec.get(DATE_FIELDS[kind]) or "")
+    return int(d[:4]) if d[:4].isdigit() else None
+
+def archived_years(kind: str) -> List[int]:
+    return sorted({s["year"] for s in load_index() if s["kind"] == kind})
+
+def max_ids() -> Dict[str, int]:
+    """Largest archived id per history list, so id counters never reuse an archived id."""
+    result: Dict[str, int] = {}
+    for s in load_index():
+        result[s["kind"]] = max(result.get(s["kind"], 0), s["max_id"])
+    return result
+
+def read_segment(seg: Dict[str, Any]) -> List[Dict[str, Any]]:
+    path = ARCHIVE_DIR / seg["file"]
+    mtime = path.stat().st_mtime
+    cached = _segment_cache.get(seg["file"])
+    if cached and cached[0] == mtime:
+        return cached[1]
+    rows = json.loads(path.read_text(encoding="utf-8"))
+    _segment_cache[seg["file"]] = (mtime, rows)
+    return rows
+
+def segments(kind: str, years: Optional[Iterable[int]] = None, date_from: str = None, date_to: str = None,
+             department: str = None, status: str = None) -> List[Dict[str, Any]]:
+    """Index entries of `kind` whose ranges can contain matches for the given filters."""
+    years = set(years) if years is not None else None
+    result = []
+    for s in load_index():
+        if s["kind"] != kind:
+            continue
+        if years is not None and s["year"] not in years:
+            continue
+        if date_from and s["date_to"] and s["date_to"] < date_from:
+            continue
+        if date_to and s["date_from"] and s["date_from"] > date_to:
+            continue
+        if department and department not in s["departments"]:
+            continue
+        if status and status not in s["statuses"]:
+            continue
+        result.append(s)
+    return result
+
+def query(kind: str, **filters) -> List[Dict[str, Any]]:
+    """Archived records of `kind`, reading only the segments that pass the index ranges."""
+    rows: List[Dict[str, Any]] = []
+    for seg in segments(kind, **filters):
+        rows.extend(read_segment(seg))
+    return rows
+
+def close_year(needs: Dict[str, Any], year: int, resolve_need: Callable[[str, Any], Optional[Dict[str, Any]]] = None) -> Dict[str, int]:
+    """Move history dated `year` or earlier out of `needs` into per-year segments.
+
+    Pending requests stay hot whatever their date. Store requests get the item name of
+    their plan row written in, since plan rows of a closed year do not stay around.
+    Closing a year again merges into its segments, by id, what was left hot the first
+    time (requests still pending then, or records of a save lost in a crash); the hot
+    copy replaces an archived one with the same id. Records already archived are
+    otherwise never rewritten.
+    The caller saves `needs` afterwards; until then a record may exist both hot and
+    archived, which readers resolve in favour of the hot copy.
+    """
+    # Segments are read-modify-written like the store itself: under the needs lock, so
+    # two workstations closing years at once do not drop each other's records
+    with storage._lock, storage._store_lock("needs"):
+        return _close_year(needs, year, resolve_need)
+
+def _close_year(needs: Dict[str, Any], year: int, resolve_need) -> Dict[str, int]:
+    index = {(s["kind"], s["year"]): s for s in load_index()}
+    moved: Dict[str, int] = {}
+    for kind, id_key in NEEDS_LISTS.items():
+        keep, by_year = [], {}
+        for r in needs.get(kind, []):
+            y = _year(r, kind)
+            if y is None or y > year or r.get("status") == OPEN_STATUS:
+                keep.append(r); continue
+            if kind == "store_requests" and resolve_need and not r.get("item_name"):
+                need = resolve_need(r.get("department"), r.get("need_id"))
+                r = {**r, "item_name": need.get("item_name") if need else ""}
+            by_year.setdefault(y, []).append(r)
+        for y, rows in by_year.items():
+            seg = index.get((kind, y))
+            if seg:
+                ids = {x.get(id_key) for x in rows}
+                rows = [x for x in read_segment(seg) if x.get(id_key) not in ids] + rows
+            rows.sort(key=lambda x: int(x.get(id_key) or 0))
+            fname = f"{kind}-{y}.json"
+            ARCHIVE_DIR.mkdir(parents=True, exist_ok=True)
+            atomic_write_json(ARCHIVE_DIR / fname, rows)
+            dates = [str(x.get(DATE_FIELDS[kind]) or "") for x in rows]
+            index[(kind, y)] = {
+                "kind": kind, "year": y, "file": fname, "count": len(rows),
+                "min_id": min(int(x.get(id_key) or 0) for x in rows), "max_id": max(int(x.get(id_key) or 0) for x in rows),
+                "date_from": min(dates), "date_to": max(dates),
+                "departments": sorted({x.get("department") for x in rows if x.get("department")}),
+                "statuses": sorted({x.get("status") for x in rows if x.get("status")}),
+            }
+            moved[kind] = moved.get(kind, 0) + len(by_year[y])
+        if kind in needs:
+            needs[kind] = keep
+    _save_index(list(index.values()))
+    return moved
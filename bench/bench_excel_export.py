@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+"""Stock report export at 100k rows: pandas DataFrame.to_excel against the streaming
+write-only exporter (exports.export_stock_to_excel).
+
+Usage: python bench/bench_excel_export.py [rows]
+
+Reports wall time and peak Python heap (tracemalloc) of each; the former implementation
+is skipped when pandas is not installed.
+"""
+from __future__ import annotations
+import os, sys, tempfile, time, tracemalloc
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from models import Item
+from exports import STOCK_COLUMNS, OPTIONAL_FIELDS, export_stock_to_excel
+from bench_serializers import synthetic_rows
+
+def legacy_export(items, path: str) -> None:
+    import pandas as pd
+    df = pd.DataFrame.from_records([it.to_dict() for it in items], columns=[f for f, _ in STOCK_COLUMNS])
+    df[OPTIONAL_FIELDS] = df[OPTIONAL_FIELDS].fillna("")
+    df.columns = [title for _, title in STOCK_COLUMNS]
+    df.to_excel(path, index=False)
+
+def measure(label: str, n: int, fn, path: str) -> None:
+    tracemalloc.start()
+    t = time.perf_counter(); fn(path); dt = time.perf_counter() - t
+    _, peak = tracemalloc.get_traced_memory(); tracemalloc.stop()
+    size = os.path.getsize(path) / 2**20
+    print(f"{label:<26} {dt:8.2f} s  {dt / n * 1e6:7.1f} us/row  peak {peak / 2**20:7.1f} MiB  file {size:6.1f} MiB")
+
+def main() -> None:
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    items = [Item.from_dict(r) for r in synthetic_rows(n)]
+    print(f"{n} items")
+    with tempfile.TemporaryDirectory() as tmp:
+        try:
+            import pandas  # noqa: F401
+        except ImportError:
+            print("pandas DataFrame.to_excel    skipped (pandas not installed)")
+        else:
+            measure("pandas DataFrame.to_excel", n, lambda p: legacy_export(items, p), os.path.join(tmp, "legacy.xlsx"))
+        measure("streaming write-only", n, lambda p: export_stock_to_excel(iter(items), p), os.path.join(tmp, "stream.xlsx"))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+"""Time to first paint of the main window's two notebooks at 100k stock rows.
+
+Usage: python bench/bench_first_paint.py [rows]
+
+Builds the inventory tabs (rows split over the three categories) and one needs tab per
+department (rows / 10 needs each) the way the main window does, then waits for the
+first paint. "eager" builds and fills every tab, as the window did before; "lazy" only
+the shown tab of each notebook, the others being left for their first
+<<NotebookTabChanged>>. Needs a display.
+"""
+from __future__ import annotations
+import sys, time
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import tkinter as tk
+from tkinter import ttk
+from constants import NEEDS_DEPARTMENTS
+from models import Item
+from ui.virtual_tree import VirtualTree
+from bench_serializers import synthetic_rows
+
+INV_COLUMNS = ["seq_id", "name", "quantity", "unit", "packaging", "storage_place", "expiry_date", "date_received", "batch_number", "responsible"]
+NEED_COLUMNS = ["need_id", "category", "item_name", "plan_qty", "remaining_qty", "unit", "purpose"]
+
+def need_rows(dep: str, n: int):
+    for i in range(1, n + 1):
+        yield f"{dep}-{i}", (i, "Реактивы", f"Реактив {i % 5000}", i % 50, i % 30, "шт", "Анализ"), ()
+
+def build(root: tk.Tk, tabs, lazy: bool) -> float:
+    """tabs: one [(title, columns, rows)] per notebook. Returns seconds until the first paint."""
+    t = time.perf_counter()
+    for pages in tabs:
+        nb = ttk.Notebook(root); nb.pack(fill="both", expand=True)
+        for k, (title, columns, rows) in enumerate(pages):
+            frame = ttk.Frame(nb); nb.add(frame, text=title)
+            if lazy and k > 0:
+                continue
+            tree = VirtualTree(frame, columns); tree.pack(fill="both", expand=True)
+            tree.sortable()
+            tree.reconcile(rows())
+    root.update()
+    return time.perf_counter() - t
+
+def main() -> None:
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    items = [Item.from_dict(r) for r in synthetic_rows(n)]
+    by_cat = {}
+    for it in items:
+        by_cat.setdefault(it.category, []).append((f"{it.category}-{it.seq_id}", tuple(getattr(it, c) or "" for c in INV_COLUMNS), ()))
+    tabs = [
+        [(dep, NEED_COLUMNS, lambda dep=dep: need_rows(dep, n // 10)) for dep in NEEDS_DEPARTMENTS],
+        [(cat, INV_COLUMNS, lambda rows=rows: rows) for cat, rows in by_cat.items()],
+    ]
+    print(f"{n} stock rows, {len(NEEDS_DEPARTMENTS)} needs tabs of {n // 10}")
+    for label, lazy in (("eager (every tab)", False), ("lazy (shown tabs)", True)):
+        try:
+            root = tk.Tk()
+        except tk.TclError as e:
+            print(f"no display: {e}"); return
+        root.geometry("1400x900")
+        dt = build(root, tabs, lazy)
+        root.destroy()
+        print(f"{label:<24} {dt * 1000:9.1f} ms to first paint")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+"""Inventory search at 100k rows: the former per-keystroke scan against SearchIndex.
+
+Usage: python bench/bench_search.py [rows]
+
+Types a few queries one letter at a time and reports the slowest and mean keystroke.
+The former scan joined and lowercased the values of every row on each keystroke (the Tk
+round trips it also made are not counted here).
+"""
+from __future__ import annotations
+import sys, time
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from models import Item
+from search import SearchIndex
+from bench_serializers import synthetic_rows
+
+FIELDS = ["seq_id", "name", "quantity", "unit", "packaging", "storage_place", "expiry_date", "date_received", "batch_number", "responsible"]
+QUERIES = ["реактив 42", "шкаф 17", "2027-03", "иванов", "xyz"]
+
+def row_values(it: Item) -> tuple:
+    return tuple(getattr(it, f) or "" for f in FIELDS)
+
+def typed(label: str, fn) -> None:
+    times = []
+    for q in QUERIES:
+        for k in range(1, len(q) + 1):
+            t = time.perf_counter(); fn(q[:k]); times.append(time.perf_counter() - t)
+    print(f"{label:<24} max {max(times) * 1000:7.1f} ms  mean {sum(times) / len(times) * 1000:7.2f} ms per keystroke")
+
+def main() -> None:
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    rows = {f"Реактивы-{it.seq_id}": row_values(it) for it in (Item.from_dict(r) for r in synthetic_rows(n))}
+    print(f"{n} rows")
+    typed("scan per keystroke", lambda q: [k for k, v in rows.items() if q in " ".join(str(x) for x in v).lower()])
+    index = SearchIndex()
+    t = time.perf_counter()
+    index.set_many((k, " ".join(str(x) for x in v)) for k, v in rows.items())
+    print(f"{'index build':<24} {(time.perf_counter() - t) * 1000:7.1f} ms")
+    typed("SearchIndex", index.search)
+    typed("SearchIndex (warm)", index.search)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+"""Per-row cost of Item serialization at 100k rows.
+
+Usage: python bench/bench_serializers.py [rows]
+
+Compares the former dataclasses.asdict / defaults-merge from_dict with the generated
+codec, and the stdlib json module with orjson (when installed) for the items file.
+"""
+from __future__ import annotations
+import json, sys, time
+from dataclasses import asdict
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from models import Item, ITEM_DEFAULTS
+import storage
+
+def synthetic_rows(n: int):
+    units = ["шт", "мл", "л", "г", "кг"]
+    for i in range(1, n + 1):
+        yield {
+            "seq_id": i, "name": f"Реактив {i % 5000}", "category": ("Реактивы", "ГСО-ПГС-СО", "Расходные материалы")[i % 3],
+            "quantity": float(i % 100), "unit": units[i % 5], "storage_place": f"Шкаф {i % 40}", "packaging": "1 л",
+            "expiry_date": f"202{6 + i % 3}-{1 + i % 12:02d}-{1 + i % 28:02d}", "date_received": "2025-08-28",
+            "batch_number": str(i % 700), "responsible": "Иванов", "qualification": "х.ч." if i % 3 == 0 else None,
+        }
+
+def legacy_from_dict(d):
+    return Item(**{**ITEM_DEFAULTS, **d})
+
+def timed(label: str, n: int, fn) -> None:
+    t = time.perf_counter(); fn(); dt = time.perf_counter() - t
+    print(f"{label:<34} {dt * 1000:9.1f} ms  {dt / n * 1e6:7.2f} us/row")
+
+def main() -> None:
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    rows = list(synthetic_rows(n))
+    items = [Item.from_dict(r) for r in rows]
+    print(f"{n} items, orjson: {'yes' if storage.orjson is not None else 'no'}")
+    timed("from_dict (defaults merge)", n, lambda: [legacy_from_dict(r) for r in rows])
+    timed("from_dict (generated)", n, lambda: [Item.from_dict(r) for r in rows])
+    timed("to_dict (dataclasses.asdict)", n, lambda: [asdict(it) for it in items])
+    timed("to_dict (generated)", n, lambda: [it.to_dict() for it in items])
+    dicts = [it.to_dict() for it in items]
+    raw = json.dumps(dicts, ensure_ascii=False, indent=2).encode("utf-8")
+    timed("json.dumps", n, lambda: json.dumps(dicts, ensure_ascii=False, indent=2).encode("utf-8"))
+    timed("json.loads", n, lambda: json.loads(raw.decode("utf-8")))
+    if storage.orjson is not None:
+        timed("storage.dumps_json (orjson)", n, lambda: storage.dumps_json(dicts))
+        timed("storage.loads_json (orjson)", n, lambda: storage.loads_json(raw))
+    timed("load: json + legacy from_dict", n, lambda: [legacy_from_dict(r) for r in json.loads(raw.decode("utf-8"))])
+    timed("load: loads_json + generated", n, lambda: [Item.from_dict(r) for r in storage.loads_json(raw)])
+
+if __name__ == "__main__":
+    main()
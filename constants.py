@@ -13,6 +13,32 @@ ITEMS_JSON = DATA_DIR / "items.json"
 USERS_JSON = DATA_DIR / "users.json"
 NEEDS_JSON = DATA_DIR / "needs.json"
 
+# "json" rewrites the whole file on every save; "journal" appends changed records
+# to a per-store log and folds it into the JSON snapshot every JOURNAL_CHECKPOINT_EVERY records;
+# "sqlite" keeps everything in SQLITE_DB (imported from the JSON files on first start);
+# "snapshot" keeps one binary SNAPSHOT_FILE whose history sections are decoded on first use;
+# "remote" leaves the data to the API server at SERVER_URL
+STORAGE_MODE = "json"
+ITEMS_JOURNAL = DATA_DIR / "items.journal"
+NEEDS_JOURNAL = DATA_DIR / "needs.journal"
+JOURNAL_CHECKPOINT_EVERY = 500
+SQLITE_DB = DATA_DIR / "lab.sqlite3"
+SNAPSHOT_FILE = DATA_DIR / "lab.snap"
+# Set when several workstations share DATA_DIR: saves then take a per-store file lock and
+# merge records written by others since our last load instead of overwriting them.
+# Off for a single workstation, which needs neither the locks nor the version stamps
+CONCURRENT_ACCESS = False
+# "remote" storage mode talks to the API server (python server.py) instead of DATA_DIR
+SERVER_HOST = "127.0.0.1"
+SERVER_PORT = 8765
+SERVER_URL = f"http://{SERVER_HOST}:{SERVER_PORT}"
+# Seconds between checks for saves of other workstations (local saves are seen at once on Linux)
+WATCH_INTERVAL = 2.0
+
+# Closed years of issues / request history live in per-year segment files
+ARCHIVE_DIR = DATA_DIR / "archive"
+ARCHIVE_INDEX = ARCHIVE_DIR / "index.json"
+
 CATEGORIES = ["Реактивы", "ГСО-ПГС-СО", "Расходные материалы"]
 
 REAGENT_TYPES = [
@@ -52,4 +78,7 @@ COLOR_EXPIRED = "#C62828"
 COLOR_SOON    = "#EF6C00"
 COLOR_NORMAL  = "#212121"
 
-EXPIRY_SOON_THRESHOLD = 30
\ No newline at end of file
+EXPIRY_SOON_THRESHOLD = 30
+
+# Search fields wait this long after the last keystroke before filtering the trees
+SEARCH_DEBOUNCE_MS = 150
\ No newline at end of file
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+"""Expiry dates of the stock lots, parsed once into day ordinals and kept sorted.
+
+The sorted (ordinal, seq_id) list answers range questions with bisect: what is expired,
+what expires in the next N days, and which lots changed state when the date moved on,
+so the UI re-tags only those rows at midnight instead of re-parsing every row.
+"""
+from __future__ import annotations
+from bisect import bisect_left, insort
+from datetime import date
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from constants import EXPIRY_SOON_THRESHOLD
+from models import Item
+
+EXPIRED = "expired"
+SOON = "soon"
+
+_ordinals: Dict[str, Optional[int]] = {}
+
+def to_ordinal(s: Optional[str]) -> Optional[int]:
+    """Day ordinal of a YYYY-MM-DD string, None when empty or malformed. Lots share a
+    handful of dates, so parsed strings are cached."""
+    if not s:
+        return None
+    try:
+        return _ordinals[s]
+    except KeyError:
+        pass
+    try:
+        o = date.fromisoformat(s).toordinal() if len(s) == 10 else None
+    except ValueError:
+        o = None
+    if len(_ordinals) < 100_000:
+        _ordinals[s] = o
+    return o
+
+def classify(o: Optional[int], today: int, soon_days: int = EXPIRY_SOON_THRESHOLD) -> str:
+    """EXPIRED, SOON or "" for an expiry ordinal on day `today`."""
+    if o is None:
+        return ""
+    if o < today:
+        return EXPIRED
+    return SOON if o <= today + soon_days else ""
+
+class ExpiryIndex:
+    def __init__(self, items: Iterable[Item] = (), soon_days: int = EXPIRY_SOON_THRESHOLD):
+        self.soon_days = soon_days
+        self._by_seq: Dict[int, int] = {}
+        self._sorted: List[Tuple[int, int]] = []
+        self.rebuild(items)
+
+    def rebuild(self, items: Iterable[Item]) -> None:
+        self._by_seq = {}
+        for it in items:
+            o = to_ordinal(it.expiry_date)
+            if o is not None:
+                self._by_seq[it.seq_id] = o
+        self._sorted = sorted((o, s) for s, o in self._by_seq.items())
+
+    def add(self, it: Item) -> None:
+        self.discard(it.seq_id)
+        o = to_ordinal(it.expiry_date)
+        if o is not None:
+            self._by_seq[it.seq_id] = o
+            insort(self._sorted, (o, it.seq_id))
+
+    def add_many(self, items: Iterable[Item]) -> None:
+        # New seq_ids only (a bulk import); sorting two sorted runs is a linear merge
+        new = []
+        for it in items:
+            o = to_ordinal(it.expiry_date)
+            if o is not None:
+                self._by_seq[it.seq_id] = o; new.append((o, it.seq_id))
+        new.sort()
+        self._sorted = sorted(self._sorted + new) if self._sorted else new
+
+    def discard(self, seq_id: int) -> None:
+        o = self._by_seq.pop(seq_id, None)
+        if o is not None:
+            i = bisect_left(self._sorted, (o, seq_id))
+            if i < len(self._sorted) and self._sorted[i] == (o, seq_id):
+                del self._sorted[i]
+
+    def __len__(self) -> int:
+        return len(self._sorted)
+
+    # ---- queries; `today` is a day ordinal, date.today() when omitted ----
+    def status(self, seq_id: int, today: Optional[int] = None) -> str:
+        today = date.today().toordinal() if today is None else today
+        return classify(self._by_seq.get(seq_id), today, self.soon_days)
+
+    def _range(self, lo: int, hi: int) -> List[int]:
+        # seq_ids expiring on days lo..hi inclusive
+        i = bisect_left(self._sorted, (lo,))
+        j = bisect_left(self._sorted, (hi + 1,), lo=i)
+        return [s for _, s in self._sorted[i:j]]
+
+    def expired(self, today: Optional[int] = None) -> List[int]:
+        today = date.today().toordinal() if today is None else today
+        return [s for _, s in self._sorted[:bisect_left(self._sorted, (today,))]]
+
+    def expiring_within(self, days: int, today: Optional[int] = None) -> List[int]:
+        """Lots expiring from today to today + days, soonest first."""
+        today = date.today().toordinal() if today is None else today
+        return self._range(today, today + days)
+
+    def crossed(self, old_today: int, new_today: int) -> Set[int]:
+        """Lots whose status differs between the two days: newly expired ones and ones that
+        came within soon_days. For new_today < old_today (clock set back) the same ranges."""
+        lo, hi = sorted((old_today, new_today))
+        if lo == hi:
+            return set()
+        return set(self._range(lo, hi - 1)) | set(self._range(lo + self.soon_days + 1, hi + self.soon_days))
@@ -1,66 +1,268 @@
 # -*- coding: utf-8 -*-
 from __future__ import annotations
-from typing import List
-import pandas as pd
+import io, os, re, zipfile
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+from itertools import repeat
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+from xml.sax.saxutils import escape
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font, PatternFill
+from openpyxl.utils import get_column_letter
 from docx import Document
 from docx.text.paragraph import Paragraph
-from models import Item
+from models import Item, Issue
+from constants import CATEGORIES, COLOR_EXPIRED, COLOR_SOON
+from expiry import EXPIRED, SOON, to_ordinal, classify
 
-def export_stock_to_excel(items: List[Item], path: str) -> None:
-    rows = []
+# (Item field, column title); fields in OPTIONAL_FIELDS show None as an empty cell
+STOCK_COLUMNS = [
+    ("seq_id", "SEQ_ID"), ("name", "Наименование"), ("category", "Категория"), ("quantity", "Количество"),
+    ("unit", "Ед. изм."), ("packaging", "Фасовка"), ("storage_place", "Место хранения"),
+    ("expiry_date", "Срок годности"), ("date_received", "Дата поступления"), ("batch_number", "Номер партии"),
+    ("responsible", "Ответственный"), ("qualification", "Квалификация"), ("reagent_type", "Тип реактива"),
+    ("state_register_no", "№ в госреестре СО"), ("certified_value", "Аттестованное значение"),
+    ("manufacture_date", "Дата выпуска"), ("manufacturer", "Производитель"), ("storage_conditions", "Условия хранения"),
+]
+OPTIONAL_FIELDS = ["expiry_date", "date_received", "qualification", "reagent_type", "state_register_no",
+                   "certified_value", "manufacture_date", "manufacturer", "storage_conditions"]
+
+_COMMON_FIELDS = ["seq_id", "name", "quantity", "unit", "packaging", "storage_place", "expiry_date",
+                  "date_received", "batch_number", "responsible"]
+# Sheet columns per category, as on the inventory tabs; other categories get every column
+SHEET_FIELDS: Dict[str, List[str]] = {
+    "Реактивы": _COMMON_FIELDS + ["qualification", "reagent_type"],
+    "ГСО-ПГС-СО": _COMMON_FIELDS + ["state_register_no", "certified_value", "manufacture_date", "manufacturer", "storage_conditions"],
+    "Расходные материалы": [f for f in _COMMON_FIELDS if f != "expiry_date"],
+}
+# Column widths in characters; the write-only writer cannot measure cells after the fact
+COLUMN_WIDTHS = {"seq_id": 9, "name": 40, "quantity": 12, "unit": 8, "storage_place": 20, "state_register_no": 20,
+                 "certified_value": 24, "storage_conditions": 24, "manufacturer": 22}
+DEFAULT_WIDTH = 16
+OTHER_SHEET = "Прочее"
+# Rows/documents between two progress reports
+PROGRESS_EVERY = 1000
+
+Progress = Callable[[int, int], None]
+
+def _sheet(wb: Workbook, title: str, fields: List[str], header_font: Font):
+    ws = wb.create_sheet(title=title[:31])
+    # Write-only sheets take layout only before the first row
+    for i, f in enumerate(fields, 1):
+        ws.column_dimensions[get_column_letter(i)].width = COLUMN_WIDTHS.get(f, DEFAULT_WIDTH)
+    ws.freeze_panes = "A2"
+    titles = dict(STOCK_COLUMNS)
+    header = []
+    for f in fields:
+        c = WriteOnlyCell(ws, titles[f]); c.font = header_font
+        header.append(c)
+    ws.append(header)
+    return ws
+
+def export_stock_to_excel(items: Iterable[Item], path: str, today: Optional[date] = None,
+                          progress: Optional[Progress] = None) -> int:
+    """Stream the stock into an xlsx file, one sheet per category, in constant memory:
+    rows go from the iterator straight to the write-only workbook. Expired lots get a
+    red expiry date cell, lots expiring within EXPIRY_SOON_THRESHOLD days an orange one.
+    progress(done, total) is called every PROGRESS_EVERY rows (total is 0 for a plain
+    iterator); an exception it raises aborts the export before the file is written.
+    Returns the number of rows written."""
+    total = len(items) if hasattr(items, "__len__") else 0
+    wb = Workbook(write_only=True)
+    header_font = Font(bold=True)
+    styles = {
+        EXPIRED: (Font(color=COLOR_EXPIRED[1:], bold=True), PatternFill("solid", fgColor="FDECEA")),
+        SOON: (Font(color=COLOR_SOON[1:]), PatternFill("solid", fgColor="FFF3E0")),
+    }
+    today_ord = (today or date.today()).toordinal()
+    sheets = {}
+    for cat in CATEGORIES:
+        fields = SHEET_FIELDS.get(cat, [f for f, _ in STOCK_COLUMNS])
+        sheets[cat] = (_sheet(wb, cat, fields, header_font), fields)
+    optional = set(OPTIONAL_FIELDS)
+    count = 0
     for it in items:
-        rows.append({
-            "SEQ_ID": it.seq_id,
-            "Наименование": it.name,
-            "Категория": it.category,
-            "Количество": it.quantity,
-            "Ед. изм.": it.unit,
-            "Фасовка": it.packaging,
-            "Место хранения": it.storage_place,
-            "Срок годности": it.expiry_date or "",
-            "Дата поступления": it.date_received or "",
-            "Номер партии": it.batch_number,
-            "Ответственный": it.responsible,
-            "Квалификация": it.qualification or "",
-            "Тип реактива": it.reagent_type or "",
-            "№ в госреестре СО": it.state_register_no or "",
-            "Аттестованное значение": it.certified_value or "",
-            "Дата выпуска": it.manufacture_date or "",
-            "Производитель": it.manufacturer or "",
-            "Условия хранения": it.storage_conditions or ""
-        })
-    pd.DataFrame(rows).to_excel(path, index=False)
-
-def _replace_in_paragraph(paragraph: Paragraph, mapping: dict):
-    inline = paragraph.runs
-    if not inline:
-        return
-    text = "".join(run.text for run in inline)
-    for k, v in mapping.items():
-        if k in text:
-            text = text.replace(k, str(v))
-    paragraph.text = text
-
-def _replace_in_tables(doc: Document, mapping: dict):
-    for table in doc.tables:
-        for row in table.rows:
+        target = sheets.get(it.category)
+        if target is None:
+            if OTHER_SHEET not in sheets:
+                fields = [f for f, _ in STOCK_COLUMNS]
+                sheets[OTHER_SHEET] = (_sheet(wb, OTHER_SHEET, fields, header_font), fields)
+            target = sheets[OTHER_SHEET]
+        ws, fields = target
+        row = []
+        for f in fields:
+            v = getattr(it, f)
+            if v is None and f in optional:
+                v = ""
+            if f == "expiry_date":
+                state = classify(to_ordinal(v), today_ord)
+                if state:
+                    v = WriteOnlyCell(ws, v); v.font, v.fill = styles[state]
+            row.append(v)
+        ws.append(row)
+        count += 1
+        if progress is not None and count % PROGRESS_EVERY == 0:
+            progress(count, total)
+    if progress is not None:
+        progress(count, total)
+    wb.save(path)
+    return count
+
+# ---- DOCX issue documents ----
+_PLACEHOLDER = re.compile(r"\{([A-Z_]+)\}")
+DOCUMENT_XML = "word/document.xml"
+PAGE_BREAK = '<w:p><w:r><w:br w:type="page"/></w:r></w:p>'
+# Batches smaller than this are rendered in-process: starting workers would cost more
+POOL_MIN = 200
+POOL_CHUNK = 100
+
+def _iter_paragraphs(doc: Document) -> Iterator[Paragraph]:
+    yield from doc.paragraphs
+    tables = list(doc.tables)
+    while tables:
+        for row in tables.pop().rows:
             for cell in row.cells:
-                for p in cell.paragraphs:
-                    _replace_in_paragraph(p, mapping)
+                yield from cell.paragraphs
+                tables.extend(cell.tables)
 
-def export_issue_docx(item: Item, path: str, template_path: str) -> None:
-    mapping = {
-        "{ID}": item.seq_id,
-        "{SEQ_ID}": item.seq_id,
-        "{NAME}": item.name,
-        "{CATEGORY}": item.category,
-        "{QTY}": item.quantity,
-        "{UNIT}": item.unit,
-        "{BATCH}": item.batch_number,
-        "{RESPONSIBLE}": item.responsible,
+def _join_runs(paragraph: Paragraph) -> None:
+    # Word splits text into runs at arbitrary points; the whole text goes into the first
+    # run (keeping its formatting) so that every placeholder lies inside one <w:t>
+    runs = paragraph.runs
+    if len(runs) < 2:
+        return
+    runs[0].text = "".join(r.text for r in runs)
+    for r in runs[1:]:
+        r.text = ""
+
+class CompiledTemplate:
+    """A DOCX template parsed once. document.xml is kept as literal chunks alternating with
+    placeholder names, and the other parts of the package are compressed once into a zip
+    prefix, so rendering a document is a join plus one appended zip entry."""
+
+    def __init__(self, path: str):
+        doc = Document(path)
+        for p in _iter_paragraphs(doc):
+            if "{" in p.text:
+                _join_runs(p)
+        buf = io.BytesIO(); doc.save(buf)
+        prefix = io.BytesIO()
+        with zipfile.ZipFile(buf) as src, zipfile.ZipFile(prefix, "w", zipfile.ZIP_DEFLATED) as dst:
+            for info in src.infolist():
+                if info.filename == DOCUMENT_XML:
+                    xml = src.read(info).decode("utf-8")
+                else:
+                    dst.writestr(info, src.read(info), compress_type=zipfile.ZIP_DEFLATED)
+        self._prefix = prefix.getvalue()
+        start = xml.index("<w:body>") + len("<w:body>")
+        end = xml.rfind("<w:sectPr")
+        if end < start:
+            end = xml.rindex("</w:body>")
+        self._head, self._tail = xml[:start], xml[end:]
+        self._body = _PLACEHOLDER.split(xml[start:end])
+        self.placeholders = sorted(set(self._body[1::2]))
+
+    def render_body(self, mapping: Dict[str, Any]) -> str:
+        values = {k: "" if v is None else escape(str(v)) for k, v in mapping.items()}
+        parts = self._body
+        out = [parts[0]]
+        for i in range(1, len(parts), 2):
+            key = parts[i]
+            out.append(values[key] if key in values else "{" + key + "}")
+            out.append(parts[i + 1])
+        return "".join(out)
+
+    def package(self, body: str) -> bytes:
+        buf = io.BytesIO(self._prefix)
+        with zipfile.ZipFile(buf, "a", zipfile.ZIP_DEFLATED) as z:
+            z.writestr(DOCUMENT_XML, (self._head + body + self._tail).encode("utf-8"))
+        return buf.getvalue()
+
+    def render(self, mapping: Dict[str, Any]) -> bytes:
+        return self.package(self.render_body(mapping))
+
+    def render_merged(self, bodies: Iterable[str]) -> bytes:
+        return self.package(PAGE_BREAK.join(bodies))
+
+_templates: Dict[Tuple[str, int, int], CompiledTemplate] = {}
+
+def compile_template(path: str) -> CompiledTemplate:
+    """Compiled template for `path`, cached until the file changes."""
+    st = os.stat(path)
+    key = (os.path.abspath(path), st.st_mtime_ns, st.st_size)
+    t = _templates.get(key)
+    if t is None:
+        t = _templates[key] = CompiledTemplate(path)
+    return t
+
+def item_mapping(item: Item) -> Dict[str, Any]:
+    return {
+        "ID": item.seq_id, "SEQ_ID": item.seq_id, "NAME": item.name, "CATEGORY": item.category,
+        "QTY": item.quantity, "UNIT": item.unit, "BATCH": item.batch_number, "RESPONSIBLE": item.responsible,
+    }
+
+def issue_mapping(issue: Issue, item: Optional[Item] = None) -> Dict[str, Any]:
+    """Placeholders of an issue record; BATCH comes from the issued lot when it is known."""
+    return {
+        "ID": issue.issue_id, "SEQ_ID": issue.item_seq_id, "NAME": issue.item_name, "CATEGORY": issue.category,
+        "QTY": issue.qty, "UNIT": issue.unit, "BATCH": item.batch_number if item else "",
+        "RESPONSIBLE": issue.issued_by, "DEPARTMENT": issue.department, "DATE": issue.date, "NEED_ID": issue.need_id,
     }
-    doc = Document(template_path)
-    for p in doc.paragraphs:
-        _replace_in_paragraph(p, mapping)
-    _replace_in_tables(doc, mapping)
-    doc.save(path)
\ No newline at end of file
+
+def export_issue_docx(item: Item, path: str, template_path: str) -> None:
+    data = compile_template(template_path).render(item_mapping(item))
+    with open(path, "wb") as f:
+        f.write(data)
+
+def _render_chunk(template_path: str, mappings: List[Dict[str, Any]], merged: bool) -> List[Any]:
+    # Runs in the pool workers; each compiles the template once and keeps it cached
+    t = compile_template(template_path)
+    return [t.render_body(m) if merged else t.render(m) for m in mappings]
+
+def _rendered(template_path: str, mappings: List[Dict[str, Any]], merged: bool, processes: Optional[int]) -> Iterator[Any]:
+    if processes == 1 or len(mappings) < POOL_MIN:
+        yield from _render_chunk(template_path, mappings, merged)
+        return
+    chunks = [mappings[i:i + POOL_CHUNK] for i in range(0, len(mappings), POOL_CHUNK)]
+    pool = ProcessPoolExecutor(max_workers=processes)
+    try:
+        for rendered in pool.map(_render_chunk, repeat(template_path), chunks, repeat(merged)):
+            yield from rendered
+    finally:
+        # A cancelled batch drops the chunks no worker has started
+        pool.shutdown(cancel_futures=True)
+
+def _reporting(rendered: Iterator[Any], total: int, progress: Optional[Progress]) -> Iterator[Any]:
+    for i, doc in enumerate(rendered, 1):
+        yield doc
+        if progress is not None and (i % POOL_CHUNK == 0 or i == total):
+            progress(i, total)
+
+def export_issues_docx(issues: Iterable[Issue], path: str, template_path: str, merged: bool = False,
+                       find_item: Optional[Callable[[int], Optional[Item]]] = None, processes: Optional[int] = None,
+                       progress: Optional[Progress] = None) -> int:
+    """Issue documents for many issues at once: a ZIP with one DOCX per issue, or with
+    merged=True a single DOCX with a page per issue. Large batches are rendered across a
+    process pool of `processes` workers (CPU count by default). progress(done, total) is
+    called every POOL_CHUNK documents; if it raises, the partial output is removed.
+    Returns the number rendered."""
+    issues = list(issues)
+    mappings = [issue_mapping(r, find_item(r.item_seq_id) if find_item and r.item_seq_id is not None else None)
+                for r in issues]
+    t = compile_template(template_path)  # template errors surface here, before any worker starts
+    rendered = _reporting(_rendered(template_path, mappings, merged, processes), len(mappings), progress)
+    if merged:
+        data = t.render_merged(rendered)
+        with open(path, "wb") as f:
+            f.write(data)
+        return len(issues)
+    try:
+        with zipfile.ZipFile(path, "w", zipfile.ZIP_STORED) as z:
+            for r, doc in zip(issues, rendered):
+                z.writestr(f"issue_{r.issue_id}.docx", doc)
+    except BaseException:
+        if os.path.exists(path):
+            os.remove(path)
+        raise
+    return len(issues)
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+"""Store request history (hot list and archived years) indexed for the history window.
+
+Requests are kept ordered by (created, request_id), so a date range is one slice found
+with bisect. Department and status map to ascending position lists, and the item names
+(resolved from the plan once, when the index is built) are matched through a
+SearchIndex over the distinct names. A query returns matching positions newest first;
+the window reads them a page at a time.
+"""
+from __future__ import annotations
+from bisect import bisect_left, bisect_right
+from typing import Any, Callable, Dict, Iterable, List, Optional
+from search import SearchIndex
+
+PAGE_SIZE = 500
+
+class HistoryIndex:
+    def __init__(self, rows: Iterable[Dict[str, Any]], resolve_name: Callable[[Dict[str, Any]], str]):
+        entries = sorted(((str(r.get("created") or ""), int(r.get("request_id") or 0), r) for r in rows),
+                         key=lambda e: (e[0], e[1]))
+        self.rows: List[Dict[str, Any]] = [e[2] for e in entries]
+        self.names: List[str] = [str(resolve_name(r) or "") for r in self.rows]
+        self._dates = [e[0] for e in entries]
+        self._depts = [r.get("department") for r in self.rows]
+        self._statuses = [r.get("status") for r in self.rows]
+        self._by_dept: Dict[Any, List[int]] = {}
+        self._by_status: Dict[Any, List[int]] = {}
+        self._by_name: Dict[str, List[int]] = {}
+        for pos, r in enumerate(self.rows):
+            self._by_dept.setdefault(self._depts[pos], []).append(pos)
+            self._by_status.setdefault(self._statuses[pos], []).append(pos)
+            self._by_name.setdefault(self.names[pos], []).append(pos)
+        self._text = SearchIndex()
+        self._text.set_many((n, n) for n in self._by_name)
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def query(self, department: Optional[str] = None, status: Optional[str] = None, text: str = "",
+              date_from: Optional[str] = None, date_to: Optional[str] = None) -> List[int]:
+        """Positions of the requests passing every given filter, newest first. Dates are
+        YYYY-MM-DD and both ends are inclusive; text matches the item name anywhere,
+        case-insensitively."""
+        lo = bisect_left(self._dates, date_from) if date_from else 0
+        hi = bisect_right(self._dates, date_to + "\uffff") if date_to else len(self._dates)
+        if lo >= hi:
+            return []
+        # Start from the shortest candidate list; only the other filters are checked per row
+        sources: Dict[str, List[int]] = {}
+        if department:
+            sources["department"] = self._slice(self._by_dept.get(department, []), lo, hi)
+        if status:
+            sources["status"] = self._slice(self._by_status.get(status, []), lo, hi)
+        names = None
+        q = text.strip().lower()
+        if q:
+            names = self._text.search(q)
+            if sum(len(self._by_name[n]) for n in names) < min(map(len, sources.values()), default=hi - lo):
+                sources["text"] = self._slice(sorted(p for n in names for p in self._by_name[n]), lo, hi)
+        used = min(sources, key=lambda k: len(sources[k])) if sources else None
+        found = list(sources[used]) if used else list(range(lo, hi))
+        if department and used != "department":
+            depts = self._depts
+            found = [p for p in found if depts[p] == department]
+        if status and used != "status":
+            statuses = self._statuses
+            found = [p for p in found if statuses[p] == status]
+        if names is not None and used != "text":
+            found = [p for p in found if self.names[p] in names]
+        found.reverse()
+        return found
+
+    @staticmethod
+    def _slice(positions: List[int], lo: int, hi: int) -> List[int]:
+        return positions[bisect_left(positions, lo):bisect_left(positions, hi)]
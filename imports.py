@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+"""Bulk import of stock lots from Excel/CSV, in the column layout of the stock report.
+
+Columns are recognised by their report titles (exports.STOCK_COLUMNS) or field names.
+An xlsx file may hold one sheet per category as the report does; a sheet without a
+category column takes the category from its name. Validation runs column-wise over the
+whole table, and rows with errors are reported by file row instead of stopping the import.
+"""
+from __future__ import annotations
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Tuple
+import pandas as pd
+from constants import CATEGORIES, UNITS, REAGENT_TYPES, REAGENT_QUALIFICATIONS
+from exports import STOCK_COLUMNS, OPTIONAL_FIELDS
+from models import Item, ITEM_FIELDS
+
+DATE_FIELDS = ["expiry_date", "date_received", "manufacture_date"]
+REQUIRED_FIELDS = ["name", "category", "quantity", "unit"]
+DEDUPE_KEY = ["category", "name", "batch_number"]
+# field -> allowed values; empty cells pass for the optional ones
+CHOICES = {"category": CATEGORIES, "unit": UNITS, "qualification": REAGENT_QUALIFICATIONS, "reagent_type": REAGENT_TYPES}
+
+_HEADERS = {**{f: f for f in ITEM_FIELDS}, **{title.lower(): f for f, title in STOCK_COLUMNS}}
+
+@dataclass
+class ImportResult:
+    records: List[Dict[str, Any]] = field(default_factory=list)
+    # (sheet, file row, message); row 2 is the first row under the header
+    errors: List[Tuple[str, int, str]] = field(default_factory=list)
+    total: int = 0
+
+def _read_csv(path: Path) -> pd.DataFrame:
+    with open(path, encoding="utf-8-sig") as f:
+        first = f.readline()
+    sep = ";" if first.count(";") > first.count(",") else ","
+    return pd.read_csv(path, sep=sep, dtype=str, keep_default_na=False, encoding="utf-8-sig")
+
+def read_table(path: str) -> pd.DataFrame:
+    """All rows of the file with item field names as columns plus _sheet and _row."""
+    path = Path(path)
+    if path.suffix.lower() == ".csv":
+        sheets = {path.stem: _read_csv(path)}
+    else:
+        sheets = pd.read_excel(path, sheet_name=None, dtype=object)
+    frames = []
+    for name, df in sheets.items():
+        df = df.rename(columns=lambda c: _HEADERS.get(str(c).strip().lower(), str(c).strip()))
+        df = df.loc[:, ~df.columns.duplicated()]
+        if "category" not in df.columns and name in CATEGORIES:
+            df["category"] = name
+        df["_sheet"] = name
+        df["_row"] = range(2, len(df) + 2)
+        frames.append(df)
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=["_sheet", "_row"])
+
+def _text(col: pd.Series) -> pd.Series:
+    # Cells as stripped strings, "" for blanks; whole numbers read from Excel lose their ".0"
+    out = col.astype(object).where(col.notna(), "")
+    whole = out.map(lambda v: isinstance(v, float) and v.is_integer())
+    if whole.any():
+        out = out.where(~whole, out[whole].map(lambda v: str(int(v))))
+    return out.astype(str).str.strip()
+
+def _dates(col: pd.Series) -> Tuple[pd.Series, pd.Series]:
+    """(YYYY-MM-DD strings or "", mask of cells that are not dates). Accepts ISO and
+    DD.MM.YYYY text as well as cells Excel stored as dates."""
+    stamps = col.map(lambda v: v.strftime("%Y-%m-%d") if hasattr(v, "strftime") else v)
+    text = _text(stamps)
+    parsed = pd.to_datetime(text, format="%Y-%m-%d", errors="coerce")
+    rest = parsed.isna() & (text != "")
+    if rest.any():
+        parsed[rest] = pd.to_datetime(text[rest], format="%d.%m.%Y", errors="coerce")
+    bad = parsed.isna() & (text != "")
+    return parsed.dt.strftime("%Y-%m-%d").where(parsed.notna(), ""), bad
+
+def validate(df: pd.DataFrame, existing: Dict[Tuple[str, str, str], int]) -> ImportResult:
+    """Check every row; `existing` maps (category, name, batch_number) of the lots already
+    in stock to their seq_id. Valid rows come back as item dicts without seq_id."""
+    result = ImportResult(total=len(df))
+    if df.empty:
+        return result
+    titles = dict(STOCK_COLUMNS)
+    missing = [f for f in REQUIRED_FIELDS if f not in df.columns and f != "category"]
+    if missing:
+        result.errors.append(("", 1, "Нет столбцов: " + ", ".join(titles[f] for f in missing)))
+        return result
+    cols: Dict[str, pd.Series] = {}
+    for f in ITEM_FIELDS:
+        if f == "seq_id":
+            continue
+        cols[f] = _text(df[f]) if f in df.columns else pd.Series("", index=df.index)
+    problems: List[Tuple[pd.Series, Any]] = []
+    for f in ("name", "category", "unit"):
+        problems.append((cols[f] == "", f"не заполнено поле «{titles[f]}»"))
+    for f, allowed in CHOICES.items():
+        problems.append(((cols[f] != "") & ~cols[f].isin(allowed), lambda i, f=f: f"недопустимое значение «{cols[f][i]}» в поле «{titles[f]}»"))
+    qty = pd.to_numeric(cols["quantity"].str.replace(",", ".", regex=False).str.replace(" ", "", regex=False), errors="coerce")
+    problems.append((qty.isna() | (qty < 0), lambda i: f"количество «{cols['quantity'][i]}» не является неотрицательным числом"))
+    for f in DATE_FIELDS:
+        raw = df[f] if f in df.columns else pd.Series("", index=df.index)
+        cols[f], bad = _dates(raw)
+        problems.append((bad, lambda i, f=f, raw=raw: f"дата «{raw[i]}» в поле «{titles[f]}» не распознана (ГГГГ-ММ-ДД или ДД.ММ.ГГГГ)"))
+    keys = pd.DataFrame({k: cols[k] for k in DEDUPE_KEY})
+    repeated = keys.duplicated(keep="first")
+    first_row = df["_row"].groupby([keys[k] for k in DEDUPE_KEY], sort=False).transform("first")
+    problems.append((repeated, lambda i: f"повтор строки {first_row[i]} (категория, наименование, партия)"))
+    key_tuples = pd.Series(list(zip(*(keys[k] for k in DEDUPE_KEY))), index=df.index)
+    in_stock = key_tuples.isin(existing.keys()) if existing else pd.Series(False, index=df.index)
+    problems.append((in_stock, lambda i: f"партия уже есть на складе (ID {existing[key_tuples[i]]})"))
+
+    bad_any = pd.Series(False, index=df.index)
+    messages: Dict[Any, List[str]] = {}
+    for mask, msg in problems:
+        mask = mask.fillna(False).astype(bool)
+        bad_any |= mask
+        for i in mask.index[mask]:
+            messages.setdefault(i, []).append(msg(i) if callable(msg) else msg)
+    sheets, rows = df["_sheet"], df["_row"]
+    for i in sorted(messages, key=lambda i: (str(sheets[i]), int(rows[i]))):
+        result.errors.append((str(sheets[i]), int(rows[i]), "; ".join(messages[i])))
+
+    good = ~bad_any
+    out = pd.DataFrame({f: cols[f][good] for f in cols}).astype(object)
+    out["quantity"] = qty[good].astype(float)
+    for f in OPTIONAL_FIELDS:
+        out[f] = out[f].where(out[f] != "", None)
+    result.records = out.to_dict("records")
+    return result
+
+def read_stock(path: str, existing: Dict[Tuple[str, str, str], int]) -> ImportResult:
+    return validate(read_table(path), existing)
+
+def stock_keys(items: Iterable[Item]) -> Dict[Tuple[str, str, str], int]:
+    return {(it.category, it.name, it.batch_number or ""): it.seq_id for it in items}
@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+"""Background jobs (exports) run one after another on a worker thread.
+
+A job function gets a progress(done, total) callback; calling it also checks for
+cancellation and raises JobCancelled, so a job stops at its next progress report. The
+UI thread picks up state changes with poll() (from root.after) and never blocks.
+"""
+from __future__ import annotations
+import itertools, queue, threading
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+QUEUED, RUNNING, DONE, FAILED, CANCELLED = "queued", "running", "done", "failed", "cancelled"
+
+class JobCancelled(Exception):
+    pass
+
+@dataclass(eq=False)
+class Job:
+    id: int
+    title: str
+    fn: Callable[[Callable[[int, int], None]], Any]
+    state: str = QUEUED
+    done: int = 0
+    total: int = 0
+    result: Any = None
+    error: Optional[BaseException] = None
+    _cancel: threading.Event = field(default_factory=threading.Event, repr=False)
+
+    @property
+    def finished(self) -> bool:
+        return self.state in (DONE, FAILED, CANCELLED)
+
+    @property
+    def fraction(self) -> float:
+        return self.done / self.total if self.total else 0.0
+
+class JobRunner:
+    def __init__(self):
+        self._queue: "queue.Queue[Optional[Job]]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._jobs: Dict[int, Job] = {}
+        self._changed: Dict[int, Job] = {}
+        self._ids = itertools.count(1)
+        self._thread = threading.Thread(target=self._run, name="jobs", daemon=True)
+        self._thread.start()
+
+    def submit(self, title: str, fn: Callable[[Callable[[int, int], None]], Any]) -> Job:
+        job = Job(next(self._ids), title, fn)
+        with self._lock:
+            self._jobs[job.id] = job; self._changed[job.id] = job
+        self._queue.put(job)
+        return job
+
+    def cancel(self, job: Job) -> None:
+        job._cancel.set()
+        with self._lock:
+            if job.state == QUEUED:
+                # Never started: the worker skips it
+                job.state = CANCELLED; self._changed[job.id] = job
+
+    def cancel_all(self) -> None:
+        for job in self.active():
+            self.cancel(job)
+
+    def active(self) -> List[Job]:
+        """Queued and running jobs in submission order."""
+        with self._lock:
+            return [j for j in self._jobs.values() if not j.finished]
+
+    def poll(self) -> List[Job]:
+        """Jobs whose state or progress changed since the last call; finished ones are
+        reported once and then forgotten."""
+        with self._lock:
+            changed, self._changed = list(self._changed.values()), {}
+            for j in changed:
+                if j.finished:
+                    self._jobs.pop(j.id, None)
+        return changed
+
+    def close(self, timeout: float = None) -> bool:
+        self.cancel_all()
+        self._queue.put(None)
+        self._thread.join(timeout)
+        return not self._thread.is_alive()
+
+    def _progress(self, job: Job) -> Callable[[int, int], None]:
+        def report(done: int, total: int) -> None:
+            if job._cancel.is_set():
+                raise JobCancelled()
+            with self._lock:
+                job.done, job.total = done, total
+                self._changed[job.id] = job
+        return report
+
+    def _run(self) -> None:
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+            with self._lock:
+                if job.state != QUEUED:
+                    continue
+                job.state = RUNNING; self._changed[job.id] = job
+            try:
+                result = job.fn(self._progress(job))
+            except JobCancelled:
+                state, result, error = CANCELLED, None, None
+            except Exception as e:
+                state, result, error = FAILED, None, e
+            else:
+                state, error = DONE, None
+            with self._lock:
+                job.state, job.result, job.error = state, result, error
+                self._changed[job.id] = job
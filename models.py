@@ -1,9 +1,19 @@
 # -*- coding: utf-8 -*-
 from __future__ import annotations
-from dataclasses import dataclass, asdict
-from typing import Optional, Dict, Any
+import sys
+from array import array
+from dataclasses import dataclass, fields
+from collections.abc import Mapping, MutableMapping
+from itertools import islice
+from operator import attrgetter
+from typing import Optional, Dict, Any, List, Iterable, Iterator, Tuple, Callable
+try:
+    import numpy as np
+except ImportError:
+    np = None
+from constants import CATEGORIES, UNITS, REAGENT_TYPES, REAGENT_QUALIFICATIONS
 
-@dataclass
+@dataclass(slots=True)
 class Item:
     seq_id: int
     name: str
@@ -24,17 +34,398 @@ class Item:
     manufacturer: Optional[str] = None
     storage_conditions: Optional[str] = None
 
+    # to_dict / from_dict are generated below by _compile_codec
+
+ITEM_DEFAULTS: Dict[str, Any] = dict(
+    packaging="",
+    expiry_date=None, date_received=None, batch_number="", responsible="",
+    qualification=None, reagent_type=None,
+    state_register_no=None, certified_value=None, manufacture_date=None,
+    manufacturer=None, storage_conditions=None
+)
+
+def _compile_codec(cls, defaults: Dict[str, Any]) -> None:
+    """Attach to_dict/from_dict specialized for the fields of dataclass `cls`.
+
+    The generated code reads and writes every field by name in one pass: no recursive
+    copy as in dataclasses.asdict, no defaults dict merged per row. Missing keys take
+    `defaults`; a missing field without a default raises KeyError. Keys that are not
+    fields are ignored.
+    """
+    names = [f.name for f in fields(cls)]
+    ns: Dict[str, Any] = {"cls": cls}
+    args = []
+    for n in names:
+        if n in defaults:
+            ns[f"_d_{n}"] = defaults[n]
+            args.append(f"get({n!r}, _d_{n})")
+        else:
+            args.append(f"d[{n!r}]")
+    src = ("def to_dict(self):\n"
+           "    return {" + ", ".join(f"{n!r}: self.{n}" for n in names) + "}\n"
+           "def from_dict(d):\n"
+           "    get = d.get\n"
+           "    return cls(" + ", ".join(args) + ")\n")
+    exec(compile(src, f"<{cls.__name__} codec>", "exec"), ns)
+    cls.to_dict = ns["to_dict"]
+    cls.from_dict = staticmethod(ns["from_dict"])
+
+_compile_codec(Item, ITEM_DEFAULTS)
+
+ITEM_FIELDS = [f.name for f in fields(Item)]
+
+# ---- needs.json records ----
+def _int(v: Any) -> Any:
+    try:
+        return None if v is None else int(v)
+    except (TypeError, ValueError):
+        return v
+
+def _float(v: Any) -> Any:
+    try:
+        return None if v is None else float(v)
+    except (TypeError, ValueError):
+        return v
+
+class Record(MutableMapping):
+    """Slotted, typed record of needs.json that still behaves like the dict it replaces.
+
+    Subclasses list their fields in SCHEMA as (name, coerce, default). from_dict coerces
+    every value once, so ids are ints and quantities floats afterwards; fields can be read
+    as attributes or with the dict API. Keys outside the schema are kept in `extra`, and
+    to_dict gives back the JSON shape: schema fields first, then the extra keys.
+    """
+
+    __slots__ = ("extra",)
+    SCHEMA: Tuple[Tuple[str, Optional[Callable[[Any], Any]], Any], ...] = ()
+    FIELDS: Tuple[str, ...] = ()
+
+    def __init_subclass__(cls, **kw):
+        super().__init_subclass__(**kw)
+        cls.FIELDS = tuple(name for name, _, _ in cls.SCHEMA)
+        cls._field_set = frozenset(cls.FIELDS)
+        cls._coerce = {name: conv for name, conv, _ in cls.SCHEMA if conv}
+        cls._values = attrgetter(*cls.FIELDS)
+
+    @classmethod
+    def from_dict(cls, d: Mapping[str, Any]) -> "Record":
+        if type(d) is cls:
+            return d
+        obj = cls.__new__(cls)
+        get = d.get
+        for name, conv, default in cls.SCHEMA:
+            v = get(name, default)
+            setattr(obj, name, conv(v) if conv is not None and v is not None else v)
+        extra = d.keys() - cls._field_set
+        obj.extra = {k: d[k] for k in extra} if extra else None
+        return obj
+
+    def to_dict(self) -> Dict[str, Any]:
+        d = dict(zip(self.FIELDS, self._values(self)))
+        if self.extra:
+            d.update(self.extra)
+        return d
+
+    # dict API
+    def get(self, key: str, default: Any = None) -> Any:
+        if key in self._field_set:
+            return getattr(self, key)
+        return self.extra.get(key, default) if self.extra else default
+
+    def __getitem__(self, key: str) -> Any:
+        if key in self._field_set:
+            return getattr(self, key)
+        if self.extra and key in self.extra:
+            return self.extra[key]
+        raise KeyError(key)
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        if key in self._field_set:
+            conv = self._coerce.get(key)
+            setattr(self, key, conv(value) if conv is not None and value is not None else value)
+        else:
+            if self.extra is None:
+                self.extra = {}
+            self.extra[key] = value
+
+    def __delitem__(self, key: str) -> None:
+        if key in self._field_set:
+            setattr(self, key, None)
+        elif self.extra and key in self.extra:
+            del self.extra[key]
+        else:
+            raise KeyError(key)
+
+    def __iter__(self) -> Iterator[str]:
+        yield from self.FIELDS
+        if self.extra:
+            yield from self.extra
+
+    def __len__(self) -> int:
+        return len(self.FIELDS) + (len(self.extra) if self.extra else 0)
+
+    def __contains__(self, key: object) -> bool:
+        return key in self._field_set or bool(self.extra and key in self.extra)
+
+    def __eq__(self, other: Any) -> bool:
+        if type(other) is type(self):
+            return self._values(self) == other._values(other) and (self.extra or None) == (other.extra or None)
+        if isinstance(other, Mapping):
+            return self.to_dict() == dict(other)
+        return NotImplemented
+
+    __hash__ = None
+
+    def __copy__(self) -> "Record":
+        obj = self.__class__.__new__(self.__class__)
+        for name, v in zip(self.FIELDS, self._values(self)):
+            setattr(obj, name, v)
+        obj.extra = dict(self.extra) if self.extra else None
+        return obj
+
+    def __reduce__(self):
+        return (self.__class__.from_dict, (self.to_dict(),))
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}({self.to_dict()!r})"
+
+class Need(Record):
+    __slots__ = ("need_id", "category", "item_name", "plan_qty", "remaining_qty", "unit", "qualification",
+                 "state_register_no", "cylinder_volume", "certified_value", "purpose", "status", "approved_by_qa", "created")
+    SCHEMA = (
+        ("need_id", _int, None), ("category", None, None), ("item_name", None, None),
+        ("plan_qty", _float, 0.0), ("remaining_qty", _float, 0.0), ("unit", None, None),
+        ("qualification", None, None), ("state_register_no", None, None), ("cylinder_volume", None, None),
+        ("certified_value", None, None), ("purpose", None, None), ("status", None, None),
+        ("approved_by_qa", None, False), ("created", None, None),
+    )
+
+class QARequest(Record):
+    __slots__ = ("request_id", "department", "need_id", "category", "item_name", "requested_qty", "excess_qty",
+                 "unit", "status", "created")
+    SCHEMA = (
+        ("request_id", _int, None), ("department", None, None), ("need_id", _int, None),
+        ("category", None, None), ("item_name", None, None), ("requested_qty", _float, 0.0),
+        ("excess_qty", _float, 0.0), ("unit", None, None), ("status", None, None), ("created", None, None),
+    )
+
+class StoreRequest(Record):
+    __slots__ = ("request_id", "department", "need_id", "requested_qty", "unit", "status", "created", "requested_by")
+    SCHEMA = (
+        ("request_id", _int, None), ("department", None, None), ("need_id", _int, None),
+        ("requested_qty", _float, 0.0), ("unit", None, None), ("status", None, None),
+        ("created", None, None), ("requested_by", None, None),
+    )
+
+class Issue(Record):
+    __slots__ = ("issue_id", "department", "need_id", "item_seq_id", "item_name", "category", "qty", "unit", "date", "issued_by")
+    SCHEMA = (
+        ("issue_id", _int, None), ("department", None, None), ("need_id", _int, None),
+        ("item_seq_id", _int, None), ("item_name", None, None), ("category", None, None),
+        ("qty", _float, 0.0), ("unit", None, None), ("date", None, None), ("issued_by", None, None),
+    )
+
+# needs.json list -> record type
+LIST_MODELS = {"qa_overflow_requests": QARequest, "store_requests": StoreRequest, "issues": Issue}
+
+def coerce_needs(data: Dict[str, Any]) -> Dict[str, Any]:
+    """Turn the dict records of a loaded needs structure into typed records, in place.
+    History lists still undecoded (snapshot.LazySection) coerce their rows when decoded."""
+    for dep, lst in data.get("departments", {}).items():
+        data["departments"][dep] = [Need.from_dict(n) for n in lst]
+    for key, model in LIST_MODELS.items():
+        lst = data.get(key)
+        if lst is None:
+            continue
+        if getattr(lst, "loaded", True):
+            data[key] = [model.from_dict(r) for r in lst]
+        else:
+            lst.row_factory = model.from_dict
+    return data
+
+class StringPool:
+    """Dictionary encoding of a string column: code 0 is None, equal strings share one code."""
+
+    __slots__ = ("values", "codes")
+
+    def __init__(self, seed: Iterable[str] = ()):
+        self.values: List[Optional[str]] = [None]
+        self.codes: Dict[Optional[str], int] = {None: 0}
+        for s in seed:
+            self.code(s)
+
+    def code(self, value: Optional[str]) -> int:
+        c = self.codes.get(value)
+        if c is None:
+            c = self.codes[value] = len(self.values)
+            self.values.append(value)
+        return c
+
+class ItemView:
+    """A row of an ItemTable that reads and writes the table's columns like an Item."""
+
+    __slots__ = ("_table", "_row")
+
+    def __init__(self, table: "ItemTable", row: int):
+        object.__setattr__(self, "_table", table); object.__setattr__(self, "_row", row)
+
+    def __getattr__(self, name: str) -> Any:
+        if name not in ItemTable.COLUMNS:
+            raise AttributeError(name)
+        return self._table.get(self._row, name)
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        if name not in ItemTable.COLUMNS:
+            raise AttributeError(name)
+        self._table.set(self._row, name, value)
+
+    def __eq__(self, other: Any) -> bool:
+        if isinstance(other, (Item, ItemView)):
+            return all(getattr(self, f) == getattr(other, f) for f in ITEM_FIELDS)
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        return f"ItemView({self.to_item()!r})"
+
+    def to_item(self) -> Item:
+        return self._table.item(self._row)
+
     def to_dict(self) -> Dict[str, Any]:
-        return asdict(self)
-
-    @staticmethod
-    def from_dict(d: Dict[str, Any]) -> "Item":
-        defaults = dict(
-            packaging="",
-            expiry_date=None, date_received=None, batch_number="", responsible="",
-            qualification=None, reagent_type=None,
-            state_register_no=None, certified_value=None, manufacture_date=None,
-            manufacturer=None, storage_conditions=None
-        )
-        payload = {**defaults, **d}
-        return Item(**payload)
\ No newline at end of file
+        return {f: self._table.get(self._row, f) for f in ITEM_FIELDS}
+
+class ItemTable:
+    """Column store for large stock tables, such as the snapshot an export job works on.
+
+    Ids and quantities live in typed arrays. Low-cardinality strings (POOLED: category,
+    unit, place, dates, ...) are dictionary encoded into arrays of four-byte codes;
+    pools for the fields with a fixed vocabulary are seeded from the constants, which
+    keeps their codes equal across tables. Names, batch numbers and the other mostly
+    unique strings stay plain lists of references, where a pool would only add its own
+    entry per row. where() compares codes instead of strings, with numpy when it is
+    installed.
+    """
+
+    NUMERIC = {"seq_id": "q", "quantity": "d"}
+    POOLED = ("category", "unit", "storage_place", "packaging", "expiry_date", "date_received", "responsible",
+              "qualification", "reagent_type", "manufacture_date", "manufacturer", "storage_conditions")
+    SEEDS = {"category": CATEGORIES, "unit": UNITS, "reagent_type": REAGENT_TYPES, "qualification": REAGENT_QUALIFICATIONS}
+    COLUMNS = frozenset(ITEM_FIELDS)
+    # Rows are read in chunks of this many, so a bulk load holds few row tuples at a time
+    CHUNK = 4096
+
+    def __init__(self, items: Iterable[Any] = ()):
+        self.pools: Dict[str, StringPool] = {}
+        self.columns: Dict[str, Any] = {}
+        for f in ITEM_FIELDS:
+            if f in self.NUMERIC:
+                self.columns[f] = array(self.NUMERIC[f])
+            elif f in self.POOLED:
+                self.pools[f] = StringPool(self.SEEDS.get(f, ()))
+                self.columns[f] = array("I")
+            else:
+                self.columns[f] = []
+        self.extend(items)
+
+    @classmethod
+    def from_dicts(cls, rows: Iterable[Dict[str, Any]]) -> "ItemTable":
+        # Same defaults as Item.from_dict, without building Item objects
+        table = cls()
+        table._extend_rows(tuple(d.get(f) for f in ITEM_FIELDS) for d in rows)
+        return table
+
+    def append(self, item: Any) -> None:
+        self.extend((item,))
+
+    def extend(self, items: Iterable[Any]) -> None:
+        self._extend_rows(map(_ITEM_ROW, items))
+
+    def _extend_rows(self, rows: Iterator[Tuple[Any, ...]]) -> None:
+        rows = iter(rows)
+        while True:
+            chunk = list(islice(rows, self.CHUNK))
+            if not chunk:
+                return
+            for i, (f, values) in enumerate(zip(ITEM_FIELDS, zip(*chunk))):
+                col = self.columns[f]
+                if f in self.NUMERIC:
+                    col.extend(v or 0 for v in values)
+                    continue
+                if ITEM_DEFAULTS.get(f) == "":
+                    values = ["" if v is None else v for v in values]
+                if f in self.pools:
+                    codes, code = self.pools[f].codes, self.pools[f].code
+                    col.extend(codes[v] if v in codes else code(v) for v in values)
+                else:
+                    col.extend(values)
+
+    def __len__(self) -> int:
+        return len(self.columns["seq_id"])
+
+    def __getitem__(self, row: int) -> ItemView:
+        if row < 0:
+            row += len(self)
+        if not 0 <= row < len(self):
+            raise IndexError(row)
+        return ItemView(self, row)
+
+    def __iter__(self) -> Iterator[ItemView]:
+        return (ItemView(self, i) for i in range(len(self)))
+
+    def __delitem__(self, row: int) -> None:
+        for col in self.columns.values():
+            del col[row]
+
+    def get(self, row: int, field: str) -> Any:
+        v = self.columns[field][row]
+        pool = self.pools.get(field)
+        return v if pool is None else pool.values[v]
+
+    def set(self, row: int, field: str, value: Any) -> None:
+        pool = self.pools.get(field)
+        self.columns[field][row] = value if pool is None else pool.code(value)
+
+    def item(self, row: int) -> Item:
+        return Item(*(self.get(row, f) for f in ITEM_FIELDS))
+
+    def _decoded(self, field: str) -> List[Any]:
+        col, pool = self.columns[field], self.pools.get(field)
+        return list(col) if pool is None else [pool.values[c] for c in col]
+
+    def to_items(self) -> List[Item]:
+        return [Item(*row) for row in zip(*(self._decoded(f) for f in ITEM_FIELDS))]
+
+    def to_dicts(self) -> List[Dict[str, Any]]:
+        return [dict(zip(ITEM_FIELDS, row)) for row in zip(*(self._decoded(f) for f in ITEM_FIELDS))]
+
+    def where(self, **equals: Any) -> List[int]:
+        """Rows whose fields equal all the given values, e.g. where(category="Реактивы", unit="л")."""
+        rows: Any = None
+        for field, value in equals.items():
+            col = self.columns[field]
+            if field in self.pools:
+                value = self.pools[field].codes.get(value)
+                if value is None:
+                    return []
+            if np is not None:
+                values = np.frombuffer(col, dtype=col.typecode) if isinstance(col, array) else np.array(col, dtype=object)
+                hit = values == value
+                rows = hit if rows is None else rows & hit
+            elif rows is None:
+                rows = [i for i, c in enumerate(col) if c == value]
+            else:
+                rows = [i for i in rows if col[i] == value]
+        if rows is None:
+            return list(range(len(self)))
+        return np.flatnonzero(rows).tolist() if np is not None else rows
+
+    def nbytes(self) -> int:
+        """Size of the columns; pooled strings are counted once each, plain ones per row."""
+        size = 0
+        for f, col in self.columns.items():
+            if isinstance(col, array):
+                size += col.itemsize * len(col)
+            else:
+                size += sys.getsizeof(col) + sum(sys.getsizeof(s) for s in col if s is not None)
+        return size + sum(sys.getsizeof(s) for p in self.pools.values() for s in p.values if s is not None)
+
+_ITEM_ROW = attrgetter(*ITEM_FIELDS)
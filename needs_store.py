@@ -0,0 +1,356 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+from typing import List, Dict, Any, Optional, Tuple
+from models import Item, Need, QARequest, StoreRequest, Issue, LIST_MODELS
+from storage import NEEDS_LISTS, DEP_PREFIX
+from sync import REFERENCES, REFERRING_SECTIONS
+from expiry import ExpiryIndex
+from search import NameIndex
+
+class NeedsStore:
+    """Hash indexes over the load_needs() structure and the items list.
+
+    The wrapped dict and list keep their original shape (save_needs/save_items take them
+    unchanged); every mutation has to go through the store so the indexes stay in sync.
+    Records handed in as plain dicts are converted to the typed models (Need, QARequest, ...).
+    Id counters are running maxima, so a deleted record's id is never handed out again;
+    id_floor raises them above ids kept elsewhere (e.g. archive.max_ids()).
+    Records are found in their lists by identity, through positions kept per list
+    (_locate), never by comparing them field by field.
+    """
+
+    def __init__(self, needs: Dict[str, Any], items: List[Item], id_floor: Optional[Dict[str, int]] = None):
+        self.data = needs
+        self.items = items
+        self.id_floor = dict(id_floor or {})
+        self.reindex()
+
+    def reindex(self) -> None:
+        # list name ("items", "dep:<department>", history kind) -> id(record) -> position
+        self._positions: Dict[str, Dict[int, int]] = {}
+        self._needs: Dict[Tuple[str, int], Need] = {}
+        # Item names of stock lots and plan positions, for the name suggestions
+        self.names = NameIndex()
+        for dep, lst in self.data.setdefault("departments", {}).items():
+            for n in lst:
+                self._needs[(dep, n.need_id)] = n
+                self.names.add(n.item_name)
+        self._qa_requests = {r.request_id: r for r in self.data.setdefault("qa_overflow_requests", [])}
+        self._store_requests: Optional[Dict[int, StoreRequest]] = None
+        self._open_indexed = False
+        self._issues: Optional[Dict[int, Issue]] = None
+        self._items_by_seq: Dict[int, Item] = {}
+        self._items_by_name: Dict[Tuple[str, str], List[Item]] = {}
+        for it in self.items:
+            self._index_item(it)
+        self.expiry = ExpiryIndex(self.items)
+        self._max = {
+            "needs": max((k[1] for k in self._needs), default=0),
+            "qa_overflow_requests": max(self._qa_requests, default=0),
+            "store_requests": self._history_max("store_requests", "request_id"),
+            "issues": self._history_max("issues", "issue_id"),
+            "items": max(self._items_by_seq, default=0),
+        }
+        for kind, floor in self.id_floor.items():
+            self._bump(kind, floor)
+
+    # History lists may be lazily decoded snapshot sections; they are indexed on first lookup
+    def _history_max(self, key: str, id_key: str) -> int:
+        lst = self.data.setdefault(key, [])
+        if not getattr(lst, "loaded", True):
+            return lst.max_id
+        return max((r[id_key] for r in lst), default=0)
+
+    def _store_request_index(self, open_only: bool = False) -> Dict[int, StoreRequest]:
+        # open_only indexes just the open requests while the closed history is undecoded
+        if self._store_requests is None or (self._open_indexed and not open_only):
+            lst = self.data["store_requests"]
+            self._open_indexed = open_only and not getattr(lst, "loaded", True)
+            rows = lst.open_rows if self._open_indexed else lst
+            self._store_requests = {r.request_id: r for r in rows}
+        return self._store_requests
+
+    def _issue_index(self) -> Dict[int, Issue]:
+        if self._issues is None:
+            self._issues = {r.issue_id: r for r in self.data["issues"]}
+        return self._issues
+
+    # ---- positions ----
+    def _locate(self, name: str, lst: list, rec: Any) -> int:
+        """Position of `rec` (this very object) in `lst`. A stale position, left by a
+        deletion or a change made outside the store, rebuilds the list's map in one pass."""
+        positions = self._positions.get(name)
+        pos = positions.get(id(rec)) if positions is not None else None
+        if pos is None or pos >= len(lst) or lst[pos] is not rec:
+            positions = self._positions[name] = {id(r): n for n, r in enumerate(lst)}
+            pos = positions.get(id(rec))
+            if pos is None:
+                raise ValueError(f"{name}: record not in list")
+        return pos
+
+    def _swap(self, name: str, lst: list, old: Any, new: Any) -> None:
+        pos = self._locate(name, lst, old)
+        lst[pos] = new
+        positions = self._positions[name]
+        del positions[id(old)]; positions[id(new)] = pos
+
+    def _append(self, name: str, lst: list, rec: Any) -> None:
+        lst.append(rec)
+        positions = self._positions.get(name)
+        if positions is not None:
+            positions[id(rec)] = len(lst) - 1
+
+    def _remove(self, name: str, lst: list, rec: Any) -> None:
+        del lst[self._locate(name, lst, rec)]
+        # Rows after it moved up; the map is rebuilt on the next lookup
+        self._positions.pop(name, None)
+
+    def _index_item(self, it: Item) -> None:
+        self._items_by_seq[it.seq_id] = it
+        self._items_by_name.setdefault((it.category, it.name), []).append(it)
+        self.names.add(it.name)
+
+    def _unindex_item(self, it: Item) -> None:
+        self._items_by_seq.pop(it.seq_id, None)
+        lots = self._items_by_name.get((it.category, it.name), [])
+        pos = next((n for n, x in enumerate(lots) if x is it), None)
+        if pos is not None:
+            del lots[pos]
+            self.names.remove(it.name)
+        if not lots:
+            self._items_by_name.pop((it.category, it.name), None)
+
+    def _bump(self, kind: str, value: int) -> None:
+        if value > self._max[kind]:
+            self._max[kind] = value
+
+    # ---- lookups ----
+    def find_need(self, department: str, need_id: int) -> Optional[Need]:
+        return self._needs.get((department, int(need_id)))
+
+    def find_qa_request(self, request_id: int) -> Optional[QARequest]:
+        return self._qa_requests.get(int(request_id))
+
+    def find_store_request(self, request_id: int) -> Optional[StoreRequest]:
+        req = self._store_request_index(open_only=True).get(int(request_id))
+        if req is None and self._open_indexed:
+            req = self._store_request_index().get(int(request_id))
+        return req
+
+    def pending_store_requests(self) -> List[StoreRequest]:
+        """The requests waiting at the store, without decoding the closed history."""
+        lst = self.data["store_requests"]
+        rows = lst if getattr(lst, "loaded", True) else lst.open_rows
+        return [r for r in rows if r.status == "pending"]
+
+    def find_issue(self, issue_id: int) -> Optional[Issue]:
+        return self._issue_index().get(int(issue_id))
+
+    def find_item(self, seq_id: int) -> Optional[Item]:
+        return self._items_by_seq.get(int(seq_id))
+
+    def find_items(self, category: str, name: str) -> List[Item]:
+        return list(self._items_by_name.get((category, name), []))
+
+    def first_item(self, category: str, name: str) -> Optional[Item]:
+        lots = self._items_by_name.get((category, name))
+        return lots[0] if lots else None
+
+    def record(self, section: str, key: Any) -> Any:
+        """The record stored under `key` of a storage section (see storage.needs_to_sections)."""
+        if section == "items":
+            return self._items_by_seq.get(int(key))
+        if section.startswith(DEP_PREFIX):
+            return self._needs.get((section[len(DEP_PREFIX):], int(key)))
+        if section in NEEDS_LISTS:
+            return self._history_index(section).get(int(key))
+        return self.data.get(key)
+
+    def max_ids(self) -> Dict[str, int]:
+        return dict(self._max)
+
+    # ---- id allocation ----
+    def next_need_id(self) -> int:
+        return self._max["needs"] + 1
+
+    def next_qa_request_id(self) -> int:
+        return self._max["qa_overflow_requests"] + 1
+
+    def next_store_request_id(self) -> int:
+        return self._max["store_requests"] + 1
+
+    def next_issue_id(self) -> int:
+        return self._max["issues"] + 1
+
+    def next_seq_id(self) -> int:
+        return self._max["items"] + 1
+
+    # ---- needs ----
+    def add_need(self, department: str, need: Dict[str, Any]) -> Need:
+        need = Need.from_dict(need)
+        self._append(DEP_PREFIX + department, self.data["departments"].setdefault(department, []), need)
+        self._needs[(department, need.need_id)] = need
+        self.names.add(need.item_name)
+        self._bump("needs", need.need_id)
+        return need
+
+    def replace_need(self, department: str, need: Dict[str, Any]) -> Need:
+        need = Need.from_dict(need)
+        key = (department, need.need_id)
+        old = self._needs[key]
+        self._swap(DEP_PREFIX + department, self.data["departments"][department], old, need)
+        self._needs[key] = need
+        self.names.remove(old.item_name); self.names.add(need.item_name)
+        return need
+
+    def delete_need(self, department: str, need_id: int) -> None:
+        n = self._needs.pop((department, int(need_id)), None)
+        if n is not None:
+            self._remove(DEP_PREFIX + department, self.data["departments"][department], n)
+            self.names.remove(n.item_name)
+
+    # ---- history ----
+    def add_qa_request(self, req: Dict[str, Any]) -> QARequest:
+        req = QARequest.from_dict(req)
+        self._append("qa_overflow_requests", self.data["qa_overflow_requests"], req)
+        self._qa_requests[req.request_id] = req
+        self._bump("qa_overflow_requests", req.request_id)
+        return req
+
+    def add_store_request(self, req: Dict[str, Any]) -> StoreRequest:
+        req = StoreRequest.from_dict(req)
+        self._append("store_requests", self.data["store_requests"], req)
+        if self._store_requests is not None:
+            self._store_requests[req.request_id] = req
+        self._bump("store_requests", req.request_id)
+        return req
+
+    def add_issue(self, issue: Dict[str, Any]) -> Issue:
+        issue = Issue.from_dict(issue)
+        self._append("issues", self.data["issues"], issue)
+        if self._issues is not None:
+            self._issues[issue.issue_id] = issue
+        self._bump("issues", issue.issue_id)
+        return issue
+
+    # ---- items ----
+    def add_item(self, it: Item) -> None:
+        self._append("items", self.items, it)
+        self._index_item(it)
+        self.expiry.add(it)
+        self._bump("items", it.seq_id)
+
+    def add_items(self, items: List[Item]) -> None:
+        for it in items:
+            self._append("items", self.items, it)
+            self._index_item(it)
+            self._bump("items", it.seq_id)
+        self.expiry.add_many(items)
+
+    def replace_item(self, it: Item) -> None:
+        old = self._items_by_seq[it.seq_id]
+        self._swap("items", self.items, old, it)
+        if (old.category, old.name) == (it.category, it.name):
+            lots = self._items_by_name[(it.category, it.name)]
+            lots[next(n for n, x in enumerate(lots) if x is old)] = it
+            self._items_by_seq[it.seq_id] = it
+        else:
+            self._unindex_item(old)
+            self._index_item(it)
+        self.expiry.add(it)
+
+    def delete_item(self, seq_id: int) -> None:
+        it = self._items_by_seq.get(int(seq_id))
+        if it is not None:
+            self._unindex_item(it)
+            self.expiry.discard(it.seq_id)
+            self._remove("items", self.items, it)
+
+    # ---- changes of other workstations (storage.pull_items / pull_needs) ----
+    def apply_changes(self, changes) -> None:
+        for (section, old_id), new_id in changes.renamed.items():
+            self._rekey(section, old_id, new_id)
+        for section, key, rec in changes.records:
+            if section == "items":
+                if rec is None:
+                    self.delete_item(key)
+                elif key in self._items_by_seq:
+                    self.replace_item(rec)
+                else:
+                    self.add_item(rec)
+            elif section.startswith(DEP_PREFIX):
+                dep = section[len(DEP_PREFIX):]
+                if rec is None:
+                    self.delete_need(dep, key)
+                elif (dep, int(key)) in self._needs:
+                    self.replace_need(dep, rec)
+                else:
+                    self.add_need(dep, rec)
+            elif section in NEEDS_LISTS:
+                self._put_history(section, key, rec)
+            elif rec is None:
+                self.data.pop(key, None)
+            else:
+                self.data[key] = rec
+        for kind, lst in changes.lists.items():
+            self.data[kind] = lst
+            self._positions.pop(kind, None)
+            if kind == "store_requests":
+                self._store_requests = None
+            elif kind == "issues":
+                self._issues = None
+            self._bump(kind, self._history_max(kind, NEEDS_LISTS[kind]))
+
+    def _history_index(self, kind: str) -> Dict[int, Any]:
+        if kind == "qa_overflow_requests":
+            return self._qa_requests
+        return self._store_request_index() if kind == "store_requests" else self._issue_index()
+
+    def _put_history(self, kind: str, key: Any, rec: Optional[Dict[str, Any]]) -> None:
+        index = self._history_index(kind); lst = self.data[kind]
+        if rec is not None:
+            rec = LIST_MODELS[kind].from_dict(rec)
+        old = index.pop(int(key), None)
+        if old is not None:
+            if rec is None:
+                self._remove(kind, lst, old)
+            else:
+                self._swap(kind, lst, old, rec)
+        elif rec is not None:
+            self._append(kind, lst, rec)
+        if rec is not None:
+            index[int(key)] = rec
+            self._bump(kind, int(key))
+
+    def _rekey(self, section: str, old_id: Any, new_id: Any) -> None:
+        if section == "items":
+            it = self._items_by_seq.get(int(old_id))
+            if it is not None:
+                self._unindex_item(it); self.expiry.discard(it.seq_id)
+                it.seq_id = new_id; self._index_item(it); self.expiry.add(it)
+                self._bump("items", new_id)
+        elif section.startswith(DEP_PREFIX):
+            dep = section[len(DEP_PREFIX):]
+            n = self._needs.pop((dep, int(old_id)), None)
+            if n is not None:
+                n.need_id = int(new_id); self._needs[(dep, n.need_id)] = n
+                self._bump("needs", int(new_id))
+        elif section in NEEDS_LISTS:
+            index = self._history_index(section)
+            r = index.pop(int(old_id), None)
+            if r is not None:
+                r[NEEDS_LISTS[section]] = new_id; index[int(new_id)] = r
+                self._bump(section, int(new_id))
+        self._rekey_references(section, old_id, new_id)
+
+    def _rekey_references(self, section: str, old_id: Any, new_id: Any) -> None:
+        # Records made here after the renamed one; on an undecoded list they are all open rows
+        for kind in REFERRING_SECTIONS:
+            lst = self.data.get(kind) or []
+            for r in (lst if getattr(lst, "loaded", True) else lst.open_rows):
+                for f, target in REFERENCES.items():
+                    if r.get(f) == old_id and target(r) == section:
+                        r[f] = new_id
+
+    def to_dict(self) -> Dict[str, Any]:
+        return self.data
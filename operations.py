@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+"""Domain mutations shared by the Tk client and the API server (server.py).
+
+Every operation works on a NeedsStore and returns an OpResult naming the records it
+wrote as (section, key) pairs, sections as in storage.needs_to_sections ("items" for
+stock rows). The caller persists the stores those sections belong to.
+"""
+from __future__ import annotations
+from dataclasses import dataclass, field
+from datetime import date
+from typing import List, Dict, Any, Tuple, Set
+from models import Item
+from needs_store import NeedsStore
+from storage import DEP_PREFIX
+
+ISSUE_DONE = "Выдача выполнена"
+
+@dataclass
+class OpResult:
+    message: str = ""
+    touched: List[Tuple[str, Any]] = field(default_factory=list)
+    ok: bool = True
+
+    @property
+    def stores(self) -> Set[str]:
+        return {"items" if s == "items" else "needs" for s, _ in self.touched}
+
+def _today() -> str:
+    return date.today().strftime("%Y-%m-%d")
+
+def add_item(store: NeedsStore, payload: Dict[str, Any], user: str = "") -> OpResult:
+    payload = dict(payload)
+    if not payload.get("responsible"):
+        payload["responsible"] = user
+    payload["seq_id"] = store.next_seq_id()
+    it = Item.from_dict(payload)
+    store.add_item(it)
+    return OpResult(touched=[("items", it.seq_id)])
+
+def import_items(store: NeedsStore, records: List[Dict[str, Any]], user: str = "") -> OpResult:
+    """Add validated rows (imports.validate) as new lots with one block of seq_ids. Lots
+    that reached the stock after validation, same (category, name, batch), are skipped."""
+    taken = {(it.category, it.name, it.batch_number or "") for it in store.items}
+    start = store.next_seq_id(); items: List[Item] = []
+    for r in records:
+        key = (r.get("category"), r.get("name"), r.get("batch_number") or "")
+        if key in taken:
+            continue
+        taken.add(key)
+        it = Item.from_dict({**r, "seq_id": start + len(items), "responsible": r.get("responsible") or user})
+        items.append(it)
+    store.add_items(items)
+    skipped = len(records) - len(items)
+    message = f"Импортировано позиций: {len(items)}" + (f", пропущено уже имеющихся: {skipped}" if skipped else "")
+    return OpResult(message, [("items", it.seq_id) for it in items])
+
+def add_need(store: NeedsStore, department: str, payload: Dict[str, Any]) -> OpResult:
+    payload["need_id"] = store.next_need_id()
+    payload["remaining_qty"] = payload["plan_qty"]
+    payload["status"] = "planned"
+    payload["approved_by_qa"] = False
+    payload["created"] = _today()
+    need = store.add_need(department, payload)
+    return OpResult(touched=[(DEP_PREFIX + department, need.need_id)])
+
+def issue(store: NeedsStore, department: str, need_id: int, qty: float, user: str = "") -> OpResult:
+    # Process issuing an item against a department's plan
+    n = store.find_need(department, need_id)
+    if not n:
+        return OpResult("План не найден", ok=False)
+    category = n.category; item_name = n.item_name; unit = n.unit
+    it = store.first_item(category, item_name)
+    if not it:
+        return OpResult("Позиция не найдена на складе", ok=False)
+    if qty > it.quantity:
+        return OpResult("Недостаточно остатка на складе", ok=False)
+    if qty > n.remaining_qty:
+        extra = qty - n.remaining_qty
+        rid = store.next_qa_request_id()
+        store.add_qa_request({
+            "request_id": rid, "department": department, "need_id": need_id,
+            "category": category, "item_name": item_name, "requested_qty": qty, "excess_qty": extra,
+            "unit": unit, "status": "pending", "created": _today()
+        })
+        return OpResult("Превышение плана — заявка отправлена в ОУК", [("qa_overflow_requests", rid)], ok=False)
+    it.quantity -= qty
+    n.remaining_qty -= qty
+    iid = store.next_issue_id()
+    store.add_issue({
+        "issue_id": iid, "department": department, "need_id": need_id, "item_seq_id": it.seq_id,
+        "item_name": it.name, "category": it.category, "qty": qty, "unit": it.unit,
+        "date": _today(), "issued_by": user
+    })
+    return OpResult(ISSUE_DONE, [("items", it.seq_id), (DEP_PREFIX + department, n.need_id), ("issues", iid)])
+
+def request_issue(store: NeedsStore, department: str, need_id: int, qty: float, unit: str, user: str = "") -> OpResult:
+    rid = store.next_store_request_id()
+    store.add_store_request({
+        "request_id": rid, "department": department, "need_id": need_id,
+        "requested_qty": qty, "unit": unit, "status": "pending",
+        "created": _today(), "requested_by": user
+    })
+    return OpResult("Заявка отправлена на склад", [("store_requests", rid)])
+
+def approve_store_request(store: NeedsStore, request_id: int, user: str = "") -> OpResult:
+    req = store.find_store_request(request_id)
+    if not req:
+        return OpResult("Заявка не найдена", ok=False)
+    if req.status != "pending":
+        return OpResult("Эта заявка уже обработана", ok=False)
+    res = issue(store, req.department, req.need_id, req.requested_qty, user)
+    req.status = "done" if res.message == ISSUE_DONE else "redirected"
+    res.touched.append(("store_requests", int(request_id)))
+    return res
+
+def reject_store_request(store: NeedsStore, request_id: int) -> OpResult:
+    req = store.find_store_request(request_id)
+    if not req:
+        return OpResult("Заявка не найдена", ok=False)
+    req.status = "rejected"
+    return OpResult("Заявка отклонена", [("store_requests", int(request_id))])
+
+def approve_qa_request(store: NeedsStore, request_id: int) -> OpResult:
+    req = store.find_qa_request(request_id)
+    if not req:
+        return OpResult("Заявка не найдена", ok=False)
+    touched = [("qa_overflow_requests", int(request_id))]
+    need = store.find_need(req.department, req.need_id)
+    if need:
+        need.remaining_qty += req.excess_qty
+        touched.append((DEP_PREFIX + req.department, need.need_id))
+    req.status = "approved"
+    return OpResult("Заявка одобрена: остаток по плану увеличен", touched)
+
+def reject_qa_request(store: NeedsStore, request_id: int) -> OpResult:
+    req = store.find_qa_request(request_id)
+    if not req:
+        return OpResult("Заявка не найдена", ok=False)
+    req.status = "rejected"
+    return OpResult("Заявка отклонена", [("qa_overflow_requests", int(request_id))])
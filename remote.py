@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+"""Storage backend talking to the API server (server.py) over HTTP/JSON.
+
+Selected with STORAGE_MODE = "remote". Saves send only the records changed since the
+last save together with their base, and the server merges them into its state, so the
+shared data has a single writer. Connections are kept alive and reused.
+"""
+from __future__ import annotations
+import http.client, json, threading
+from typing import List, Dict, Any, Optional, Tuple
+from urllib.parse import urlsplit, urlencode
+from models import Item
+from constants import SERVER_URL
+from storage import needs_to_sections, _items_to_sections, _encode
+import sync
+
+class RemoteError(OSError):
+    pass
+
+# Sections travel as [section, key, record] triples: JSON objects would turn int keys into strings
+def pack_sections(sections: Optional[Dict[str, Dict[Any, Any]]]) -> Optional[List[list]]:
+    if sections is None:
+        return None
+    return [[s, k, v] for s, recs in sections.items() for k, v in recs.items()]
+
+def unpack_sections(triples: Optional[List[list]]) -> Optional[Dict[str, Dict[Any, Any]]]:
+    if triples is None:
+        return None
+    sections: Dict[str, Dict[Any, Any]] = {}
+    for s, k, v in triples:
+        if s == "items" and isinstance(v, dict):
+            v = Item.from_dict(v)
+        sections.setdefault(s, {})[k] = v
+    return sections
+
+class RemoteBackend:
+    name = "remote"
+
+    def __init__(self, url: str = SERVER_URL, pool_size: int = 4, timeout: float = 30.0):
+        parts = urlsplit(url)
+        self.host = parts.hostname or "127.0.0.1"; self.port = parts.port or 80
+        self.timeout = timeout; self.pool_size = pool_size
+        # Idle keep-alive connections; the UI, saver and watcher threads each take one
+        self._pool: List[http.client.HTTPConnection] = []
+        self._pool_lock = threading.Lock()
+        self._versions: Dict[str, int] = {}
+
+    def _connection(self) -> http.client.HTTPConnection:
+        with self._pool_lock:
+            if self._pool:
+                return self._pool.pop()
+        return http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+
+    def _release(self, conn: http.client.HTTPConnection) -> None:
+        with self._pool_lock:
+            if len(self._pool) < self.pool_size:
+                self._pool.append(conn); return
+        conn.close()
+
+    def request(self, method: str, path: str, payload: Any = None) -> Any:
+        body = None if payload is None else json.dumps(payload, ensure_ascii=False, default=_encode).encode("utf-8")
+        for attempt in (1, 2):
+            conn = self._connection()
+            try:
+                conn.request(method, path, body=body, headers={"Content-Type": "application/json"})
+                resp = conn.getresponse()
+                data = resp.read()
+            except (http.client.HTTPException, OSError) as e:
+                conn.close()
+                # A pooled connection the server has dropped meanwhile: retry once on a fresh one
+                if attempt == 2:
+                    raise RemoteError(f"Сервер данных недоступен: {e}") from e
+                continue
+            if resp.will_close:
+                conn.close()
+            else:
+                self._release(conn)
+            result = json.loads(data.decode("utf-8")) if data else None
+            if resp.status != 200:
+                raise RemoteError((result or {}).get("error") or f"HTTP {resp.status}")
+            return result
+
+    def close(self) -> None:
+        with self._pool_lock:
+            for conn in self._pool:
+                conn.close()
+            self._pool.clear()
+
+    # ---- backend interface ----
+    def load_items(self) -> List[Item]:
+        r = self.request("GET", "/items")
+        self._versions["items"] = r["version"]
+        return [Item.from_dict(x) for x in r["items"]]
+
+    def save_items(self, items: List[Item]) -> None:
+        # Whole-store replacement; the storage facade sends deltas through merge_save
+        self.request("POST", "/save/items", {"base": None, "ours": pack_sections(_items_to_sections(items))})
+
+    def load_needs(self) -> Dict[str, Any]:
+        r = self.request("GET", "/needs")
+        self._versions["needs"] = r["version"]
+        return r["needs"]
+
+    def save_needs(self, needs: Dict[str, Any]) -> None:
+        self.request("POST", "/save/needs", {"base": None, "ours": pack_sections(needs_to_sections(needs))})
+
+    # ---- shared access (see storage._remote_save / _remote_pull) ----
+    def loaded_version(self, store: str) -> Optional[int]:
+        return self._versions.get(store)
+
+    def version(self, store: str) -> int:
+        return self.request("GET", "/version")[store]
+
+    def merge_save(self, store: str, base: Dict[str, Dict[Any, Any]], ours: Dict[str, Dict[Any, Any]]) -> sync.SaveResult:
+        r = self.request("POST", f"/save/{store}", {"base": pack_sections(base), "ours": pack_sections(ours)})
+        return sync.SaveResult(r["version"], True, r["conflicts"], {(s, old): new for s, old, new in r["renamed"]})
+
+    def changes(self, store: str, since: int) -> Tuple[int, bool, Dict[str, Dict[Any, Any]]]:
+        """(version, full, records): records changed after `since`, deleted ones as None;
+        with full=True the whole store instead (the server no longer knows `since`)."""
+        r = self.request("GET", f"/changes/{store}?{urlencode({'since': since})}")
+        return r["version"], r["full"], unpack_sections(r["records"])
+
+    # ---- server-side queries and operations ----
+    def query(self, kind: str, offset: int = 0, limit: int = 100, **filters) -> Tuple[int, List[Dict[str, Any]]]:
+        params = {"offset": offset, "limit": limit, **{k: v for k, v in filters.items() if v}}
+        r = self.request("GET", f"/query/{kind}?{urlencode(params)}")
+        return r["total"], r["rows"]
+
+    def op(self, name: str, **payload) -> Dict[str, Any]:
+        return self.request("POST", f"/ops/{name}", payload)
@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+import copy, queue, threading, time
+from typing import Any, Callable, Dict, List, Tuple
+from models import Item
+from storage import NEEDS_LISTS
+
+def snapshot_items(items: List[Item]) -> List[Item]:
+    # Item fields are immutable values, a shallow copy per row is a full snapshot
+    return [copy.copy(it) for it in items]
+
+def snapshot_needs(needs: Dict[str, Any]) -> Dict[str, Any]:
+    snap = dict(needs)
+    snap["departments"] = {d: [copy.copy(n) for n in lst] for d, lst in needs.get("departments", {}).items()}
+    for k in NEEDS_LISTS:
+        if k not in needs:
+            continue
+        lst = needs[k]
+        if getattr(lst, "loaded", True):
+            snap[k] = [copy.copy(r) for r in lst]
+        else:
+            # Undecoded snapshot section: the writer copies its raw bytes
+            snap[k] = lst.unloaded_copy()
+    return snap
+
+class WriteBehindSaver:
+    """Persists store snapshots on a dedicated thread.
+
+    submit() only records the latest snapshot of a store; bursts of submissions arriving
+    within `delay` seconds are coalesced into one write. Write errors are queued for the
+    UI thread (see poll_errors) and the snapshot is retried after `retry_delay` seconds
+    unless a newer one has been submitted meanwhile. Whatever a writer returns besides
+    None (e.g. a merge report) is queued as well (see poll_results).
+    """
+
+    def __init__(self, writers: Dict[str, Callable[[Any], Any]], delay: float = 0.3, retry_delay: float = 5.0):
+        self._writers = writers
+        self._delay = delay; self._retry_delay = retry_delay
+        self._pending: Dict[str, Any] = {}
+        self._busy = False; self._closed = False; self._flushers = 0
+        self._cond = threading.Condition()
+        self._errors: "queue.Queue[Tuple[str, Exception]]" = queue.Queue()
+        self._results: "queue.Queue[Tuple[str, Any]]" = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+        self._thread.start()
+
+    def submit(self, store: str, snapshot: Any) -> None:
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("saver is closed")
+            self._pending[store] = snapshot
+            self._cond.notify_all()
+
+    def flush(self, timeout: float = None) -> bool:
+        """Barrier: wait until every submitted snapshot has been written. False on timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            self._flushers += 1
+            self._cond.notify_all()
+            try:
+                while self._pending or self._busy:
+                    left = None if deadline is None else deadline - time.monotonic()
+                    if left is not None and left <= 0:
+                        return False
+                    self._cond.wait(left)
+            finally:
+                self._flushers -= 1
+        return True
+
+    def close(self, timeout: float = None) -> bool:
+        ok = self.flush(timeout)
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join(timeout)
+        return ok
+
+    def idle(self, store: str) -> bool:
+        """True when nothing of `store` is waiting to be written or being written."""
+        with self._cond:
+            return store not in self._pending and not self._busy
+
+    def poll_errors(self) -> List[Tuple[str, Exception]]:
+        return _drain(self._errors)
+
+    def poll_results(self) -> List[Tuple[str, Any]]:
+        return _drain(self._results)
+
+    def _run(self) -> None:
+        failed = False
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if not self._pending or (self._closed and failed):
+                    return
+                # Let a burst of edits settle; a flush() barrier or shutdown cuts the wait short
+                deadline = time.monotonic() + (self._retry_delay if failed else self._delay)
+                while (failed or not self._flushers) and not self._closed:
+                    left = deadline - time.monotonic()
+                    if left <= 0:
+                        break
+                    self._cond.wait(left)
+                batch = self._pending; self._pending = {}
+                self._busy = True
+            failed = False
+            for store, snapshot in batch.items():
+                try:
+                    result = self._writers[store](snapshot)
+                    if result is not None:
+                        self._results.put((store, result))
+                except Exception as e:
+                    failed = True
+                    self._errors.put((store, e))
+                    with self._cond:
+                        self._pending.setdefault(store, snapshot)
+            with self._cond:
+                self._busy = False
+                self._cond.notify_all()
+
+def _drain(q: queue.Queue) -> list:
+    out = []
+    while True:
+        try:
+            out.append(q.get_nowait())
+        except queue.Empty:
+            return out
@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+"""Substring search over the lowercased text of table rows.
+
+Row texts are kept by key, so a query never goes back to the widgets. Candidate rows
+come from trigram postings (the keys whose text contains a three-letter piece of the
+query), built on first use with one pass over the texts and kept current as rows
+change. A query that extends the previous one only re-checks the previous matches, which
+is the common case while typing. NameIndex builds name suggestions on the same index.
+"""
+from __future__ import annotations
+import heapq
+from bisect import bisect_left, insort
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+GRAM = 3
+MAX_GRAMS = 512        # cached trigram postings; the oldest is dropped beyond this
+BULK_UPDATE = 1000     # a batch this large drops the postings instead of patching them
+
+class SearchIndex:
+    """Rows are numbered in the order they are set; a changed row gets a new number, so
+    postings stay ascending and only ever grow. The replaced numbers keep an empty text,
+    which no query matches, until the table is renumbered."""
+    def __init__(self):
+        self.clear()
+
+    def clear(self) -> None:
+        self._rows: Dict[str, int] = {}          # key -> row number
+        self._keys: List[Optional[str]] = []     # row number -> key, None once replaced
+        self._texts: List[str] = []              # row number -> lowercased text
+        self._grams: Dict[str, List[int]] = {}   # trigram -> row numbers containing it
+        self._last: Optional[Tuple[str, List[int]]] = None
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def text(self, key: str) -> str:
+        return self._texts[self._rows[key]]
+
+    def set(self, key: str, text: str) -> None:
+        text = text.lower()
+        r = self._rows.get(key)
+        if r is not None:
+            if self._texts[r] == text:
+                return
+            self._drop(r)
+        r = self._rows[key] = len(self._texts)
+        self._keys.append(key); self._texts.append(text)
+        for g, rows in self._grams.items():
+            if g in text:
+                rows.append(r)
+        if self._last is not None and self._last[0] in text:
+            self._last[1].append(r)
+
+    def set_many(self, pairs: Iterable[Tuple[str, str]]) -> None:
+        pairs = list(pairs)
+        if len(pairs) >= BULK_UPDATE:
+            # Cheaper to rebuild postings on the next query than to extend each of them
+            self._grams = {}; self._last = None
+        for k, t in pairs:
+            self.set(k, t)
+
+    def discard(self, key: str) -> None:
+        r = self._rows.pop(key, None)
+        if r is not None:
+            self._drop(r)
+
+    def _drop(self, r: int) -> None:
+        self._keys[r] = None; self._texts[r] = ""
+        if len(self._texts) > 2 * len(self._rows) + BULK_UPDATE:
+            self._renumber()
+
+    def _renumber(self) -> None:
+        live = [(k, t) for k, t in zip(self._keys, self._texts) if k is not None]
+        self._keys = [k for k, _ in live]; self._texts = [t for _, t in live]
+        self._rows = {k: r for r, k in enumerate(self._keys)}
+        self._grams = {}; self._last = None
+
+    def _posting(self, g: str) -> List[int]:
+        rows = self._grams.get(g)
+        if rows is None:
+            if len(self._grams) >= MAX_GRAMS:
+                del self._grams[next(iter(self._grams))]
+            rows = self._grams[g] = [r for r, t in enumerate(self._texts) if g in t]
+        return rows
+
+    def search(self, query: str) -> Set[str]:
+        """Keys whose text contains the query (case-insensitive), as a new set."""
+        q = query.lower()
+        if not q:
+            return set(self._rows)
+        result = self._match(q)
+        if len(result) == len(self._rows):
+            return set(self._rows)
+        keys = self._keys
+        return {keys[r] for r in result}
+
+    def matches(self, query: str) -> List[Tuple[str, str]]:
+        """(key, text) of the rows containing a non-empty query, in the order they were set."""
+        keys, texts = self._keys, self._texts
+        return [(keys[r], texts[r]) for r in self._match(query.lower())]
+
+    def _match(self, q: str) -> List[int]:
+        if self._last is not None and self._last[0] in q:
+            candidates: Iterable[int] = self._last[1]
+        elif len(q) >= GRAM:
+            grams = [q[i:i + GRAM] for i in range(len(q) - GRAM + 1)]
+            cached = [self._grams[g] for g in grams if g in self._grams]
+            candidates = min(cached, key=len) if cached else self._posting(grams[0])
+        else:
+            candidates = range(len(self._texts))
+        texts = self._texts
+        result = [r for r in candidates if q in texts[r]]
+        self._last = (q, result)
+        return result
+
+class NameIndex:
+    """Distinct names (stock lots and plan positions) with the number of records using
+    each, for the suggestions of the name fields. The sorted list answers prefix lookups
+    with bisect and a SearchIndex the substring ones; both are built on the first lookup
+    and then follow add/remove."""
+    def __init__(self, names: Iterable[str] = ()):
+        self._count: Dict[str, int] = {}
+        self._sorted: Optional[List[Tuple[str, str]]] = None   # (lowercased, name)
+        self._text: Optional[SearchIndex] = None
+        for n in names:
+            self.add(n)
+
+    def __len__(self) -> int:
+        return len(self._count)
+
+    def add(self, name: Optional[str]) -> None:
+        if not name:
+            return
+        c = self._count.get(name, 0)
+        self._count[name] = c + 1
+        if c == 0 and self._sorted is not None:
+            insort(self._sorted, (name.lower(), name))
+            self._text.set(name, name)
+
+    def remove(self, name: Optional[str]) -> None:
+        c = self._count.get(name)
+        if not c:
+            return
+        if c > 1:
+            self._count[name] = c - 1
+            return
+        del self._count[name]
+        if self._sorted is not None:
+            entry = (name.lower(), name)
+            i = bisect_left(self._sorted, entry)
+            if i < len(self._sorted) and self._sorted[i] == entry:
+                del self._sorted[i]
+            self._text.discard(name)
+
+    def _build(self) -> None:
+        self._sorted = sorted((n.lower(), n) for n in self._count)
+        self._text = SearchIndex()
+        self._text.set_many((n, n) for n in self._count)
+
+    def suggest(self, text: str, limit: int = 50) -> List[str]:
+        """Up to `limit` names containing the text, case-insensitively: the ones starting
+        with it alphabetically, then the others by where the match starts and by length."""
+        q = text.strip().lower()
+        if not q:
+            return []
+        if self._sorted is None:
+            self._build()
+        names, out = self._sorted, []
+        i = bisect_left(names, (q,))
+        while i < len(names) and len(out) < limit and names[i][0].startswith(q):
+            out.append(names[i][1]); i += 1
+        if len(out) < limit:
+            rest = ((t.find(q), len(t), n) for n, t in self._text.matches(q) if not t.startswith(q))
+            out += [n for _, _, n in heapq.nsmallest(limit - len(out), rest)]
+        return out
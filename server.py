@@ -0,0 +1,248 @@
+# -*- coding: utf-8 -*-
+"""Headless API server owning the lab data in memory.
+
+Usage: python server.py [--host HOST] [--port PORT] [--storage json|journal|sqlite|snapshot]
+
+Clients select STORAGE_MODE = "remote". All mutations run one at a time on the event
+loop, and the data is persisted by a single write-behind saver, so N clients cost one
+writer. HTTP/1.1 with keep-alive, JSON bodies:
+
+    GET  /version                       {"items": v, "needs": v}
+    GET  /items, /needs                 whole store with its version
+    GET  /changes/<store>?since=v       records changed after v
+    POST /save/<store>                  {"base": triples, "ours": triples}, merged record by record
+    GET  /query/<kind>?offset&limit&... paged rows of items, needs, issues, store/qa requests
+    POST /ops/<name>                    add_item, import_items, add_need, issue, request_issue,
+                                        approve/reject_store_request, approve/reject_qa_request
+"""
+from __future__ import annotations
+import argparse, asyncio, json, signal
+from typing import List, Dict, Any, Tuple
+from urllib.parse import urlsplit, parse_qsl
+from constants import SERVER_HOST, SERVER_PORT, STORAGE_MODE
+from models import Item
+import storage, sync, operations, archive
+from storage import needs_to_sections, _items_to_sections, _encode, NEEDS_LISTS
+from saver import WriteBehindSaver, snapshot_items, snapshot_needs
+from needs_store import NeedsStore
+from remote import pack_sections, unpack_sections
+
+STORES = ("items", "needs")
+PAGE_LIMIT = 1000
+# Snapshots for the saver are taken at most this often per store
+PERSIST_DELAY = 0.2
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 500: "Internal Server Error"}
+
+class ApiError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message); self.status = status
+
+OPS = {
+    "add_item": lambda st, p: operations.add_item(st, p["item"], p.get("user", "")),
+    "import_items": lambda st, p: operations.import_items(st, p["items"], p.get("user", "")),
+    "add_need": lambda st, p: operations.add_need(st, p["department"], p["need"]),
+    "issue": lambda st, p: operations.issue(st, p["department"], int(p["need_id"]), float(p["qty"]), p.get("user", "")),
+    "request_issue": lambda st, p: operations.request_issue(st, p["department"], int(p["need_id"]), float(p["qty"]), p.get("unit", ""), p.get("user", "")),
+    "approve_store_request": lambda st, p: operations.approve_store_request(st, int(p["request_id"]), p.get("user", "")),
+    "reject_store_request": lambda st, p: operations.reject_store_request(st, int(p["request_id"])),
+    "approve_qa_request": lambda st, p: operations.approve_qa_request(st, int(p["request_id"])),
+    "reject_qa_request": lambda st, p: operations.reject_qa_request(st, int(p["request_id"])),
+}
+
+class LabServer:
+    def __init__(self):
+        self.items = storage.load_items()
+        self.needs = storage.load_needs()
+        for k in NEEDS_LISTS:
+            # Every list gets served, so lazily decoded snapshot sections are decoded once here
+            self.needs[k] = list(self.needs[k])
+        self.store = NeedsStore(self.needs, self.items, archive.max_ids())
+        self.saver = WriteBehindSaver({"items": storage.save_items, "needs": storage.save_needs})
+        self.version = {s: storage.store_version(s) for s in STORES}
+        # Changes before these versions are not in the log: such clients get the whole store
+        self.first_version = dict(self.version)
+        # store -> (section, key) -> version of the last change
+        self.log: Dict[str, Dict[Tuple[str, Any], int]] = {s: {} for s in STORES}
+        self._scheduled: set = set()
+
+    def _sections(self, store: str) -> Dict[str, Dict[Any, Any]]:
+        return _items_to_sections(self.items) if store == "items" else needs_to_sections(self.needs)
+
+    # ---- mutations (event loop thread only) ----
+    def _commit(self, touched: List[Tuple[str, Any]]) -> None:
+        by_store: Dict[str, List[Tuple[str, Any]]] = {}
+        for s, k in touched:
+            by_store.setdefault("items" if s == "items" else "needs", []).append((s, k))
+        for store, keys in by_store.items():
+            self.version[store] += 1
+            for key in keys:
+                self.log[store][key] = self.version[store]
+            if store not in self._scheduled:
+                self._scheduled.add(store)
+                asyncio.get_running_loop().call_later(PERSIST_DELAY, self._persist, store)
+
+    def _persist(self, store: str) -> None:
+        self._scheduled.discard(store)
+        self.saver.submit(store, snapshot_items(self.items) if store == "items" else snapshot_needs(self.needs))
+
+    def merge_save(self, store: str, base, ours) -> Dict[str, Any]:
+        if store not in STORES:
+            raise ApiError(404, f"unknown store {store}")
+        if base is None:
+            # Whole-store replacement: anything missing from ours is deleted
+            base = self._sections(store)
+        keys = {(s, k) for secs in (base, ours) for s, recs in secs.items() for k in recs}
+        theirs: Dict[str, Dict[Any, Any]] = {}
+        for s, k in keys:
+            rec = self.store.record(s, k)
+            if rec is not None:
+                theirs.setdefault(s, {})[k] = rec
+        renamed: Dict[Tuple[str, Any], Any] = {}
+        merged, conflicts = sync.merge_sections(base, ours, theirs, renamed, id_max=self.store.max_ids())
+        records = []
+        for s in set(merged) | set(theirs):
+            old_recs, new_recs = theirs.get(s, {}), merged.get(s, {})
+            for k in set(old_recs) | set(new_recs):
+                old, new = old_recs.get(k), new_recs.get(k)
+                if new is old or new == old:
+                    continue
+                if s == "items" and isinstance(new, dict):
+                    new = Item.from_dict(new)
+                records.append((s, k, new))
+        self.store.apply_changes(sync.Changes(records=records))
+        self._commit([(s, k) for s, k, _ in records])
+        return {"version": self.version[store], "conflicts": conflicts,
+                "renamed": [[s, old, new] for (s, old), new in renamed.items()]}
+
+    def run_op(self, name: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+        if name not in OPS:
+            raise ApiError(404, f"unknown operation {name}")
+        res = OPS[name](self.store, payload)
+        self._commit(res.touched)
+        return {"ok": res.ok, "message": res.message, "touched": [list(t) for t in res.touched], "version": self.version}
+
+    # ---- reads ----
+    def changes(self, store: str, since: int) -> Dict[str, Any]:
+        if store not in STORES:
+            raise ApiError(404, f"unknown store {store}")
+        if since < self.first_version[store]:
+            return {"version": self.version[store], "full": True, "records": pack_sections(self._sections(store))}
+        records = [[s, k, self.store.record(s, k)] for (s, k), v in self.log[store].items() if v > since]
+        return {"version": self.version[store], "full": False, "records": records}
+
+    def query(self, kind: str, params: Dict[str, str]) -> Dict[str, Any]:
+        offset = int(params.get("offset", 0)); limit = min(int(params.get("limit", 100)), PAGE_LIMIT)
+        if kind == "items":
+            rows = [it.to_dict() for it in self.items]
+        elif kind == "needs":
+            rows = [{"department": d, **n} for d, lst in self.needs["departments"].items() for n in lst]
+        elif kind in NEEDS_LISTS:
+            rows = list(self.needs.get(kind, []))
+        else:
+            raise ApiError(404, f"unknown kind {kind}")
+        date_field = archive.DATE_FIELDS.get(kind, "created")
+        for field in ("department", "status", "category"):
+            if params.get(field):
+                rows = [r for r in rows if r.get(field) == params[field]]
+        if params.get("date_from"):
+            rows = [r for r in rows if str(r.get(date_field) or "") >= params["date_from"]]
+        if params.get("date_to"):
+            rows = [r for r in rows if str(r.get(date_field) or "") <= params["date_to"]]
+        if params.get("q"):
+            q = params["q"].lower()
+            rows = [r for r in rows if q in " ".join(str(v) for v in r.values()).lower()]
+        return {"total": len(rows), "rows": rows[offset:offset + limit]}
+
+    def dispatch(self, method: str, target: str, body: bytes) -> Any:
+        url = urlsplit(target); parts = [p for p in url.path.split("/") if p]
+        params = dict(parse_qsl(url.query))
+        payload = json.loads(body.decode("utf-8")) if body else {}
+        route = (method, parts[0] if parts else "")
+        if route == ("GET", "version"):
+            return self.version
+        if route == ("GET", "items"):
+            return {"version": self.version["items"], "items": self.items}
+        if route == ("GET", "needs"):
+            return {"version": self.version["needs"], "needs": self.needs}
+        if route == ("GET", "changes") and len(parts) == 2:
+            return self.changes(parts[1], int(params.get("since", -1)))
+        if route == ("POST", "save") and len(parts) == 2:
+            return self.merge_save(parts[1], unpack_sections(payload.get("base")), unpack_sections(payload["ours"]))
+        if route == ("GET", "query") and len(parts) == 2:
+            return self.query(parts[1], params)
+        if route == ("POST", "ops") and len(parts) == 2:
+            return self.run_op(parts[1], payload)
+        raise ApiError(404, f"no route {method} {url.path}")
+
+    # ---- HTTP ----
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                line = await reader.readline()
+                if not line.strip():
+                    break
+                method, target, version = line.decode("latin-1").split()
+                headers: Dict[str, str] = {}
+                while True:
+                    h = await reader.readline()
+                    if h in (b"\r\n", b"\n", b""):
+                        break
+                    k, _, v = h.decode("latin-1").partition(":")
+                    headers[k.strip().lower()] = v.strip()
+                body = await reader.readexactly(int(headers.get("content-length") or 0))
+                try:
+                    status, result = 200, self.dispatch(method, target, body)
+                except ApiError as e:
+                    status, result = e.status, {"error": str(e)}
+                except (ValueError, KeyError, TypeError) as e:
+                    status, result = 400, {"error": f"{type(e).__name__}: {e}"}
+                except Exception as e:
+                    status, result = 500, {"error": f"{type(e).__name__}: {e}"}
+                data = json.dumps(result, ensure_ascii=False, default=_encode).encode("utf-8")
+                keep = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+                writer.write((f"HTTP/1.1 {status} {REASONS[status]}\r\n"
+                              f"Content-Type: application/json; charset=utf-8\r\nContent-Length: {len(data)}\r\n"
+                              f"Connection: {'keep-alive' if keep else 'close'}\r\n\r\n").encode("latin-1") + data)
+                await writer.drain()
+                if not keep:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError, asyncio.CancelledError):
+            pass  # client gone, malformed request, or an idle keep-alive connection at shutdown
+        finally:
+            writer.close()
+
+async def serve(host: str = SERVER_HOST, port: int = SERVER_PORT) -> None:
+    app = LabServer()
+    server = await asyncio.start_server(app.handle, host, port)
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except (NotImplementedError, RuntimeError):
+            pass  # Windows: Ctrl+C arrives as KeyboardInterrupt
+    print(f"Сервер данных: http://{host}:{port}")
+    try:
+        async with server:
+            await stop.wait()
+    finally:
+        # Pending snapshots are written before the process exits
+        for store in list(app._scheduled):
+            app._persist(store)
+        app.saver.close(timeout=30)
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="API server for the lab data")
+    parser.add_argument("--host", default=SERVER_HOST)
+    parser.add_argument("--port", type=int, default=SERVER_PORT)
+    parser.add_argument("--storage", default=STORAGE_MODE if STORAGE_MODE != "remote" else "json",
+                        choices=["json", "journal", "sqlite", "snapshot"])
+    args = parser.parse_args()
+    storage.set_backend(args.storage)
+    try:
+        asyncio.run(serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
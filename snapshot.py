@@ -0,0 +1,271 @@
+# -*- coding: utf-8 -*-
+"""Binary snapshot of items and needs with per-section lazy decoding.
+
+Layout (little endian):
+    b"LABSNAP1", version:u16, section_count:u16
+    section_count x (name_len:u16, name:utf8, codec:1s, offset:u64, length:u64, max_id:u64)
+    section payloads
+
+Sections: meta, departments, items, qa_overflow_requests, store_requests.open,
+store_requests.closed, issues. Startup decodes meta, departments, items, the QA queue and
+the open store requests; closed store requests and issues stay as raw bytes until
+something reads them.
+
+Usage: python snapshot.py to-snapshot | to-json
+"""
+from __future__ import annotations
+import copy, json, os, struct, sys, tempfile
+from collections import UserList
+from pathlib import Path
+from typing import List, Dict, Any, Optional, Tuple, Callable
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+from models import Item
+from constants import SNAPSHOT_FILE, ITEMS_JSON, NEEDS_JSON, DATA_DIR
+from storage import JsonBackend, NEEDS_LISTS, atomic_write_json, _encode as _record_dict
+
+MAGIC = b"LABSNAP1"
+VERSION = 1
+_HEADER = struct.Struct("<8sHH")
+_ENTRY = struct.Struct("<1sQQQ")
+LAZY_SECTIONS = {"issues": ["issues"], "store_requests": ["store_requests.open", "store_requests.closed"]}
+# Parts of the lazy lists decoded at load: the pending store requests
+EAGER_SECTIONS = {"store_requests.open"}
+OPEN_STATUS = "pending"
+
+# name -> (codec, raw bytes, max_id)
+RawSections = Dict[str, Tuple[bytes, bytes, int]]
+
+def _encode(obj: Any) -> Tuple[bytes, bytes]:
+    if msgpack is not None:
+        return b"m", msgpack.packb(obj, use_bin_type=True, default=_record_dict)
+    return b"j", json.dumps(obj, ensure_ascii=False, separators=(",", ":"), default=_record_dict).encode("utf-8")
+
+def _decode(codec: bytes, raw: bytes) -> Any:
+    if codec == b"m":
+        if msgpack is None:
+            raise RuntimeError("Снимок записан в формате msgpack, установите пакет msgpack")
+        return msgpack.unpackb(raw, raw=False, strict_map_key=False)
+    return json.loads(raw.decode("utf-8"))
+
+def read_raw_sections(path: Path) -> RawSections:
+    with open(path, "rb") as f:
+        buf = f.read()
+    magic, version, count = _HEADER.unpack_from(buf, 0)
+    if magic != MAGIC or version > VERSION:
+        raise ValueError(f"{path}: не является снимком данных")
+    pos = _HEADER.size; sections: RawSections = {}
+    for _ in range(count):
+        (name_len,) = struct.unpack_from("<H", buf, pos); pos += 2
+        name = buf[pos:pos + name_len].decode("utf-8"); pos += name_len
+        codec, offset, length, max_id = _ENTRY.unpack_from(buf, pos); pos += _ENTRY.size
+        sections[name] = (codec, buf[offset:offset + length], max_id)
+    return sections
+
+def write_raw_sections(path: Path, sections: RawSections) -> None:
+    names = [n.encode("utf-8") for n in sections]
+    header_size = _HEADER.size + sum(2 + len(n) + _ENTRY.size for n in names)
+    header = [_HEADER.pack(MAGIC, VERSION, len(sections))]; payload = []; offset = header_size
+    for name, (codec, raw, max_id) in zip(names, sections.values()):
+        header.append(struct.pack("<H", len(name)) + name + _ENTRY.pack(codec, offset, len(raw), max_id))
+        payload.append(raw); offset += len(raw)
+    fd, tmp = tempfile.mkstemp(dir=str(path.parent), prefix=path.name + ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(b"".join(header)); f.write(b"".join(payload))
+            f.flush(); os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+class LazySection(UserList):
+    """A list decoded from raw snapshot sections on first access.
+
+    Parts named in `eager` are decoded right away into open_rows; the others only hold
+    their raw bytes, so saving an untouched list back is a byte copy and max_id answers
+    id allocation without decoding. Rows appended before the full decode join open_rows.
+    """
+
+    def __init__(self, parts: RawSections, id_key: str, row_factory: Optional[Callable[[Dict[str, Any]], Any]] = None,
+                 eager: Tuple[str, ...] = ()):
+        self._parts = parts; self._id_key = id_key; self._data: Optional[list] = None
+        self._eager = tuple(n for n in eager if n in parts)
+        self._open = [r for n in self._eager for r in _decode(*parts[n][:2])]
+        self._row_factory = None
+        # Set by models.coerce_needs: decoded rows become typed records
+        self.row_factory = row_factory
+        # The open rows as loaded, to tell an untouched list from one changed in place
+        self._open_base = [copy.copy(r) for r in self._open]
+        self.max_id = max((p[2] for p in parts.values()), default=0)
+
+    @property
+    def row_factory(self) -> Optional[Callable[[Dict[str, Any]], Any]]:
+        return self._row_factory
+
+    @row_factory.setter
+    def row_factory(self, factory: Optional[Callable[[Dict[str, Any]], Any]]) -> None:
+        self._row_factory = factory
+        if factory is not None:
+            self._open = [factory(r) for r in self._open]
+            if hasattr(self, "_open_base"):
+                self._open_base = [factory(r) for r in self._open_base]
+
+    @property
+    def loaded(self) -> bool:
+        return self._data is not None
+
+    @property
+    def pristine(self) -> bool:
+        """Not decoded and the open rows unchanged since the load: the raw parts still hold it all."""
+        return self._data is None and self._open == self._open_base
+
+    @property
+    def open_rows(self) -> list:
+        """The eagerly decoded rows and those appended since; every row once decoded."""
+        return self._open if self._data is None else self._data
+
+    @property
+    def data(self) -> list:
+        if self._data is None:
+            rows = []
+            for name, (codec, raw, _) in self._parts.items():
+                if name not in self._eager:
+                    rows.extend(_decode(codec, raw))
+            if self.row_factory is not None:
+                rows = [self.row_factory(r) for r in rows]
+            # The open rows keep their identity: callers may hold them already
+            rows += self._open
+            if len(self._parts) > 1 or self._open:
+                rows.sort(key=lambda r: int(r.get(self._id_key) or 0))
+            self._data = rows
+        return self._data
+
+    @data.setter
+    def data(self, value: list) -> None:
+        self._data = value
+
+    def append(self, item: Any) -> None:
+        if self._data is not None:
+            self._data.append(item)
+        else:
+            self._open.append(item)
+            self.max_id = max(self.max_id, int(item.get(self._id_key) or 0))
+
+    def raw_parts(self) -> RawSections:
+        return self._parts
+
+    def unloaded_copy(self) -> "LazySection":
+        lst = LazySection.__new__(LazySection)
+        lst._parts = self._parts; lst._id_key = self._id_key; lst._data = None
+        lst._eager = self._eager; lst._row_factory = self._row_factory
+        lst._open = [copy.copy(r) for r in self._open]; lst._open_base = self._open_base
+        lst.max_id = self.max_id
+        return lst
+
+def _max_id(rows: List[Dict[str, Any]], id_key: str) -> int:
+    return max((int(r.get(id_key) or 0) for r in rows), default=0)
+
+def _section(rows: Any, max_id: int = 0) -> Tuple[bytes, bytes, int]:
+    codec, raw = _encode(rows)
+    return codec, raw, max_id
+
+def needs_sections(needs: Dict[str, Any]) -> RawSections:
+    meta = {k: v for k, v in needs.items() if k != "departments" and k not in NEEDS_LISTS}
+    departments = needs.get("departments", {})
+    sections: RawSections = {
+        "meta": _section(meta),
+        "departments": _section(departments, max((_max_id(l, "need_id") for l in departments.values()), default=0)),
+    }
+    qa = list(needs.get("qa_overflow_requests", []))
+    sections["qa_overflow_requests"] = _section(qa, _max_id(qa, "request_id"))
+    for key, names in LAZY_SECTIONS.items():
+        lst = needs.get(key, [])
+        if isinstance(lst, LazySection) and lst.pristine:
+            sections.update(lst.raw_parts())
+        elif key == "store_requests":
+            rows = list(lst)
+            opened = [r for r in rows if r.get("status") == OPEN_STATUS]
+            closed = [r for r in rows if r.get("status") != OPEN_STATUS]
+            sections["store_requests.open"] = _section(opened, _max_id(opened, "request_id"))
+            sections["store_requests.closed"] = _section(closed, _max_id(closed, "request_id"))
+        else:
+            rows = list(lst)
+            sections[names[0]] = _section(rows, _max_id(rows, NEEDS_LISTS[key]))
+    return sections
+
+def items_sections(items: List[Item]) -> RawSections:
+    return {"items": _section([it.to_dict() for it in items], max((it.seq_id for it in items), default=0))}
+
+def load_needs_sections(sections: RawSections) -> Dict[str, Any]:
+    def dec(name):
+        codec, raw, _ = sections[name]
+        return _decode(codec, raw)
+    data = dec("meta") if "meta" in sections else {}
+    data["departments"] = dec("departments") if "departments" in sections else {}
+    data["qa_overflow_requests"] = dec("qa_overflow_requests") if "qa_overflow_requests" in sections else []
+    for key, names in LAZY_SECTIONS.items():
+        data[key] = LazySection({n: sections[n] for n in names if n in sections}, NEEDS_LISTS[key],
+                                eager=tuple(n for n in names if n in EAGER_SECTIONS))
+    return data
+
+class SnapshotBackend:
+    name = "snapshot"
+    # Items and needs are both read-modify-written into the one file, so their saves
+    # from different workstations must exclude each other
+    lock_name = "snapshot"
+
+    def __init__(self, path: Path = SNAPSHOT_FILE):
+        self.path = path
+        DATA_DIR.mkdir(parents=True, exist_ok=True)
+        if not self.path.exists():
+            json_to_snapshot(self.path)
+
+    def load_items(self) -> List[Item]:
+        codec, raw, _ = read_raw_sections(self.path).get("items", (b"j", b"[]", 0))
+        return [Item.from_dict(x) for x in _decode(codec, raw)]
+
+    def save_items(self, items: List[Item]) -> None:
+        sections = read_raw_sections(self.path)
+        sections.update(items_sections(items))
+        write_raw_sections(self.path, sections)
+
+    def load_needs(self) -> Dict[str, Any]:
+        return load_needs_sections(read_raw_sections(self.path))
+
+    def save_needs(self, needs: Dict[str, Any]) -> None:
+        sections = read_raw_sections(self.path)
+        for name in list(sections):
+            if name != "items":
+                del sections[name]
+        sections.update(needs_sections(needs))
+        write_raw_sections(self.path, sections)
+
+def json_to_snapshot(path: Path = SNAPSHOT_FILE) -> None:
+    src = JsonBackend()
+    items = src.load_items() if ITEMS_JSON.exists() else []
+    needs = src.load_needs() if NEEDS_JSON.exists() else {}
+    sections = items_sections(items)
+    sections.update(needs_sections(needs))
+    write_raw_sections(path, sections)
+
+def snapshot_to_json(path: Path = SNAPSHOT_FILE) -> None:
+    sections = read_raw_sections(path)
+    codec, raw, _ = sections.get("items", (b"j", b"[]", 0))
+    atomic_write_json(ITEMS_JSON, _decode(codec, raw))
+    needs = load_needs_sections(sections)
+    for key in LAZY_SECTIONS:
+        needs[key] = list(needs[key])
+    atomic_write_json(NEEDS_JSON, needs)
+
+if __name__ == "__main__":
+    cmd = sys.argv[1] if len(sys.argv) > 1 else ""
+    if cmd == "to-snapshot":
+        json_to_snapshot()
+    elif cmd == "to-json":
+        snapshot_to_json()
+    else:
+        print(__doc__); sys.exit(2)
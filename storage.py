@@ -1,27 +1,408 @@
 # -*- coding: utf-8 -*-
 from __future__ import annotations
-import json, hashlib
-from typing import List, Dict, Any
-from models import Item
-from constants import ITEMS_JSON, USERS_JSON, NEEDS_JSON, DATA_DIR, NEEDS_DEPARTMENTS
+import json, hashlib, os, copy, threading, tempfile, contextlib
+from pathlib import Path
+from typing import List, Dict, Any, Optional
+from models import Item, coerce_needs
+from constants import (
+    ITEMS_JSON, USERS_JSON, NEEDS_JSON, DATA_DIR, NEEDS_DEPARTMENTS,
+    STORAGE_MODE, ITEMS_JOURNAL, NEEDS_JOURNAL, JOURNAL_CHECKPOINT_EVERY, CONCURRENT_ACCESS
+)
+import sync
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Keyed lists of needs.json; everything else at the top level (except "departments") is meta
+NEEDS_LISTS = {"qa_overflow_requests": "request_id", "issues": "issue_id", "store_requests": "request_id"}
+DEP_PREFIX = "dep:"
 
 def _ensure_data_dir():
     DATA_DIR.mkdir(parents=True, exist_ok=True)
 
-def load_items() -> List[Item]:
-    _ensure_data_dir()
-    if not ITEMS_JSON.exists():
-        ITEMS_JSON.write_text("[]", encoding="utf-8")
-    data = json.loads(ITEMS_JSON.read_text(encoding="utf-8"))
-    return [Item.from_dict(x) for x in data]
+def dumps_json(data: Any) -> bytes:
+    # Same shape as json.dump(ensure_ascii=False, indent=2); orjson when installed
+    if orjson is not None:
+        return orjson.dumps(data, default=_encode, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(data, ensure_ascii=False, indent=2, default=_encode).encode("utf-8")
+
+def loads_json(raw: bytes) -> Any:
+    return orjson.loads(raw) if orjson is not None else json.loads(raw.decode("utf-8"))
+
+def atomic_write_json(path: Path, data: Any) -> None:
+    # Readers see either the old or the new file, never a half-written one
+    fd, tmp = tempfile.mkstemp(dir=str(path.parent), prefix=path.name + ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(dumps_json(data))
+            f.flush(); os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+# ---- Journal ----
+# A journal line is {"s": section, "k": key, "v": record} or {"s": section, "k": key, "d": 1} for deletion.
+# Entries carry absolute values, so replaying a journal over a newer snapshot is harmless.
+_journal_cache: Dict[str, Optional[Dict[str, Dict[Any, Any]]]] = {"items": None, "needs": None}
+_journal_len: Dict[str, int] = {"items": 0, "needs": 0}
+
+def needs_to_sections(needs: Dict[str, Any], skip_unloaded: bool = False) -> Dict[str, Dict[Any, Any]]:
+    # skip_unloaded leaves out lazily decoded history lists nobody has read or changed yet
+    sections: Dict[str, Dict[Any, Any]] = {"meta": {}}
+    for k, v in needs.items():
+        if k == "departments":
+            for dep, lst in v.items():
+                sections[DEP_PREFIX + dep] = {n.get("need_id"): n for n in lst}
+        elif k in NEEDS_LISTS:
+            if skip_unloaded and getattr(v, "pristine", False):
+                continue
+            id_key = NEEDS_LISTS[k]
+            sections[k] = {r.get(id_key): r for r in v}
+        else:
+            sections["meta"][k] = v
+    return sections
+
+def sections_to_needs(sections: Dict[str, Dict[Any, Any]]) -> Dict[str, Any]:
+    data: Dict[str, Any] = dict(sections.get("meta", {}))
+    data["departments"] = {}
+    for s, recs in sections.items():
+        if s.startswith(DEP_PREFIX):
+            data["departments"][s[len(DEP_PREFIX):]] = list(recs.values())
+        elif s in NEEDS_LISTS:
+            data[s] = list(recs.values())
+    return data
+
+def _read_journal(path: Path) -> List[Dict[str, Any]]:
+    if not path.exists():
+        return []
+    entries = []; good = 0
+    with open(path, "rb") as f:
+        for line in f:
+            try:
+                entries.append(json.loads(line.decode("utf-8")))
+            except ValueError:
+                break
+            good += len(line)
+    if good < path.stat().st_size:
+        # Torn tail from a crash in the middle of an append: drop it so later appends stay readable
+        with open(path, "r+b") as f:
+            f.truncate(good)
+    return entries
+
+def _replay(sections: Dict[str, Dict[Any, Any]], entries: List[Dict[str, Any]]) -> None:
+    for e in entries:
+        recs = sections.setdefault(e["s"], {})
+        if e.get("d"):
+            recs.pop(e["k"], None)
+        else:
+            recs[e["k"]] = e["v"]
+
+def _encode(o: Any) -> Any:
+    # Item and the needs records (models.Record)
+    if hasattr(o, "to_dict"):
+        return o.to_dict()
+    raise TypeError(type(o).__name__)
+
+def _append_journal(path: Path, entries: List[Dict[str, Any]]) -> None:
+    with open(path, "a", encoding="utf-8") as f:
+        f.write("".join(json.dumps(e, ensure_ascii=False, default=_encode) + "\n" for e in entries))
+        f.flush()
+
+def diff_sections(cached: Dict[str, Dict[Any, Any]], current: Dict[str, Dict[Any, Any]]) -> List[Dict[str, Any]]:
+    entries = []
+    for s, recs in current.items():
+        old = cached.get(s, {})
+        for k, v in recs.items():
+            if k not in old or old[k] != v:
+                entries.append({"s": s, "k": k, "v": v})
+        for k in old:
+            if k not in recs:
+                entries.append({"s": s, "k": k, "d": 1})
+    for s, old in cached.items():
+        if s not in current:
+            entries.extend({"s": s, "k": k, "d": 1} for k in old)
+    return entries
+
+def copy_sections(sections: Dict[str, Dict[Any, Any]]) -> Dict[str, Dict[Any, Any]]:
+    return {s: {k: copy.copy(v) for k, v in recs.items()} for s, recs in sections.items()}
+
+def _journal_save(store: str, snapshot_path: Path, journal_path: Path, sections, to_snapshot) -> None:
+    cached = _journal_cache[store]
+    if cached is None or _journal_len[store] >= JOURNAL_CHECKPOINT_EVERY:
+        _checkpoint(store, snapshot_path, journal_path, sections, to_snapshot)
+        return
+    entries = diff_sections(cached, sections)
+    if not entries:
+        return
+    _append_journal(journal_path, entries)
+    _journal_len[store] += len(entries)
+    for e in entries:
+        recs = cached.setdefault(e["s"], {})
+        if e.get("d"):
+            recs.pop(e["k"], None)
+        else:
+            recs[e["k"]] = copy.copy(e["v"])
+
+def _checkpoint(store: str, snapshot_path: Path, journal_path: Path, sections, to_snapshot) -> None:
+    # Snapshot first, truncate after: a crash in between only replays already applied entries
+    atomic_write_json(snapshot_path, to_snapshot(sections))
+    with open(journal_path, "w", encoding="utf-8"):
+        pass
+    _journal_cache[store] = copy_sections(sections)
+    _journal_len[store] = 0
+
+def _items_to_sections(items: List[Item]) -> Dict[str, Dict[Any, Any]]:
+    # Item equality is a field-wise tuple compare, so diffing needs no serialization
+    return {"items": {it.seq_id: it for it in items}}
+
+def _items_snapshot(sections) -> List[Dict[str, Any]]:
+    return [it.to_dict() for it in sections.get("items", {}).values()]
+
+# ---- Backends ----
+# A backend persists the items list and the needs structure.
+class JsonBackend:
+    name = "json"
+
+    def _read(self, path: Path, empty: str) -> Any:
+        _ensure_data_dir()
+        if not path.exists():
+            path.write_text(empty, encoding="utf-8")
+        return loads_json(path.read_bytes())
+
+    def load_items(self) -> List[Item]:
+        return [Item.from_dict(x) for x in self._read(ITEMS_JSON, "[]")]
+
+    def save_items(self, items: List[Item]) -> None:
+        _ensure_data_dir()
+        atomic_write_json(ITEMS_JSON, [i.to_dict() for i in items])
+
+    def load_needs(self) -> Dict[str, Any]:
+        return self._read(NEEDS_JSON, "{}")
+
+    def save_needs(self, needs: Dict[str, Any]) -> None:
+        _ensure_data_dir()
+        atomic_write_json(NEEDS_JSON, needs)
+
+class JournalBackend(JsonBackend):
+    name = "journal"
+
+    def load_items(self) -> List[Item]:
+        sections = {"items": {x.get("seq_id"): x for x in self._read(ITEMS_JSON, "[]")}}
+        entries = _read_journal(ITEMS_JOURNAL)
+        _replay(sections, entries)
+        items = [Item.from_dict(x) for x in sections["items"].values()]
+        _journal_cache["items"] = copy_sections(_items_to_sections(items)); _journal_len["items"] = len(entries)
+        return items
+
+    def save_items(self, items: List[Item]) -> None:
+        _ensure_data_dir()
+        _journal_save("items", ITEMS_JSON, ITEMS_JOURNAL, _items_to_sections(items), _items_snapshot)
+
+    def load_needs(self) -> Dict[str, Any]:
+        sections = needs_to_sections(self._read(NEEDS_JSON, "{}"))
+        entries = _read_journal(NEEDS_JOURNAL)
+        _replay(sections, entries)
+        _journal_cache["needs"] = copy_sections(sections); _journal_len["needs"] = len(entries)
+        return sections_to_needs(sections)
+
+    def save_needs(self, needs: Dict[str, Any]) -> None:
+        _ensure_data_dir()
+        _journal_save("needs", NEEDS_JSON, NEEDS_JOURNAL, needs_to_sections(needs), sections_to_needs)
+
+_backend = None
+# Loads and saves may come from the Tk thread and from the write-behind thread
+_lock = threading.RLock()
 
-def save_items(items: List[Item]) -> None:
+def get_backend():
+    global _backend
+    if _backend is None:
+        set_backend(STORAGE_MODE)
+    return _backend
+
+def set_backend(backend) -> None:
+    """Select the storage backend by name ("json", "journal", "sqlite", "snapshot", "remote") or pass an instance."""
+    global _backend
+    if isinstance(backend, str):
+        if backend == "json":
+            backend = JsonBackend()
+        elif backend == "journal":
+            backend = JournalBackend()
+        elif backend == "sqlite":
+            from storage_sqlite import SqliteBackend
+            backend = SqliteBackend()
+        elif backend == "snapshot":
+            from snapshot import SnapshotBackend
+            backend = SnapshotBackend()
+        elif backend == "remote":
+            from remote import RemoteBackend
+            backend = RemoteBackend()
+        else:
+            raise ValueError(f"Unknown storage backend: {backend}")
+    _backend = backend
+
+# ---- Shared access ----
+# Backends with merge_save()/changes() (remote.RemoteBackend) merge on their server;
+# the others share DATA_DIR and merge here under a file lock.
+_sync_state = {"items": sync.SyncState(), "needs": sync.SyncState()}
+
+def _remote():
+    backend = get_backend()
+    return backend if hasattr(backend, "merge_save") else None
+
+def _store_lock(store: str):
+    if not CONCURRENT_ACCESS or _remote():
+        return contextlib.nullcontext()
+    # A backend keeping both stores in one file names the single lock they share
+    name = getattr(get_backend(), "lock_name", None) or store
+    return sync.FileLock(DATA_DIR / f"{name}.lock")
+
+def _version_path(store: str) -> Path:
+    return DATA_DIR / f"{store}.version"
+
+def store_version(store: str) -> int:
+    remote = _remote()
+    if remote:
+        return remote.version(store)
+    return sync.read_version(_version_path(store))
+
+def adopt(store: str, sections: Dict[str, Dict[Any, Any]], version: int = None, lazy: Dict[str, Any] = None) -> None:
+    """Record `sections` (taken from disk at `version`) as the base our memory derives from."""
+    state = _sync_state[store]
+    state.base = copy_sections(sections)
+    if version is None and _remote():
+        version = _remote().loaded_version(store)
+    state.version = store_version(store) if version is None else version
+    state.in_sync = True; state.renamed = {}; state.lazy_base = dict(lazy or {})
+
+def _touched(base: Dict[str, Dict[Any, Any]], ours: Dict[str, Dict[Any, Any]]):
+    """base and ours reduced to the records that differ between them."""
+    base_sub: Dict[str, Dict[Any, Any]] = {}; ours_sub: Dict[str, Dict[Any, Any]] = {}
+    for e in diff_sections(base, ours):
+        s, k = e["s"], e["k"]
+        if k in base.get(s, {}):
+            base_sub.setdefault(s, {})[k] = base[s][k]
+        if k in ours.get(s, {}):
+            ours_sub.setdefault(s, {})[k] = ours[s][k]
+    return base_sub, ours_sub
+
+def _remote_save(remote, store: str, ours: Dict[str, Dict[Any, Any]]) -> Optional[sync.SaveResult]:
+    state = _sync_state[store]
+    base_sub, ours_sub = _touched(sync.apply_renames(state.base, state.renamed), sync.apply_renames(ours, state.renamed))
+    if not base_sub and not ours_sub:
+        return None
+    result = remote.merge_save(store, base_sub, ours_sub)
+    state.renamed.update(result.renamed)
+    state.base = copy_sections(ours)
+    if result.version == state.version + 1:
+        # Nobody else wrote in between; otherwise the next pull fetches their records
+        state.version = result.version
+    return result
+
+def _shared_save(store: str, ours: Dict[str, Dict[Any, Any]], read, write) -> Optional[sync.SaveResult]:
+    state = _sync_state[store]
+    remote = _remote()
+    if remote and state.base is not None:
+        return _remote_save(remote, store, ours)
+    if not CONCURRENT_ACCESS or remote:
+        write(ours, None)
+        return None
     _ensure_data_dir()
-    with open(ITEMS_JSON, "w", encoding="utf-8") as f:
-        json.dump([i.to_dict() for i in items], f, ensure_ascii=False, indent=2)
+    with _store_lock(store):
+        disk = store_version(store)
+        blind = state.base is None or (disk == state.version and state.in_sync)
+        if not blind:
+            theirs_obj, theirs = read()
+        # Stamp before writing: a crash in between then only makes the next save of
+        # others merge for nothing, where a stale stamp would let them overwrite our data
+        sync.write_version(_version_path(store), disk + 1)
+        if blind:
+            write(ours, None)
+            result = sync.SaveResult(disk + 1)
+            state.base = copy_sections(ours)
+        else:
+            foreign = theirs != state.base
+            merged, conflicts = sync.merge_sections(state.base, ours, theirs, state.renamed)
+            write(merged, theirs_obj)
+            result = sync.SaveResult(disk + 1, True, conflicts, dict(state.renamed))
+            # Later merges only need our changes made after this save
+            state.base = copy_sections(ours)
+            if foreign or state.renamed:
+                # The disk holds records our memory lacks: keep merging until they are adopted
+                state.in_sync = False
+        state.version = result.version
+    return result
+
+def _remote_pull(remote, store: str, ours: Dict[str, Dict[Any, Any]]) -> Optional[sync.Changes]:
+    state = _sync_state[store]
+    version, full, theirs = remote.changes(store, state.version)
+    if version == state.version:
+        return None
+    base, ours = sync.apply_renames(state.base, state.renamed), sync.apply_renames(ours, state.renamed)
+    if full:
+        changes, new_base, _ = sync.rebase(base, ours, theirs, {})
+    else:
+        # Only the records changed since our version, deleted ones as None
+        keys = [(s, k) for s, recs in theirs.items() for k in recs]
+        sub = lambda secs: {s: {k: secs[s][k]} for s, k in keys if k in secs.get(s, {})}
+        live = {s: {k: v for k, v in recs.items() if v is not None} for s, recs in theirs.items()}
+        changes, base_sub, _ = sync.rebase(sub(base), sub(ours), live, {})
+        # Copy only the touched sections, not the whole base
+        new_base = dict(base)
+        for s in {s for s, _ in keys}:
+            new_base[s] = dict(new_base.get(s, {}))
+        for s, k in keys:
+            recs = new_base[s]
+            if k in base_sub.get(s, {}):
+                recs[k] = copy.copy(base_sub[s][k])
+            else:
+                recs.pop(k, None)
+    changes.renamed = dict(state.renamed); changes.version = version
+    state.base = copy_sections(new_base) if full else new_base
+    state.version = version; state.renamed = {}
+    return changes
+
+def _pull(store: str, ours: Dict[str, Dict[Any, Any]], read) -> Optional[sync.Changes]:
+    state = _sync_state[store]
+    remote = _remote()
+    if remote and state.base is not None:
+        return _remote_pull(remote, store, ours)
+    if not CONCURRENT_ACCESS or state.base is None:
+        return None
+    disk = store_version(store)
+    if disk == state.version and state.in_sync:
+        return None
+    theirs_obj, theirs = read()
+    changes, new_base, pending = sync.rebase(state.base, ours, theirs, state.renamed)
+    changes.version = disk
+    state.base = copy_sections(new_base)
+    state.version = disk; state.in_sync = not pending; state.renamed = {}
+    return changes
+
+# ---- Items ----
+def load_items() -> List[Item]:
+    with _lock, _store_lock("items"):
+        items = get_backend().load_items()
+        adopt("items", _items_to_sections(items))
+    return items
+
+def _write_items(sections, _theirs_obj) -> None:
+    get_backend().save_items([v if isinstance(v, Item) else Item.from_dict(v) for v in sections.get("items", {}).values()])
 
-def get_next_seq_id(items: List[Item]) -> int:
-    return (max((i.seq_id for i in items), default=0)) + 1
+def _read_items():
+    items = get_backend().load_items()
+    return items, _items_to_sections(items)
+
+def save_items(items: List[Item]) -> Optional[sync.SaveResult]:
+    with _lock:
+        return _shared_save("items", _items_to_sections(items), _read_items, _write_items)
+
+def pull_items(items: List[Item]) -> Optional[sync.Changes]:
+    """Records of other workstations to apply to `items`; None when there are none."""
+    with _lock, _store_lock("items"):
+        return _pull("items", _items_to_sections(items), _read_items)
 
 def hash_password(pw: str) -> str:
     return hashlib.sha256(pw.encode("utf-8")).hexdigest()
@@ -34,8 +415,7 @@ def load_users() -> List[Dict[str, Any]]:
 
 def save_users(users: List[Dict[str, Any]]) -> None:
     _ensure_data_dir()
-    with open(USERS_JSON, "w", encoding="utf-8") as f:
-        json.dump(users, f, ensure_ascii=False, indent=2)
+    atomic_write_json(USERS_JSON, users)
 
 def ensure_default_admin() -> None:
     users = load_users()
@@ -48,11 +428,9 @@ def ensure_default_admin() -> None:
         })
         save_users(users)
 
-def load_needs() -> Dict[str, Any]:
-    _ensure_data_dir()
-    if not NEEDS_JSON.exists():
-        NEEDS_JSON.write_text("{}", encoding="utf-8")
-    data = json.loads(NEEDS_JSON.read_text(encoding="utf-8"))
+# ---- Needs ----
+def _read_needs() -> Dict[str, Any]:
+    data = get_backend().load_needs()
     from datetime import date
     next_year = date.today().year + 1
     data.setdefault("plan_year", next_year)
@@ -63,34 +441,84 @@ def load_needs() -> Dict[str, Any]:
     data.setdefault("qa_overflow_requests", [])
     data.setdefault("issues", [])
     data.setdefault("store_requests", [])
+    return coerce_needs(data)
+
+def _unloaded(data: Dict[str, Any]) -> Dict[str, Any]:
+    return {k: data[k].unloaded_copy() for k in NEEDS_LISTS if not getattr(data.get(k), "loaded", True)}
+
+def load_needs() -> Dict[str, Any]:
+    with _lock, _store_lock("needs"):
+        data = _read_needs()
+        adopt("needs", needs_to_sections(data, skip_unloaded=True), lazy=_unloaded(data))
     return data
 
-def save_needs(needs: Dict[str, Any]) -> None:
-    _ensure_data_dir()
-    with open(NEEDS_JSON, "w", encoding="utf-8") as f:
-        json.dump(needs, f, ensure_ascii=False, indent=2)
-
-def next_need_id(needs: Dict[str, Any]) -> int:
-    max_id = 0
-    for lst in needs.get("departments", {}).values():
-        for n in lst:
-            max_id = max(max_id, int(n.get("need_id", 0)))
-    return max_id + 1
-
-def next_qa_request_id(needs: Dict[str, Any]) -> int:
-    max_id = 0
-    for r in needs.get("qa_overflow_requests", []):
-        max_id = max(max_id, int(r.get("request_id", 0)))
-    return max_id + 1
-
-def next_issue_id(needs: Dict[str, Any]) -> int:
-    max_id = 0
-    for r in needs.get("issues", []):
-        max_id = max(max_id, int(r.get("issue_id", 0)))
-    return max_id + 1
-
-def next_store_request_id(needs: Dict[str, Any]) -> int:
-    max_id = 0
-    for r in needs.get("store_requests", []):
-        max_id = max(max_id, int(r.get("request_id", 0)))
-    return max_id + 1
+def _write_needs(sections, theirs_obj) -> None:
+    data = sections_to_needs(sections)
+    if theirs_obj is not None:
+        # History lists left undecoded on both sides are written back as they are on disk
+        for k in NEEDS_LISTS:
+            if k not in sections and k in theirs_obj:
+                data[k] = theirs_obj[k]
+    get_backend().save_needs(data)
+
+def _list_section(rows, kind: str) -> Dict[Any, Any]:
+    id_key = NEEDS_LISTS[kind]
+    return {r.get(id_key): r for r in rows}
+
+def _decode_lazy_base(sections: Dict[str, Dict[Any, Any]]) -> None:
+    state = _sync_state["needs"]
+    if state.base is not None:
+        # A history list decoded since the load: its base is decoded now, once
+        for k in NEEDS_LISTS:
+            if k in sections and k not in state.base and k in state.lazy_base:
+                state.base[k] = copy_sections({k: _list_section(state.lazy_base.pop(k), k)})[k]
+
+def save_needs(needs: Dict[str, Any]) -> Optional[sync.SaveResult]:
+    with _lock:
+        if not CONCURRENT_ACCESS and not _remote():
+            get_backend().save_needs(needs)
+            return None
+        sections = needs_to_sections(needs, skip_unloaded=True)
+        _decode_lazy_base(sections)
+
+        def read():
+            data = _read_needs()
+            theirs = needs_to_sections(data, skip_unloaded=True)
+            for k in NEEDS_LISTS:
+                if k in sections and k not in theirs:
+                    theirs[k] = _list_section(data[k], k)
+            return data, theirs
+
+        def write(merged, theirs_obj):
+            if theirs_obj is None:
+                get_backend().save_needs(needs)
+            else:
+                _write_needs(merged, theirs_obj)
+        return _shared_save("needs", sections, read, write)
+
+def pull_needs(needs: Dict[str, Any]) -> Optional[sync.Changes]:
+    """Like pull_items; history lists still undecoded in `needs` come back whole in Changes.lists."""
+    with _lock, _store_lock("needs"):
+        ours = needs_to_sections(needs, skip_unloaded=True)
+        _decode_lazy_base(ours)
+        lists: Dict[str, Any] = {}
+
+        def read():
+            data = _read_needs()
+            theirs = needs_to_sections(data, skip_unloaded=True)
+            for k in NEEDS_LISTS:
+                if k in ours:
+                    theirs.setdefault(k, _list_section(data[k], k))
+                else:
+                    theirs.pop(k, None)
+                    lists[k] = data[k]
+            return data, theirs
+        changes = _pull("needs", ours, read)
+        if changes is not None:
+            lazy_base = _sync_state["needs"].lazy_base
+            for k, lst in lists.items():
+                old = lazy_base.get(k)
+                if old is None or not hasattr(lst, "raw_parts") or lst.raw_parts() != old.raw_parts():
+                    changes.lists[k] = lst
+                lazy_base[k] = lst.unloaded_copy() if hasattr(lst, "unloaded_copy") else list(lst)
+        return changes
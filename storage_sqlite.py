@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+import json, sqlite3, threading
+from dataclasses import fields
+from typing import List, Dict, Any, Optional, Tuple
+from models import Item
+from constants import SQLITE_DB, ITEMS_JSON, NEEDS_JSON, DATA_DIR
+from storage import (
+    JsonBackend, NEEDS_LISTS, DEP_PREFIX,
+    needs_to_sections, sections_to_needs, diff_sections, copy_sections
+)
+
+ITEM_COLUMNS = [f.name for f in fields(Item)]
+NEED_COLUMNS = [
+    "need_id", "category", "item_name", "plan_qty", "remaining_qty", "unit", "qualification",
+    "state_register_no", "cylinder_volume", "certified_value", "purpose", "status", "approved_by_qa", "created"
+]
+QA_REQUEST_COLUMNS = [
+    "request_id", "department", "need_id", "category", "item_name", "requested_qty", "excess_qty",
+    "unit", "status", "created"
+]
+STORE_REQUEST_COLUMNS = [
+    "request_id", "department", "need_id", "requested_qty", "unit", "status", "created", "requested_by"
+]
+ISSUE_COLUMNS = [
+    "issue_id", "department", "need_id", "item_seq_id", "item_name", "category", "qty", "unit", "date", "issued_by"
+]
+
+# table -> (record columns, conflict key); "extra" keeps keys unknown to the schema as JSON
+TABLES: Dict[str, Tuple[List[str], str]] = {
+    "items": (ITEM_COLUMNS, "seq_id"),
+    "needs": (["department"] + NEED_COLUMNS, "department, need_id"),
+    "qa_overflow_requests": (QA_REQUEST_COLUMNS, "request_id"),
+    "store_requests": (STORE_REQUEST_COLUMNS, "request_id"),
+    "issues": (ISSUE_COLUMNS, "issue_id"),
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS items (
+    seq_id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT, category TEXT, quantity REAL, unit TEXT,
+    storage_place TEXT, packaging TEXT, expiry_date TEXT, date_received TEXT, batch_number TEXT,
+    responsible TEXT, qualification TEXT, reagent_type TEXT, state_register_no TEXT, certified_value TEXT,
+    manufacture_date TEXT, manufacturer TEXT, storage_conditions TEXT, extra TEXT
+);
+CREATE INDEX IF NOT EXISTS ix_items_category_name ON items(category, name);
+CREATE TABLE IF NOT EXISTS needs (
+    department TEXT NOT NULL, need_id INTEGER NOT NULL, category TEXT, item_name TEXT, plan_qty REAL,
+    remaining_qty REAL, unit TEXT, qualification TEXT, state_register_no TEXT, cylinder_volume TEXT,
+    certified_value TEXT, purpose TEXT, status TEXT, approved_by_qa INTEGER, created TEXT, extra TEXT,
+    PRIMARY KEY (department, need_id)
+);
+CREATE INDEX IF NOT EXISTS ix_needs_need_id ON needs(need_id);
+CREATE INDEX IF NOT EXISTS ix_needs_category_item ON needs(category, item_name);
+CREATE TABLE IF NOT EXISTS qa_overflow_requests (
+    request_id INTEGER PRIMARY KEY AUTOINCREMENT, department TEXT, need_id INTEGER, category TEXT,
+    item_name TEXT, requested_qty REAL, excess_qty REAL, unit TEXT, status TEXT, created TEXT, extra TEXT
+);
+CREATE INDEX IF NOT EXISTS ix_qa_requests_need ON qa_overflow_requests(department, need_id);
+CREATE TABLE IF NOT EXISTS store_requests (
+    request_id INTEGER PRIMARY KEY AUTOINCREMENT, department TEXT, need_id INTEGER, requested_qty REAL,
+    unit TEXT, status TEXT, created TEXT, requested_by TEXT, extra TEXT
+);
+CREATE INDEX IF NOT EXISTS ix_store_requests_need ON store_requests(department, need_id);
+CREATE TABLE IF NOT EXISTS issues (
+    issue_id INTEGER PRIMARY KEY AUTOINCREMENT, department TEXT, need_id INTEGER, item_seq_id INTEGER,
+    item_name TEXT, category TEXT, qty REAL, unit TEXT, date TEXT, issued_by TEXT, extra TEXT
+);
+CREATE INDEX IF NOT EXISTS ix_issues_need ON issues(department, need_id);
+"""
+
+def _to_row(columns: List[str], rec: Dict[str, Any]) -> List[Any]:
+    row = [rec.get(c) for c in columns]
+    extra = {k: v for k, v in rec.items() if k not in columns}
+    row.append(json.dumps(extra, ensure_ascii=False) if extra else None)
+    return row
+
+def _from_row(columns: List[str], row: sqlite3.Row) -> Dict[str, Any]:
+    rec = {c: row[c] for c in columns}
+    if "approved_by_qa" in rec and rec["approved_by_qa"] is not None:
+        rec["approved_by_qa"] = bool(rec["approved_by_qa"])
+    if row["extra"]:
+        rec.update(json.loads(row["extra"]))
+    return rec
+
+class SqliteBackend:
+    name = "sqlite"
+
+    def __init__(self, path=SQLITE_DB):
+        DATA_DIR.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.RLock()
+        self._cache: Dict[str, Optional[Dict[str, Dict[Any, Any]]]] = {"items": None, "needs": None}
+        self.conn = sqlite3.connect(str(path), check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(SCHEMA)
+        if self.conn.execute("SELECT 1 FROM meta WHERE key='__imported'").fetchone() is None:
+            self._import_json()
+
+    def _import_json(self) -> None:
+        # First start on an existing data folder: take over items.json / needs.json
+        src = JsonBackend()
+        items = src.load_items() if ITEMS_JSON.exists() else []
+        needs = src.load_needs() if NEEDS_JSON.exists() else {}
+        with self.conn:
+            self._write({}, {"items": {it.seq_id: it.to_dict() for it in items}})
+            self._write({}, needs_to_sections(needs))
+            self.conn.execute("INSERT INTO meta(key, value) VALUES ('__imported', 'true')")
+
+    # ---- write path ----
+    def _upsert(self, table: str, rec: Dict[str, Any]) -> None:
+        columns, key = TABLES[table]
+        cols = columns + ["extra"]
+        updates = ", ".join(f"{c}=excluded.{c}" for c in cols if c not in key.split(", "))
+        self.conn.execute(
+            f"INSERT INTO {table} ({', '.join(cols)}) VALUES ({', '.join('?' * len(cols))}) "
+            f"ON CONFLICT({key}) DO UPDATE SET {updates}", _to_row(columns, rec))
+
+    def _apply(self, section: str, key: Any, value: Any, deleted: bool) -> None:
+        if section == "meta":
+            if deleted:
+                self.conn.execute("DELETE FROM meta WHERE key=?", (key,))
+            else:
+                self.conn.execute("INSERT OR REPLACE INTO meta(key, value) VALUES (?, ?)", (key, json.dumps(value, ensure_ascii=False)))
+        elif section.startswith(DEP_PREFIX):
+            dep = section[len(DEP_PREFIX):]
+            if deleted:
+                self.conn.execute("DELETE FROM needs WHERE department=? AND need_id=?", (dep, key))
+            else:
+                self._upsert("needs", {"department": dep, **value})
+        else:
+            if deleted:
+                self.conn.execute(f"DELETE FROM {section} WHERE {TABLES[section][1]}=?", (key,))
+            else:
+                self._upsert(section, value.to_dict() if isinstance(value, Item) else value)
+
+    def _write(self, cached: Dict[str, Dict[Any, Any]], sections: Dict[str, Dict[Any, Any]]) -> None:
+        for e in diff_sections(cached, sections):
+            self._apply(e["s"], e["k"], e.get("v"), bool(e.get("d")))
+
+    def _save(self, store: str, sections: Dict[str, Dict[Any, Any]]) -> None:
+        with self._lock:
+            if self._cache[store] is None:
+                (self.load_items if store == "items" else self.load_needs)()
+            with self.conn:
+                self._write(self._cache[store], sections)
+            self._cache[store] = copy_sections(sections)
+
+    # ---- read path ----
+    def load_items(self) -> List[Item]:
+        with self._lock:
+            rows = self.conn.execute("SELECT * FROM items ORDER BY seq_id").fetchall()
+            items = [Item.from_dict(_from_row(ITEM_COLUMNS, r)) for r in rows]
+            self._cache["items"] = copy_sections({"items": {it.seq_id: it for it in items}})
+            return items
+
+    def save_items(self, items: List[Item]) -> None:
+        self._save("items", {"items": {it.seq_id: it for it in items}})
+
+    def load_needs(self) -> Dict[str, Any]:
+        with self._lock:
+            sections: Dict[str, Dict[Any, Any]] = {"meta": {}}
+            for r in self.conn.execute("SELECT key, value FROM meta WHERE key NOT LIKE '\\_\\_%' ESCAPE '\\'"):
+                sections["meta"][r["key"]] = json.loads(r["value"])
+            for r in self.conn.execute("SELECT * FROM needs ORDER BY rowid"):
+                sections.setdefault(DEP_PREFIX + r["department"], {})[r["need_id"]] = _from_row(NEED_COLUMNS, r)
+            for table, id_key in NEEDS_LISTS.items():
+                columns = TABLES[table][0]
+                sections[table] = {r[id_key]: _from_row(columns, r) for r in self.conn.execute(f"SELECT * FROM {table} ORDER BY {id_key}")}
+            self._cache["needs"] = copy_sections(sections)
+            return sections_to_needs(sections)
+
+    def save_needs(self, needs: Dict[str, Any]) -> None:
+        self._save("needs", needs_to_sections(needs))
@@ -0,0 +1,259 @@
+# -*- coding: utf-8 -*-
+"""Multi-workstation access to one shared data folder.
+
+Every store has a sidecar "<store>.version" stamp and a "<store>.lock" file. A save takes
+the store's lock only for version check + write: when nobody else wrote since our last
+save it writes straight away, otherwise it reloads the store and does a record-level
+three-way merge of base (the state our memory derives from), ours and theirs.
+"""
+from __future__ import annotations
+import os, time, copy
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import List, Dict, Any, Optional, Tuple, Callable
+
+# Counters that several workstations decrement concurrently: merged as theirs + our delta
+ADDITIVE_FIELDS = {"quantity", "remaining_qty"}
+# section -> id field; need ids are unique across all department sections
+ID_FIELDS = {"items": "seq_id", "qa_overflow_requests": "request_id", "store_requests": "request_id", "issues": "issue_id"}
+DEP_PREFIX = "dep:"
+# History fields pointing at a record of another section -> that section, from the referring record
+REFERENCES: Dict[str, Callable[[Any], str]] = {
+    "need_id": lambda r: DEP_PREFIX + str(r.get("department")),
+    "item_seq_id": lambda r: "items",
+}
+REFERRING_SECTIONS = ("qa_overflow_requests", "store_requests", "issues")
+
+class LockTimeout(Exception):
+    pass
+
+class FileLock:
+    """Cross-process advisory lock on a small lock file (fcntl on POSIX, msvcrt on Windows)."""
+
+    def __init__(self, path: Path, timeout: float = 30.0):
+        self.path = path; self.timeout = timeout; self._f = None
+
+    def __enter__(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._f = open(self.path, "a+b")
+        deadline = time.monotonic() + self.timeout; delay = 0.005
+        while True:
+            try:
+                _lock(self._f)
+                return self
+            except OSError:
+                if time.monotonic() >= deadline:
+                    self._f.close(); self._f = None
+                    raise LockTimeout(f"{self.path.name}: данные заняты другим рабочим местом")
+                time.sleep(delay); delay = min(delay * 2, 0.2)
+
+    def __exit__(self, *exc):
+        try:
+            _unlock(self._f)
+        finally:
+            self._f.close(); self._f = None
+
+if os.name == "nt":
+    import msvcrt
+
+    def _lock(f):
+        f.seek(0); msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+
+    def _unlock(f):
+        f.seek(0); msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+else:
+    import fcntl
+
+    def _lock(f):
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+    def _unlock(f):
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+def read_version(path: Path) -> int:
+    try:
+        return int(path.read_text(encoding="ascii").strip() or 0)
+    except (OSError, ValueError):
+        return 0
+
+def write_version(path: Path, version: int) -> None:
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    tmp.write_text(str(version), encoding="ascii")
+    os.replace(tmp, path)
+
+@dataclass
+class SyncState:
+    version: int = -1
+    # sections our in-memory state was derived from; None until the store is loaded
+    base: Optional[Dict[str, Dict[Any, Any]]] = None
+    # True while the disk holds nothing but base + our own changes
+    in_sync: bool = True
+    # our new records that were given another id because someone else took theirs
+    renamed: Dict[Tuple[str, Any], Any] = field(default_factory=dict)
+    # base of lazily decoded sections, decoded only once our side touches them
+    lazy_base: Dict[str, Any] = field(default_factory=dict)
+
+@dataclass
+class SaveResult:
+    version: int
+    merged: bool = False
+    conflicts: List[str] = field(default_factory=list)
+    renamed: Dict[Tuple[str, Any], Any] = field(default_factory=dict)
+
+@dataclass
+class Changes:
+    """Records others wrote since our memory was last brought up to date."""
+    version: int = 0
+    # (section, key, record); record is None for a deleted one
+    records: List[Tuple[str, Any, Any]] = field(default_factory=list)
+    # our records that were stored under another id, applied before `records`
+    renamed: Dict[Tuple[str, Any], Any] = field(default_factory=dict)
+    # undecoded history lists replaced as a whole
+    lists: Dict[str, Any] = field(default_factory=dict)
+
+    def __bool__(self) -> bool:
+        return bool(self.records or self.renamed or self.lists)
+
+_MISSING = object()
+
+def _as_dict(v: Any) -> Any:
+    return v.to_dict() if hasattr(v, "to_dict") else v
+
+def _namespace(section: str) -> str:
+    return "needs" if section.startswith(DEP_PREFIX) else section
+
+def _id_field(section: str) -> Optional[str]:
+    return "need_id" if section.startswith(DEP_PREFIX) else ID_FIELDS.get(section)
+
+def _merge_record(label: str, base: Any, ours: Any, theirs: Any, conflicts: List[str]) -> Any:
+    if ours == theirs or ours == base:
+        return theirs
+    if theirs == base:
+        return ours
+    b, o, t = _as_dict(base), _as_dict(ours), _as_dict(theirs)
+    if not (isinstance(b, dict) and isinstance(o, dict) and isinstance(t, dict)):
+        conflicts.append(label)
+        return theirs
+    merged = dict(t)
+    for k in set(o) | set(t):
+        bv, ov, tv = b.get(k, _MISSING), o.get(k, _MISSING), t.get(k, _MISSING)
+        if ov == bv or ov == tv:
+            continue
+        if tv == bv:
+            merged[k] = ov
+        elif k in ADDITIVE_FIELDS and isinstance(bv, (int, float)) and isinstance(ov, (int, float)) and isinstance(tv, (int, float)):
+            merged[k] = tv + (ov - bv)
+        else:
+            conflicts.append(f"{label}: {k}")
+    return merged
+
+def merge_sections(base: Dict[str, Dict[Any, Any]], ours: Dict[str, Dict[Any, Any]], theirs: Dict[str, Dict[Any, Any]],
+                   renamed: Dict[Tuple[str, Any], Any], id_max: Optional[Dict[str, int]] = None) -> Tuple[Dict[str, Dict[Any, Any]], List[str]]:
+    """Record-level three-way merge. Records changed on one side only are taken from that
+    side, different fields of one record are combined, and only the same field changed
+    two ways is a conflict (resolved in favour of the already saved value). Our new
+    records whose id was taken meanwhile get a fresh id, recorded in `renamed` and
+    applied to base and ours on every later merge until memory adopts the disk state;
+    our records pointing at them (REFERENCES) are rewritten along. When theirs holds
+    only the records touched by ours, `id_max` gives the largest id in use per id
+    namespace ("items", "needs", "issues", ...) for renumbering."""
+    conflicts: List[str] = []
+    used: Dict[str, set] = {ns: {i} for ns, i in (id_max or {}).items()}
+    for s, recs in list(theirs.items()) + list(ours.items()):
+        used.setdefault(_namespace(s), set()).update(recs.keys())
+    # Ids are settled before merging, so references to a renumbered record follow it
+    known_base = apply_renames(base, renamed)
+    for s, o in apply_renames(ours, renamed).items():
+        b, t = known_base.get(s, {}), theirs.get(s, {})
+        id_field = _id_field(s)
+        for k, ov in o.items():
+            if k in b or k not in t or t[k] == ov or not (id_field and isinstance(k, int)):
+                continue
+            ns = _namespace(s); new_id = max(i for i in used[ns] if isinstance(i, int)) + 1
+            used[ns].add(new_id); renamed[(s, k)] = new_id
+    base, ours = apply_renames(base, renamed), apply_renames(ours, renamed)
+    merged = {s: dict(recs) for s, recs in theirs.items()}
+    for s in set(base) | set(ours):
+        b, o = base.get(s, {}), ours.get(s, {})
+        t = merged.setdefault(s, {})
+        for k, ov in o.items():
+            bv = b.get(k, _MISSING)
+            tv = t.get(k, _MISSING)
+            if bv is _MISSING:
+                if tv is _MISSING or tv == ov:
+                    t[k] = ov
+                else:
+                    conflicts.append(f"{s}/{k}")
+            elif tv is _MISSING:
+                if ov != bv:
+                    conflicts.append(f"{s}/{k}: удалено другим пользователем")
+            else:
+                t[k] = _merge_record(f"{s}/{k}", bv, ov, tv, conflicts)
+        for k, bv in b.items():
+            if k not in o and k in t:
+                if t[k] == bv:
+                    del t[k]
+                else:
+                    conflicts.append(f"{s}/{k}: изменено другим пользователем")
+    return merged, conflicts
+
+def apply_renames(sections: Dict[str, Dict[Any, Any]], renamed: Dict[Tuple[str, Any], Any]) -> Dict[str, Dict[Any, Any]]:
+    """`sections` with the renamed records under their new ids and the references to them rewritten."""
+    if not renamed:
+        return sections
+    result = {}
+    for s, recs in sections.items():
+        id_field = _id_field(s)
+        refers = s in REFERRING_SECTIONS
+        if refers or any((s, k) in renamed for k in recs):
+            new = {}
+            for k, v in recs.items():
+                changes = renamed_references(v, renamed) if refers else {}
+                if (s, k) in renamed:
+                    k = renamed[(s, k)]; changes[id_field] = k
+                new[k] = _with_fields(v, changes) if changes else v
+            recs = new
+        result[s] = recs
+    return result
+
+def renamed_references(rec: Any, renamed: Dict[Tuple[str, Any], Any]) -> Dict[str, Any]:
+    """field -> new id for the REFERENCES of a history record that point at a renamed record."""
+    changes = {}
+    for f, target in REFERENCES.items():
+        v = rec.get(f)
+        if v is not None and (target(rec), v) in renamed:
+            changes[f] = renamed[(target(rec), v)]
+    return changes
+
+def _with_fields(rec: Any, changes: Dict[str, Any]) -> Any:
+    if hasattr(rec, "to_dict"):
+        rec = copy.copy(rec)
+        for f, v in changes.items():
+            setattr(rec, f, v)
+        return rec
+    return {**rec, **changes}
+
+def rebase(base: Dict[str, Dict[Any, Any]], ours: Dict[str, Dict[Any, Any]], theirs: Dict[str, Dict[Any, Any]],
+           renamed: Dict[Tuple[str, Any], Any]) -> Tuple[Changes, Dict[str, Dict[Any, Any]], bool]:
+    """Bring memory up to `theirs` without touching records with unsaved changes of ours.
+
+    Returns the changes to apply to memory, the new base and whether a later save still has
+    to merge (some record changed on both sides keeps its old base until then)."""
+    base, ours = apply_renames(base, renamed), apply_renames(ours, renamed)
+    changes = Changes(renamed=dict(renamed)); new_base: Dict[str, Dict[Any, Any]] = {}; pending = False
+    for s in set(base) | set(ours) | set(theirs):
+        b, o, t = base.get(s, {}), ours.get(s, {}), theirs.get(s, {})
+        nb = new_base[s] = {}
+        for k in set(b) | set(o) | set(t):
+            bv, ov, tv = b.get(k, _MISSING), o.get(k, _MISSING), t.get(k, _MISSING)
+            if ov == bv and tv != ov:
+                changes.records.append((s, k, None if tv is _MISSING else tv))
+            elif ov != bv and ov != tv:
+                # Unsaved change of ours: keep its base so the next save merges it
+                if bv is not _MISSING:
+                    nb[k] = bv
+                pending = pending or tv != bv
+                continue
+            if tv is not _MISSING:
+                nb[k] = tv
+    return changes, new_base, pending
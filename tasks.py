@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+"""Short blocking calls (file loads, the users file) on a thread pool, with their results
+handed back to the Tk thread.
+
+submit() returns a Future at once; poll(), called from root.after on the UI thread, runs
+the callbacks of the finished ones there, in submission order. Task functions only read
+and return values; whatever changes application state is done by the callback. The
+callbacks run one at a time on the UI thread, so each one commits its changes as a whole,
+between two Tk events, and never sees another callback's half-applied state.
+
+Tasks submitted with serial=True run one at a time, in submission order, on a worker of
+their own: writes of one file (the users file) never overlap or overtake each other.
+
+submit() and poll() are for the UI thread only. Long jobs with progress and cancel
+(exports) go through jobs.JobRunner instead.
+"""
+from __future__ import annotations
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable, List, Optional
+
+@dataclass(eq=False)
+class _Task:
+    future: Future
+    on_done: Optional[Callable[[Any], None]]
+    on_error: Optional[Callable[[BaseException], None]]
+    busy: str
+
+class TaskExecutor:
+    def __init__(self, workers: int = 4, on_error: Optional[Callable[[BaseException], None]] = None):
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="task")
+        self._serial = ThreadPoolExecutor(max_workers=1, thread_name_prefix="task-serial")
+        self._tasks: List[_Task] = []
+        # Called for failed tasks that have no on_error of their own
+        self.on_error = on_error
+
+    def submit(self, fn: Callable[..., Any], *args, on_done: Callable[[Any], None] = None,
+               on_error: Callable[[BaseException], None] = None, busy: str = "", serial: bool = False) -> Future:
+        """Run fn(*args) on the pool; on_done(result) or on_error(exception) is called
+        from poll(). A non-empty `busy` text is shown while the task runs (see busy()).
+        Serial tasks run after every serial task submitted before them has finished."""
+        pool = self._serial if serial else self._pool
+        task = _Task(pool.submit(fn, *args), on_done, on_error, busy)
+        self._tasks.append(task)
+        return task.future
+
+    def busy(self) -> List[str]:
+        """Busy texts of the unfinished tasks, oldest first."""
+        return [t.busy for t in self._tasks if t.busy]
+
+    def pending(self) -> int:
+        return len(self._tasks)
+
+    def poll(self) -> int:
+        """Run the callbacks of the tasks finished so far, in submission order; a task
+        still running holds back the ones submitted after it. Returns how many ran."""
+        n = 0
+        while self._tasks and self._tasks[0].future.done():
+            task = self._tasks.pop(0); n += 1
+            error = task.future.exception()
+            if error is None:
+                if task.on_done is not None:
+                    task.on_done(task.future.result())
+            elif task.on_error is not None:
+                task.on_error(error)
+            elif self.on_error is not None:
+                self.on_error(error)
+        return n
+
+    def close(self, wait: bool = True) -> None:
+        # Waiting lets queued tasks (a users file save) finish as well
+        self._pool.shutdown(wait=wait, cancel_futures=not wait)
+        self._serial.shutdown(wait=wait, cancel_futures=not wait)
@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+import sys
+from pathlib import Path
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import constants, storage, sync
+
+# Modules that took the data paths from constants by name
+_PATH_USERS = ("storage", "storage_sqlite", "snapshot", "archive", "watcher")
+
+@pytest.fixture
+def data_dir(tmp_path, monkeypatch):
+    """A private data folder for storage, with fresh backend and sync state."""
+    paths = {
+        "DATA_DIR": tmp_path,
+        "ITEMS_JSON": tmp_path / "items.json", "USERS_JSON": tmp_path / "users.json", "NEEDS_JSON": tmp_path / "needs.json",
+        "ITEMS_JOURNAL": tmp_path / "items.journal", "NEEDS_JOURNAL": tmp_path / "needs.journal",
+        "SQLITE_DB": tmp_path / "lab.sqlite3", "SNAPSHOT_FILE": tmp_path / "lab.snap",
+        "ARCHIVE_DIR": tmp_path / "archive", "ARCHIVE_INDEX": tmp_path / "archive" / "index.json",
+    }
+    for name, path in paths.items():
+        monkeypatch.setattr(constants, name, path)
+    for mod in _PATH_USERS:
+        module = sys.modules.get(mod) or __import__(mod)
+        for name, path in paths.items():
+            if hasattr(module, name):
+                monkeypatch.setattr(module, name, path)
+    monkeypatch.setattr(storage, "_backend", None)
+    monkeypatch.setattr(storage, "_sync_state", {"items": sync.SyncState(), "needs": sync.SyncState()})
+    monkeypatch.setattr(storage, "_journal_cache", {"items": None, "needs": None})
+    monkeypatch.setattr(storage, "_journal_len", {"items": 0, "needs": 0})
+    return tmp_path
+
+def make_item(seq_id: int, **fields):
+    from models import Item
+    d = {"seq_id": seq_id, "name": f"Реактив {seq_id}", "category": "Реактивы", "quantity": 10.0, "unit": "шт",
+         "storage_place": "Шкаф 1", "packaging": "", "date_received": "2025-01-10", "batch_number": str(seq_id),
+         "responsible": "Иванов"}
+    d.update(fields)
+    return Item.from_dict(d)
+
+class Workstation:
+    """Sync state of one workstation; storage calls made inside `with` act as that one."""
+
+    def __init__(self):
+        self.state = {"items": sync.SyncState(), "needs": sync.SyncState()}
+
+    def __enter__(self):
+        self._saved = storage._sync_state
+        storage._sync_state = self.state
+        return self
+
+    def __exit__(self, *exc):
+        storage._sync_state = self._saved
+
+@pytest.fixture
+def workstations(data_dir, monkeypatch):
+    """Two workstations sharing the data folder, with concurrent access switched on."""
+    monkeypatch.setattr(storage, "CONCURRENT_ACCESS", True)
+    return Workstation(), Workstation()
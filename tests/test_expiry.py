@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+from datetime import date
+from expiry import ExpiryIndex, EXPIRED, SOON, classify, to_ordinal
+from conftest import make_item
+
+DAY = date(2026, 3, 10).toordinal()
+
+def _index(soon_days=30):
+    items = [make_item(1, expiry_date="2026-03-01"), make_item(2, expiry_date="2026-03-10"),
+             make_item(3, expiry_date="2026-04-09"), make_item(4, expiry_date="2026-04-10"),
+             make_item(5, expiry_date=None), make_item(6, expiry_date="10.03.2026")]
+    return ExpiryIndex(items, soon_days=soon_days)
+
+def test_to_ordinal_rejects_other_formats():
+    assert to_ordinal("2026-03-10") == DAY
+    assert to_ordinal("10.03.2026") is None
+    assert to_ordinal("2026-02-30") is None
+    assert to_ordinal("") is None and to_ordinal(None) is None
+
+def test_status_and_ranges():
+    idx = _index()
+    assert len(idx) == 4
+    assert [idx.status(s, DAY) for s in range(1, 7)] == [EXPIRED, SOON, SOON, "", "", ""]
+    assert idx.expired(DAY) == [1]
+    assert idx.expiring_within(30, DAY) == [2, 3]
+    assert classify(None, DAY) == ""
+
+def test_add_and_discard_keep_the_order():
+    idx = _index()
+    idx.add(make_item(3, expiry_date="2026-01-01"))
+    assert idx.expired(DAY) == [3, 1]
+    idx.discard(1); idx.discard(99)
+    assert idx.expired(DAY) == [3]
+    idx.add_many([make_item(7, expiry_date="2026-03-11"), make_item(8, expiry_date="")])
+    assert idx.expiring_within(30, DAY) == [2, 7]
+
+def test_crossed_matches_a_full_rescan():
+    idx = _index()
+    for old, new in ((DAY, DAY + 1), (DAY - 5, DAY + 3), (DAY + 1, DAY), (DAY, DAY)):
+        changed = {s for s in range(1, 7) if idx.status(s, old) != idx.status(s, new)}
+        assert idx.crossed(old, new) == changed
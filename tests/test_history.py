@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+import random
+from history import HistoryIndex
+
+DEPTS = ["Отдел по анализу воды", "Отдел по анализу почв"]
+STATUSES = ["new", "issued", "rejected"]
+NAMES = ["Хлорид натрия", "Соляная кислота", "Ацетон", "Натрий сернокислый"]
+
+def _rows(n, seed=3):
+    rnd = random.Random(seed)
+    return [{"request_id": i, "department": rnd.choice(DEPTS), "status": rnd.choice(STATUSES),
+             "need_id": rnd.randrange(len(NAMES)),
+             "created": f"2026-{rnd.randint(1, 12):02d}-{rnd.randint(1, 28):02d} {rnd.randint(0, 23):02d}:00"}
+            for i in range(1, n + 1)]
+
+def _scan(rows, department=None, status=None, text="", date_from=None, date_to=None):
+    out = [r for r in rows
+           if (not department or r["department"] == department) and (not status or r["status"] == status)
+           and text.strip().lower() in NAMES[r["need_id"]].lower()
+           and (not date_from or r["created"] >= date_from) and (not date_to or r["created"][:10] <= date_to)]
+    out.sort(key=lambda r: (r["created"], r["request_id"]), reverse=True)
+    return [r["request_id"] for r in out]
+
+def test_query_agrees_with_a_plain_scan():
+    rows = _rows(400)
+    idx = HistoryIndex(rows, lambda r: NAMES[r["need_id"]])
+    assert len(idx) == 400
+    rnd = random.Random(5)
+    for _ in range(200):
+        f = {"department": rnd.choice(DEPTS + [None]), "status": rnd.choice(STATUSES + [None]),
+             "text": rnd.choice(["", "натр", "КИСЛ", "нет", " ац "]),
+             "date_from": rnd.choice([None, "2026-03-01", "2026-06-15"]),
+             "date_to": rnd.choice([None, "2026-06-15", "2026-09-30"])}
+        got = [idx.rows[p]["request_id"] for p in idx.query(**f)]
+        assert got == _scan(rows, **f), f
+
+def test_date_bounds_are_inclusive_and_empty_ranges_return_nothing():
+    rows = [{"request_id": 1, "created": "2026-05-01 09:00"}, {"request_id": 2, "created": "2026-05-02 18:30"},
+            {"request_id": 3, "created": None}]
+    idx = HistoryIndex(rows, lambda r: "")
+    assert [idx.rows[p]["request_id"] for p in idx.query(date_from="2026-05-01", date_to="2026-05-02")] == [2, 1]
+    assert [idx.rows[p]["request_id"] for p in idx.query()] == [2, 1, 3]
+    assert idx.query(date_from="2026-06-01", date_to="2026-05-01") == []
@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+import pytest
+
+pd = pytest.importorskip("pandas")
+import imports
+from conftest import make_item
+
+HEADER = "Наименование;Категория;Количество;Ед. изм.;Срок годности;Номер партии;Квалификация"
+
+def _csv(tmp_path, *lines):
+    path = tmp_path / "lots.csv"
+    path.write_text("\n".join((HEADER,) + lines) + "\n", encoding="utf-8-sig")
+    return path
+
+def test_valid_rows_become_item_dicts(tmp_path):
+    path = _csv(tmp_path,
+                "Соль;Реактивы;2,5;г;31.12.2027;П1;х.ч.",
+                "Ацетон;Реактивы;1 000;мл;2027-06-01;П2;")
+    result = imports.read_stock(str(path), {})
+    assert result.errors == [] and result.total == 2
+    salt, acetone = result.records
+    assert (salt["name"], salt["quantity"], salt["expiry_date"], salt["qualification"]) == ("Соль", 2.5, "2027-12-31", "х.ч.")
+    assert (acetone["quantity"], acetone["qualification"], acetone["date_received"]) == (1000.0, None, None)
+    assert "seq_id" not in salt
+
+def test_every_problem_of_a_row_is_reported_by_file_row(tmp_path):
+    path = _csv(tmp_path,
+                "Соль;Реактивы;2;г;;П1;",
+                ";Реактивы;-1;кг;31.02.2027;П2;",
+                "Соль;Реактивы;3;г;;П1;",
+                "Спирт;Реактивы;1;бочка;;П3;грязный",
+                "Кислота;Реактивы;1;л;;П9;")
+    existing = imports.stock_keys([make_item(42, name="Кислота", batch_number="П9")])
+    result = imports.read_stock(str(path), existing)
+    assert [r["name"] for r in result.records] == ["Соль"]
+    errors = {row: msg for _, row, msg in result.errors}
+    assert sorted(errors) == [3, 4, 5, 6]
+    assert "не заполнено поле «Наименование»" in errors[3]
+    assert "«-1»" in errors[3] and "«31.02.2027»" in errors[3]
+    assert errors[4] == "повтор строки 2 (категория, наименование, партия)"
+    assert "«бочка»" in errors[5] and "«грязный»" in errors[5]
+    assert errors[6] == "партия уже есть на складе (ID 42)"
+
+def test_missing_required_column_stops_validation():
+    df = pd.DataFrame({"name": ["Соль"], "_sheet": ["s"], "_row": [2]})
+    result = imports.validate(df, {})
+    assert result.records == []
+    assert result.errors == [("", 1, "Нет столбцов: Количество, Ед. изм.")]
+
+def test_xlsx_sheet_name_gives_the_category(tmp_path):
+    pytest.importorskip("openpyxl")
+    path = tmp_path / "stock.xlsx"
+    with pd.ExcelWriter(path) as xw:
+        pd.DataFrame({"Наименование": ["Соль"], "Количество": [3.0], "Ед. изм.": ["г"], "Номер партии": [17.0],
+                      "Срок годности": [pd.Timestamp("2027-01-05")]}).to_excel(xw, sheet_name="Реактивы", index=False)
+    result = imports.read_stock(str(path), {})
+    assert result.errors == []
+    rec = result.records[0]
+    assert (rec["category"], rec["batch_number"], rec["expiry_date"]) == ("Реактивы", "17", "2027-01-05")
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+import copy, pickle, tracemalloc
+import pytest
+import models
+from models import Item, ItemTable, Need, Issue, StoreRequest, coerce_needs
+from conftest import make_item
+
+def test_item_codec_round_trip_and_defaults():
+    d = make_item(3, expiry_date="2027-01-01").to_dict()
+    assert Item.from_dict(d) == make_item(3, expiry_date="2027-01-01")
+    assert list(d) == [f for f in Item.__dataclass_fields__]
+    minimal = Item.from_dict({"seq_id": 1, "name": "Соль", "category": "Реактивы", "quantity": 1, "unit": "г",
+                              "storage_place": "", "unknown": "ignored"})
+    assert (minimal.packaging, minimal.expiry_date, minimal.batch_number) == ("", None, "")
+    with pytest.raises(KeyError):
+        Item.from_dict({"seq_id": 1, "name": "Соль"})
+
+def test_record_coerces_once_at_load():
+    need = Need.from_dict({"need_id": "7", "plan_qty": "2.5", "item_name": "Соль"})
+    assert (need.need_id, need.plan_qty, need.remaining_qty, need.approved_by_qa) == (7, 2.5, 0.0, False)
+    need["remaining_qty"] = "1"
+    assert need.remaining_qty == 1.0
+    # Values that do not parse are kept as they are rather than lost
+    assert Need.from_dict({"need_id": "abc"}).need_id == "abc"
+
+def test_record_keeps_unknown_keys_in_extra():
+    d = {"issue_id": 4, "qty": 1, "note": "срочно"}
+    issue = Issue.from_dict(d)
+    assert issue["note"] == "срочно" and "note" in issue
+    assert issue.to_dict() == {**{f: None for f in Issue.FIELDS}, "issue_id": 4, "qty": 1.0, "note": "срочно"}
+    assert list(issue)[-1] == "note"
+    del issue["note"]
+    assert "note" not in issue and issue.get("note", "-") == "-"
+    with pytest.raises(KeyError):
+        issue["missing"]
+
+def test_record_equality_copy_and_pickle():
+    req = StoreRequest.from_dict({"request_id": 1, "requested_qty": 2, "status": "new", "x": 1})
+    assert req == req.to_dict()
+    assert req != StoreRequest.from_dict({"request_id": 1, "requested_qty": 2, "status": "new"})
+    clone = copy.copy(req)
+    clone["x"] = 2; clone.status = "done"
+    assert (req["x"], req.status) == (1, "new")
+    assert pickle.loads(pickle.dumps(req)) == req
+    assert StoreRequest.from_dict(req) is req
+
+def test_coerce_needs_types_every_list():
+    data = coerce_needs({"departments": {"А": [{"need_id": "1"}]}, "issues": [{"issue_id": "2"}], "store_requests": []})
+    assert isinstance(data["departments"]["А"][0], Need) and data["departments"]["А"][0].need_id == 1
+    assert isinstance(data["issues"][0], Issue) and data["issues"][0].issue_id == 2
+    assert "qa_overflow_requests" not in data
+
+def _stock(n):
+    return [make_item(i, unit="мл" if i % 3 else "л", storage_place=f"Шкаф {i % 12}",
+                      expiry_date=f"2027-01-{i % 28 + 1:02d}", qualification="х.ч." if i % 2 else None) for i in range(1, n + 1)]
+
+def test_item_table_rows_read_and_write_like_items():
+    items = _stock(5)
+    table = ItemTable(items)
+    assert len(table) == 5 and table.to_items() == items
+    assert table.to_dicts() == [it.to_dict() for it in items]
+    row = table[-1]
+    assert row == items[-1] and (row.seq_id, row.unit, row.qualification) == (5, "мл", "х.ч.")
+    row.quantity = 2.5; row.storage_place = "Сейф"
+    assert table.item(4).quantity == 2.5 and table.get(4, "storage_place") == "Сейф"
+    with pytest.raises(AttributeError):
+        row.colour = "red"
+    del table[0]
+    assert [r.seq_id for r in table] == [2, 3, 4, 5]
+    assert ItemTable.from_dicts([{"seq_id": 7, "name": "Соль", "category": "Реактивы", "quantity": 1, "unit": "г",
+                                  "storage_place": "", "packaging": None}]).item(0).packaging == ""
+
+@pytest.mark.parametrize("vectorized", [True, False])
+def test_item_table_where(monkeypatch, vectorized):
+    if not vectorized:
+        monkeypatch.setattr(models, "np", None)
+    items = _stock(60)
+    table = ItemTable(items)
+    expect = [i for i, it in enumerate(items) if it.unit == "л" and it.storage_place == "Шкаф 3"]
+    assert expect and table.where(unit="л", storage_place="Шкаф 3") == expect
+    assert table.where(name="Реактив 7", quantity=10.0) == [6]
+    assert table.where(qualification=None) == [i for i, it in enumerate(items) if it.qualification is None]
+    assert table.where(unit="бочка") == [] and len(table.where()) == 60
+
+def test_item_table_holds_a_fraction_of_copied_items():
+    items = _stock(20000)
+    tracemalloc.start()
+    copies = [copy.copy(it) for it in items]
+    copied = tracemalloc.get_traced_memory()[0]
+    del copies
+    tracemalloc.stop(); tracemalloc.start()
+    table = ItemTable(items)
+    columns = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    assert len(table) == 20000 and columns < copied * 0.7
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+import random
+import search
+from search import SearchIndex
+
+def _brute(texts, q):
+    return {k for k, t in texts.items() if q.lower() in t.lower()}
+
+def test_search_is_case_insensitive_substring():
+    idx = SearchIndex()
+    idx.set_many([("1", "Натрий Хлористый"), ("2", "Калий хлористый"), ("3", "Соль")])
+    assert idx.search("ХЛОР") == {"1", "2"}
+    assert idx.search("ий х") == {"1", "2"}
+    assert idx.search("со") == {"3"}
+    assert idx.search("") == {"1", "2", "3"}
+    assert idx.search("нет такого") == set()
+
+def test_refined_query_follows_row_changes():
+    idx = SearchIndex()
+    idx.set_many([("1", "ацетон"), ("2", "ацетат")])
+    assert idx.search("аце") == {"1", "2"}
+    idx.set("2", "спирт")
+    idx.set("3", "ацетонитрил")
+    idx.discard("1")
+    # Extends the cached "аце" result, which must know of the changes
+    assert idx.search("ацет") == {"3"}
+    assert idx.search("спи") == {"2"}
+    assert idx.text("3") == "ацетонитрил"
+    assert len(idx) == 2
+
+def test_matches_keep_set_order():
+    idx = SearchIndex()
+    idx.set_many([("b", "Кислота серная"), ("a", "Кислота азотная"), ("c", "Вода")])
+    assert idx.matches("кислота") == [("b", "кислота серная"), ("a", "кислота азотная")]
+
+def test_random_edits_agree_with_a_plain_scan(monkeypatch):
+    # Small limits so that posting eviction, bulk drops and renumbering all happen
+    monkeypatch.setattr(search, "MAX_GRAMS", 8)
+    monkeypatch.setattr(search, "BULK_UPDATE", 20)
+    rnd = random.Random(7)
+    words = ["аце", "тон", "кис", "лота", "соль", "хлор", "ид", "нат", "рий"]
+    idx, texts = SearchIndex(), {}
+    for step in range(600):
+        key = str(rnd.randrange(60))
+        if rnd.random() < 0.2:
+            idx.discard(key); texts.pop(key, None)
+        else:
+            texts[key] = " ".join(rnd.choice(words) for _ in range(3))
+            idx.set(key, texts[key])
+        q = rnd.choice(words)[:rnd.randint(1, 4)]
+        assert idx.search(q) == _brute(texts, q), step
+
+def test_name_suggestions_prefix_first_then_by_match_position():
+    names = search.NameIndex(["Хлорид натрия", "Натрий", "натрия гидроксид", "Кальций", "Тиосульфат натрия"])
+    assert names.suggest("натр") == ["Натрий", "натрия гидроксид", "Хлорид натрия", "Тиосульфат натрия"]
+    assert names.suggest("  ") == []
+    assert names.suggest("натр", limit=1) == ["Натрий"]
+
+def test_name_index_counts_records_per_name():
+    names = search.NameIndex(["Соль", "Соль"])
+    assert names.suggest("со") == ["Соль"]
+    names.remove("Соль")
+    assert names.suggest("со") == ["Соль"]
+    names.remove("Соль")
+    assert names.suggest("со") == [] and len(names) == 0
+    names.add("Сода"); names.add(None)
+    assert names.suggest("од") == ["Сода"]
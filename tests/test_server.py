@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+import asyncio, threading
+import pytest
+import server, storage
+from remote import RemoteBackend, RemoteError
+from conftest import make_item
+
+@pytest.fixture
+def lab_server(data_dir, monkeypatch):
+    """A LabServer over a json data folder, served on a free port from a background loop.
+    Persisting is pushed past the test, so client and server may share the storage module."""
+    monkeypatch.setattr(server, "PERSIST_DELAY", 3600)
+    storage.set_backend("json")
+    storage.save_items([make_item(1), make_item(2)])
+    app = server.LabServer()
+    started = threading.Event(); box = {}
+
+    async def serve():
+        box["loop"], box["stop"] = asyncio.get_running_loop(), asyncio.Event()
+        srv = await asyncio.start_server(app.handle, "127.0.0.1", 0)
+        box["port"] = srv.sockets[0].getsockname()[1]
+        started.set()
+        await box["stop"].wait()
+        srv.close()
+        handlers = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+        for t in handlers:
+            t.cancel()
+        await asyncio.gather(*handlers, return_exceptions=True)
+
+    thread = threading.Thread(target=asyncio.run, args=(serve(),), daemon=True); thread.start()
+    started.wait(5)
+    clients = []
+
+    def client():
+        c = RemoteBackend(f"http://127.0.0.1:{box['port']}", timeout=5)
+        clients.append(c)
+        return c
+    yield app, client
+    for c in clients:
+        c.close()
+    box["loop"].call_soon_threadsafe(box["stop"].set)
+    thread.join(5)
+    app.saver.close(timeout=5)
+
+def test_remote_saves_merge_on_the_server(lab_server, workstations):
+    app, client = lab_server
+    storage.set_backend(client())
+    a, b = workstations
+    with a:
+        items_a = storage.load_items()
+    with b:
+        items_b = storage.load_items()
+    with a:
+        items_a[0].quantity = 7.0
+        items_a.append(make_item(3, name="Новый на А"))
+        storage.save_items(items_a)
+    with b:
+        items_b[0].quantity = 9.0
+        items_b.append(make_item(3, name="Новый на Б"))
+        result = storage.save_items(items_b)
+    assert result.conflicts == [] and result.renamed == {("items", 3): 4}
+    served = {it.seq_id: it for it in app.items}
+    assert served[1].quantity == 6.0
+    assert (served[3].name, served[4].name) == ("Новый на А", "Новый на Б")
+    # A fetches only what changed since its save: B's merged counter and new lot
+    with a:
+        changes = storage.pull_items(items_a)
+    assert sorted(k for _, k, _ in changes.records) == [1, 4]
+
+def test_changes_before_the_log_return_the_whole_store(lab_server):
+    app, client = lab_server
+    remote = client()
+    version, full, records = remote.changes("items", -1)
+    assert full and sorted(records["items"]) == [1, 2]
+    version2, full, records = remote.changes("items", version)
+    assert (version2, full, records) == (version, False, {})
+
+def test_queries_and_errors(lab_server):
+    app, client = lab_server
+    remote = client()
+    total, rows = remote.query("items", limit=1, q="реактив 2")
+    assert total == 1 and rows[0]["seq_id"] == 2
+    with pytest.raises(RemoteError, match="unknown kind"):
+        remote.query("nothing")
+    with pytest.raises(RemoteError, match="unknown operation"):
+        remote.op("drop_everything")
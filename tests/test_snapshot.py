@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+import json
+import operations, snapshot, storage
+from needs_store import NeedsStore
+from conftest import make_item
+
+DEP = "Отдел по анализу воды"
+
+def _needs_json():
+    return {
+        "plan_year": 2026, "locked": True,
+        "departments": {DEP: [{"need_id": 1, "category": "Реактивы", "item_name": "Соль", "plan_qty": 5, "remaining_qty": 5, "unit": "г"}]},
+        "qa_overflow_requests": [{"request_id": 2, "department": DEP, "need_id": 1, "status": "pending"}],
+        "store_requests": [
+            {"request_id": 1, "department": DEP, "need_id": 1, "requested_qty": 1, "status": "done"},
+            {"request_id": 2, "department": DEP, "need_id": 1, "requested_qty": 2, "status": "pending"},
+            {"request_id": 3, "department": DEP, "need_id": 1, "requested_qty": 1, "status": "rejected"},
+        ],
+        "issues": [{"issue_id": 7, "department": DEP, "need_id": 1, "qty": 1, "date": "2026-02-01"}],
+    }
+
+def _write_json(data_dir):
+    items = [make_item(1, name="Соль", unit="г"), make_item(2)]
+    (data_dir / "items.json").write_text(json.dumps([it.to_dict() for it in items], ensure_ascii=False), encoding="utf-8")
+    (data_dir / "needs.json").write_text(json.dumps(_needs_json(), ensure_ascii=False), encoding="utf-8")
+    return items
+
+def test_json_snapshot_json_round_trip(data_dir):
+    items = _write_json(data_dir)
+    snap = data_dir / "lab.snap"
+    snapshot.json_to_snapshot(snap)
+    sections = snapshot.read_raw_sections(snap)
+    assert {n: s[2] for n, s in sections.items() if s[2]} == {
+        "items": 2, "departments": 1, "qa_overflow_requests": 2,
+        "store_requests.open": 2, "store_requests.closed": 3, "issues": 7}
+    (data_dir / "items.json").unlink(); (data_dir / "needs.json").unlink()
+    snapshot.snapshot_to_json(snap)
+    assert json.loads((data_dir / "items.json").read_text(encoding="utf-8")) == [it.to_dict() for it in items]
+    needs = json.loads((data_dir / "needs.json").read_text(encoding="utf-8"))
+    expected = _needs_json()
+    assert needs["departments"] == expected["departments"] and needs["locked"] is True
+    # Open and closed requests come back as one list in id order
+    assert needs["store_requests"] == expected["store_requests"]
+    assert needs["issues"] == expected["issues"]
+
+def test_history_stays_undecoded_through_the_pending_queue(data_dir):
+    _write_json(data_dir)
+    storage.set_backend(snapshot.SnapshotBackend(data_dir / "lab.snap"))
+    needs = storage.load_needs()
+    requests, issues = needs["store_requests"], needs["issues"]
+    assert not requests.loaded and not issues.loaded
+    store = NeedsStore(needs, storage.load_items())
+    assert [r.request_id for r in store.pending_store_requests()] == [2]
+    res = operations.request_issue(store, DEP, 1, 1, "г", "user")
+    assert res.ok and res.touched == [("store_requests", 4)]
+    res = operations.approve_store_request(store, 2, "storekeeper")
+    assert res.ok and store.find_store_request(2).status == "done"
+    assert [r.request_id for r in store.pending_store_requests()] == [4]
+    # The queue, a new request, an issue and an approval left the closed history as bytes
+    assert not requests.loaded and not issues.loaded
+    assert not requests.pristine
+    storage.save_needs(needs)
+    sections = snapshot.read_raw_sections(data_dir / "lab.snap")
+    assert sections["store_requests.open"][2] == 4 and sections["store_requests.closed"][2] == 3
+    storage.set_backend(snapshot.SnapshotBackend(data_dir / "lab.snap"))
+    loaded = storage.load_needs()
+    assert [(r.request_id, r.status) for r in loaded["store_requests"].open_rows] == [(4, "pending")]
+    assert [(r.request_id, r.status) for r in loaded["store_requests"]] == [
+        (1, "done"), (2, "done"), (3, "rejected"), (4, "pending")]
+    assert [i.issue_id for i in loaded["issues"]] == [7, 8]
+
+def test_untouched_history_is_saved_as_a_byte_copy(data_dir):
+    _write_json(data_dir)
+    path = data_dir / "lab.snap"
+    storage.set_backend(snapshot.SnapshotBackend(path))
+    before = snapshot.read_raw_sections(path)
+    needs = storage.load_needs()
+    store = NeedsStore(needs, storage.load_items())
+    store.find_store_request(2)
+    needs["locked"] = False
+    storage.save_needs(needs)
+    after = snapshot.read_raw_sections(path)
+    for name in ("store_requests.open", "store_requests.closed", "issues"):
+        assert after[name] == before[name]
+    # A closed request is found through the full decode
+    assert store.find_store_request(3).status == "rejected"
+    assert needs["store_requests"].loaded
@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+import json
+import storage
+from snapshot import SnapshotBackend
+from conftest import make_item
+
+def _needs(**extra):
+    data = {"plan_year": 2026, "locked": False,
+            "departments": {"Отдел по анализу воды": [{"need_id": 1, "item_name": "Соль", "plan_qty": 5, "remaining_qty": 5}]},
+            "qa_overflow_requests": [], "issues": [], "store_requests": []}
+    data.update(extra)
+    return data
+
+def _journal_lines(path):
+    return [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines()]
+
+def test_json_round_trip(data_dir):
+    storage.set_backend("json")
+    storage.save_items([make_item(1), make_item(2, quantity=2.5)])
+    storage.save_needs(_needs())
+    items = storage.load_items()
+    assert [(it.seq_id, it.quantity) for it in items] == [(1, 10.0), (2, 2.5)]
+    needs = storage.load_needs()
+    assert needs["departments"]["Отдел по анализу воды"][0].item_name == "Соль"
+    assert not list(data_dir.glob("*.tmp"))
+
+def test_journal_appends_only_changed_records(data_dir):
+    storage.set_backend("journal")
+    items = storage.load_items()
+    items += [make_item(1), make_item(2)]
+    storage.save_items(items)
+    assert [e["k"] for e in _journal_lines(data_dir / "items.journal")] == [1, 2]
+    items[1].quantity = 3.0
+    del items[0]
+    storage.save_items(items)
+    entries = _journal_lines(data_dir / "items.journal")[2:]
+    assert {(e["k"], "d" in e) for e in entries} == {(2, False), (1, True)}
+    assert entries[[e["k"] for e in entries].index(2)]["v"]["quantity"] == 3.0
+
+def test_journal_replay_over_snapshot(data_dir):
+    storage.set_backend("journal")
+    items = storage.load_items()
+    items += [make_item(1), make_item(2)]
+    storage.save_items(items)
+    items[0].name = "Переименован"
+    items.append(make_item(3))
+    storage.save_items(items)
+    # The snapshot is still the empty start; the journal brings it up to date
+    assert json.loads((data_dir / "items.json").read_text(encoding="utf-8")) == []
+    storage.set_backend("journal")
+    loaded = storage.load_items()
+    assert [(it.seq_id, it.name) for it in loaded] == [(1, "Переименован"), (2, "Реактив 2"), (3, "Реактив 3")]
+
+def test_journal_torn_tail_is_dropped(data_dir):
+    storage.set_backend("journal")
+    items = storage.load_items()
+    items.append(make_item(1))
+    storage.save_items(items)
+    items.append(make_item(2))
+    storage.save_items(items)
+    journal = data_dir / "items.journal"
+    good = journal.read_bytes()
+    journal.write_bytes(good + b'{"s": "items", "k": 3, "v": {"seq_')
+    storage.set_backend("journal")
+    assert [it.seq_id for it in storage.load_items()] == [1, 2]
+    # Truncated back to the last whole line, so later appends stay readable
+    assert journal.read_bytes() == good
+
+def test_journal_checkpoint_folds_the_journal(data_dir, monkeypatch):
+    monkeypatch.setattr(storage, "JOURNAL_CHECKPOINT_EVERY", 2)
+    storage.set_backend("journal")
+    items = storage.load_items()
+    items.append(make_item(1))
+    storage.save_items(items)
+    for q in (1.0, 2.0):
+        items[0].quantity = q
+        storage.save_items(items)
+    assert _journal_lines(data_dir / "items.journal") == []
+    assert json.loads((data_dir / "items.json").read_text(encoding="utf-8"))[0]["quantity"] == 2.0
+
+def test_journal_needs_sections(data_dir):
+    storage.set_backend("journal")
+    needs = storage.load_needs()
+    storage.save_needs(needs)
+    dep = needs["departments"].setdefault("Отдел по анализу воды", [])
+    dep.append({"need_id": 7, "item_name": "Кислота", "plan_qty": 1, "remaining_qty": 1})
+    needs["locked"] = True
+    storage.save_needs(needs)
+    sections = {e["s"] for e in _journal_lines(data_dir / "needs.journal")}
+    assert sections == {"dep:Отдел по анализу воды", "meta"}
+    storage.set_backend("journal")
+    loaded = storage.load_needs()
+    assert loaded["locked"] is True
+    assert [n.need_id for n in loaded["departments"]["Отдел по анализу воды"]] == [7]
+
+def test_users_are_written_atomically(data_dir):
+    storage.ensure_default_admin()
+    users = storage.load_users()
+    assert [u["username"] for u in users] == ["admin"]
+    users.append({"username": "u1", "password_hash": storage.hash_password("x"), "role": "user", "department": "Отдел по анализу воды"})
+    storage.save_users(users)
+    assert [u["username"] for u in storage.load_users()] == ["admin", "u1"]
+    assert not list(data_dir.glob("users.json.*"))
+
+def test_snapshot_stores_share_one_lock(data_dir, monkeypatch):
+    monkeypatch.setattr(storage, "CONCURRENT_ACCESS", True)
+    storage.set_backend(SnapshotBackend(data_dir / "lab.snap"))
+    assert storage._store_lock("items").path == storage._store_lock("needs").path == data_dir / "snapshot.lock"
+    storage.set_backend("json")
+    assert storage._store_lock("items").path != storage._store_lock("needs").path
+
+def test_snapshot_round_trip_keeps_history_undecoded(data_dir):
+    storage.set_backend(SnapshotBackend(data_dir / "lab.snap"))
+    items = storage.load_items()
+    needs = storage.load_needs()
+    items.append(make_item(1))
+    needs["issues"].append({"issue_id": 4, "department": "Отдел по анализу воды", "qty": 1, "date": "2026-02-01"})
+    storage.save_items(items)
+    storage.save_needs(needs)
+    storage.set_backend(SnapshotBackend(data_dir / "lab.snap"))
+    loaded = storage.load_needs()
+    assert not loaded["issues"].loaded
+    assert loaded["issues"].max_id == 4
+    assert [it.seq_id for it in storage.load_items()] == [1]
+    assert [r.issue_id for r in loaded["issues"]] == [4]
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+import json
+import pytest
+from storage_sqlite import SqliteBackend
+from conftest import make_item
+
+DEP = "Отдел по анализу воды"
+
+@pytest.fixture
+def backend(data_dir):
+    b = SqliteBackend(data_dir / "lab.sqlite3")
+    yield b
+    b.conn.close()
+
+def _statements(backend):
+    seen = []
+    backend.conn.set_trace_callback(seen.append)
+    return seen
+
+def test_first_start_imports_json(data_dir):
+    items = [make_item(1), make_item(5, name="Соль")]
+    (data_dir / "items.json").write_text(json.dumps([it.to_dict() for it in items], ensure_ascii=False), encoding="utf-8")
+    (data_dir / "needs.json").write_text(json.dumps({
+        "plan_year": 2026, "departments": {DEP: [{"need_id": 3, "item_name": "Соль", "plan_qty": 2, "approved_by_qa": True}]},
+        "issues": [{"issue_id": 9, "department": DEP, "qty": 1, "date": "2026-03-01", "note": "вне схемы"}],
+    }, ensure_ascii=False), encoding="utf-8")
+    b = SqliteBackend(data_dir / "lab.sqlite3")
+    assert [(it.seq_id, it.name) for it in b.load_items()] == [(1, "Реактив 1"), (5, "Соль")]
+    needs = b.load_needs()
+    assert needs["plan_year"] == 2026
+    need = needs["departments"][DEP][0]
+    assert (need["need_id"], need["approved_by_qa"]) == (3, True)
+    # Keys unknown to the schema survive through the extra column
+    assert needs["issues"][0]["note"] == "вне схемы"
+    b.conn.close()
+    # Imported once: a later start does not take items.json over again
+    (data_dir / "items.json").write_text("[]", encoding="utf-8")
+    b = SqliteBackend(data_dir / "lab.sqlite3")
+    assert len(b.load_items()) == 2
+    b.conn.close()
+
+def test_save_writes_only_the_difference(backend):
+    items = [make_item(i) for i in range(1, 6)]
+    backend.save_items(items)
+    seen = _statements(backend)
+    items[2].quantity = 1.5
+    del items[4]
+    backend.save_items(items)
+    writes = [s for s in seen if s.startswith(("INSERT", "DELETE", "UPDATE"))]
+    assert len(writes) == 2
+    assert writes[0].startswith("INSERT INTO items") and "3," in writes[0].split("VALUES", 1)[1]
+    assert writes[1] == "DELETE FROM items WHERE seq_id=5"
+    assert [(it.seq_id, it.quantity) for it in backend.load_items()] == [(1, 10.0), (2, 10.0), (3, 1.5), (4, 10.0)]
+
+def test_needs_round_trip(backend):
+    needs = backend.load_needs()
+    needs["locked"] = True
+    needs["departments"] = {DEP: [{"need_id": 4, "item_name": "Кислота", "plan_qty": 1, "remaining_qty": 1}]}
+    needs["store_requests"] = [{"request_id": 12, "department": DEP, "need_id": 4, "requested_qty": 1, "status": "new"}]
+    backend.save_needs(needs)
+    loaded = backend.load_needs()
+    assert loaded["locked"] is True
+    assert [n["item_name"] for n in loaded["departments"][DEP]] == ["Кислота"]
+    assert [r["request_id"] for r in loaded["store_requests"]] == [12]
@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+import pytest
+import operations, storage, sync
+from models import Item
+from needs_store import NeedsStore
+from conftest import make_item
+
+def _item(seq_id, **fields):
+    return make_item(seq_id, **fields).to_dict()
+
+def test_merge_takes_one_sided_changes_and_combines_fields():
+    base = {"items": {1: _item(1), 2: _item(2)}}
+    ours = {"items": {1: _item(1, name="Наше имя"), 2: _item(2)}}
+    theirs = {"items": {1: _item(1, storage_place="Шкаф 2"), 2: _item(2, unit="г")}}
+    merged, conflicts = sync.merge_sections(base, ours, theirs, {})
+    assert conflicts == []
+    assert (merged["items"][1]["name"], merged["items"][1]["storage_place"]) == ("Наше имя", "Шкаф 2")
+    assert merged["items"][2]["unit"] == "г"
+
+def test_merge_adds_both_decrements_of_a_counter():
+    base = {"items": {1: _item(1, quantity=10.0)}}
+    ours = {"items": {1: _item(1, quantity=7.0)}}
+    theirs = {"items": {1: _item(1, quantity=8.0)}}
+    merged, conflicts = sync.merge_sections(base, ours, theirs, {})
+    assert conflicts == [] and merged["items"][1]["quantity"] == 5.0
+
+def test_merge_same_field_two_ways_keeps_theirs():
+    base = {"items": {1: _item(1)}}
+    merged, conflicts = sync.merge_sections(base, {"items": {1: _item(1, name="А")}}, {"items": {1: _item(1, name="Б")}}, {})
+    assert merged["items"][1]["name"] == "Б"
+    assert conflicts == ["items/1: name"]
+
+def test_merge_renames_our_new_record_on_id_collision():
+    base = {"items": {1: _item(1)}}
+    ours = {"items": {1: _item(1), 2: _item(2, name="Наш")}}
+    theirs = {"items": {1: _item(1), 2: _item(2, name="Их"), 3: _item(3)}}
+    renamed = {}
+    merged, conflicts = sync.merge_sections(base, ours, theirs, renamed)
+    assert conflicts == []
+    assert renamed == {("items", 2): 4}
+    assert merged["items"][2]["name"] == "Их"
+    assert (merged["items"][4]["seq_id"], merged["items"][4]["name"]) == (4, "Наш")
+    # Memory still knows the record as 2: a later merge applies the rename to base and ours
+    edited = {"items": {1: _item(1), 2: _item(2, name="Наш, правка")}}
+    again, conflicts = sync.merge_sections(ours, edited, merged, renamed)
+    assert conflicts == []
+    assert (again["items"][2]["name"], again["items"][4]["name"]) == ("Их", "Наш, правка")
+
+def test_merge_renumbers_past_id_max_of_a_partial_theirs():
+    # theirs holds only the touched record, the store's largest need id is 9
+    ours = {"dep:А": {5: {"need_id": 5, "item_name": "Наш"}}}
+    theirs = {"dep:А": {5: {"need_id": 5, "item_name": "Их"}}}
+    renamed = {}
+    merged, _ = sync.merge_sections({"dep:А": {}}, ours, theirs, renamed, id_max={"needs": 9})
+    assert renamed == {("dep:А", 5): 10}
+    assert merged["dep:А"][10] == {"need_id": 10, "item_name": "Наш"}
+
+def test_references_follow_a_renamed_record():
+    ours = {"dep:А": {5: {"need_id": 5, "department": "А"}},
+            "issues": {3: {"issue_id": 3, "department": "А", "need_id": 5, "item_seq_id": 2}}}
+    theirs = {"dep:А": {5: {"need_id": 5, "department": "А", "item_name": "Их"}},
+              "issues": {3: {"issue_id": 3, "department": "Б", "need_id": 5, "item_seq_id": 2}}}
+    renamed = {}
+    merged, conflicts = sync.merge_sections({}, ours, theirs, renamed)
+    assert conflicts == [] and renamed == {("dep:А", 5): 6, ("issues", 3): 4}
+    assert merged["issues"][4] == {"issue_id": 4, "department": "А", "need_id": 6, "item_seq_id": 2}
+    assert merged["issues"][3]["need_id"] == 5
+    # A need of another department with the same id is not the renamed one
+    other = sync.apply_renames({"issues": {1: {"issue_id": 1, "department": "Б", "need_id": 5}}}, renamed)
+    assert other["issues"][1]["need_id"] == 5
+
+def test_merge_deletions():
+    base = {"items": {1: _item(1), 2: _item(2)}}
+    # We deleted 1 which they left alone, and 2 which they changed
+    ours = {"items": {}}
+    theirs = {"items": {1: _item(1), 2: _item(2, quantity=1.0)}}
+    merged, conflicts = sync.merge_sections(base, ours, theirs, {})
+    assert list(merged["items"]) == [2]
+    assert conflicts == ["items/2: изменено другим пользователем"]
+    # They deleted a record we changed
+    merged, conflicts = sync.merge_sections(base, {"items": {1: _item(1, unit="г"), 2: _item(2)}}, {"items": {2: _item(2)}}, {})
+    assert 1 not in merged["items"]
+    assert conflicts == ["items/1: удалено другим пользователем"]
+
+def test_rebase_keeps_unsaved_changes_of_ours():
+    base = {"items": {1: _item(1), 2: _item(2)}}
+    ours = {"items": {1: _item(1, name="Не сохранено"), 2: _item(2)}}
+    theirs = {"items": {1: _item(1, unit="г"), 2: _item(2, unit="мл"), 3: _item(3)}}
+    changes, new_base, pending = sync.rebase(base, ours, theirs, {})
+    assert sorted((s, k) for s, k, _ in changes.records) == [("items", 2), ("items", 3)]
+    assert new_base["items"][1] == base["items"][1]
+    assert pending
+
+def test_concurrent_saves_merge_on_disk(workstations):
+    storage.set_backend("json")
+    a, b = workstations
+    with a:
+        storage.save_items([make_item(1), make_item(2)])
+        items_a = storage.load_items()
+    with b:
+        items_b = storage.load_items()
+    with a:
+        items_a[0].quantity = 7.0
+        items_a.append(make_item(3, name="Новый на А"))
+        assert not storage.save_items(items_a).merged
+    with b:
+        items_b[0].quantity = 9.0
+        items_b[1].storage_place = "Шкаф 5"
+        items_b.append(make_item(3, name="Новый на Б"))
+        result = storage.save_items(items_b)
+    assert result.merged and result.conflicts == []
+    assert result.renamed == {("items", 3): 4}
+    on_disk = {it.seq_id: it for it in storage.get_backend().load_items()}
+    assert on_disk[1].quantity == 6.0
+    assert on_disk[2].storage_place == "Шкаф 5"
+    assert (on_disk[3].name, on_disk[4].name) == ("Новый на А", "Новый на Б")
+    # A pulls B's records without losing its own
+    with a:
+        changes = storage.pull_items(items_a)
+    assert {k for _, k, _ in changes.records} == {1, 2, 4}
+
+def test_unchanged_save_after_pull_needs_no_merge(workstations):
+    storage.set_backend("json")
+    a, b = workstations
+    with a:
+        storage.save_items([make_item(1)])
+        items_a = storage.load_items()
+    with b:
+        items_b = storage.load_items()
+        items_b[0].unit = "г"
+        storage.save_items(items_b)
+    with a:
+        changes = storage.pull_items(items_a)
+        assert [(s, k) for s, k, _ in changes.records] == [("items", 1)]
+        items_a = [Item.from_dict(sync._as_dict(rec)) for _, _, rec in changes.records]
+        items_a[0].quantity = 4.0
+        assert not storage.save_items(items_a).merged
+    assert storage.get_backend().load_items()[0].unit == "г"
+
+def test_crash_after_the_stamp_makes_others_merge(workstations, monkeypatch):
+    storage.set_backend("json")
+    a, b = workstations
+    with a:
+        storage.save_items([make_item(1)])
+        items_a = storage.load_items()
+    with b:
+        items_b = storage.load_items()
+    backend = storage.get_backend()
+    real_save = backend.save_items
+
+    def crash_after_write(items):
+        real_save(items)
+        raise OSError("crash")
+    with a:
+        items_a.append(make_item(2, name="Сохранено частично"))
+        # The data lands and the process dies before anything else runs
+        monkeypatch.setattr(backend, "save_items", crash_after_write)
+        with pytest.raises(OSError):
+            storage.save_items(items_a)
+        monkeypatch.setattr(backend, "save_items", real_save)
+    with b:
+        items_b[0].unit = "г"
+        result = storage.save_items(items_b)
+    # B saw the new stamp and merged A's record instead of overwriting it
+    assert result.merged
+    on_disk = {it.seq_id: it for it in backend.load_items()}
+    assert on_disk[2].name == "Сохранено частично" and on_disk[1].unit == "г"
+
+def test_issue_follows_its_need_renamed_by_another_workstation(workstations):
+    storage.set_backend("json")
+    dep = "Отдел"
+    storage.save_items([make_item(1, name="Соль")])
+    storage.save_needs({"plan_year": 2026, "departments": {dep: []}})
+    a, b = workstations
+    stores = {}
+    for ws in (a, b):
+        with ws:
+            stores[ws] = NeedsStore(storage.load_needs(), storage.load_items())
+    # Both plan the same lot as need 1 and issue against it
+    for ws, qty in ((a, 2.0), (b, 3.0)):
+        operations.add_need(stores[ws], dep, {"category": "Реактивы", "item_name": "Соль", "plan_qty": 5, "unit": "шт"})
+        assert operations.issue(stores[ws], dep, 1, qty).ok
+    with a:
+        storage.save_needs(stores[a].data)
+    with b:
+        result = storage.save_needs(stores[b].data)
+    assert result.renamed == {("dep:" + dep, 1): 2, ("issues", 1): 2}
+    on_disk = storage.get_backend().load_needs()
+    assert [(i["issue_id"], i["need_id"], i["qty"]) for i in on_disk["issues"]] == [(1, 1, 2.0), (2, 2, 3.0)]
+    with b:
+        stores[b].apply_changes(storage.pull_needs(stores[b].data))
+    store = stores[b]
+    assert store.find_issue(2).need_id == 2 and store.find_need(dep, 2).remaining_qty == 2.0
+    assert store.find_issue(1).need_id == 1 and store.find_need(dep, 1).remaining_qty == 3.0
+    with b:
+        assert not storage.save_needs(store.data).conflicts
+    assert sorted((i["issue_id"], i["need_id"]) for i in storage.get_backend().load_needs()["issues"]) == [(1, 1), (2, 2)]
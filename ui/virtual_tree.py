@@ -0,0 +1,508 @@
+# -*- coding: utf-8 -*-
+"""A Treeview that shows a window of a Python-side row model.
+
+Rows live in dicts keyed by their iid; the Tk widget only ever holds the rows on screen
+plus OVERSCAN rows above and below, so memory and redraw time do not grow with the
+number of rows. The widget scrolls natively inside that window (wheel, keys) and the
+window is moved when the view gets near its edge; the scrollbar is driven from the
+model. The Treeview calls the rest of the UI uses (insert, delete, item, exists,
+selection, get_children, detach, reattach, see, heading, column, tag_configure, bind)
+work on row iids whether the row is materialized or not. Search runs on the model's
+SearchIndex, and rows added or changed later are matched against the current query.
+Sorting is done on the model too, with typed keys cached per cell (sort_key), so a
+heading click reorders a Python list and redraws one window.
+"""
+from __future__ import annotations
+import itertools, math, re
+import tkinter as tk
+from tkinter import ttk
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+from search import SearchIndex
+
+OVERSCAN = 20
+DEFAULT_ROWHEIGHT = 20
+
+_DATE = re.compile(r"\d{4}-\d{2}-\d{2}")
+
+def sort_key(v: Any) -> Tuple[int, Any]:
+    """Typed key of a cell: numbers by value, then ISO dates (and timestamps), then text
+    casefolded, empty cells last. Keys of one column always compare, whatever it holds:
+    NaN and infinities ("nan", "inf" typed in a text field) sort as text."""
+    if isinstance(v, (int, float)) and not isinstance(v, bool) and math.isfinite(v):
+        return (0, v)
+    s = str(v).strip() if v is not None else ""
+    if not s:
+        return (3, "")
+    try:
+        f = float(s.replace(",", "."))
+    except ValueError:
+        pass
+    else:
+        if math.isfinite(f):
+            return (0, f)
+    if _DATE.match(s):
+        return (1, s)
+    return (2, s.casefold())
+
+class VirtualTree(ttk.Frame):
+    def __init__(self, master, columns: Sequence[str], **tree_options):
+        super().__init__(master)
+        tree_options.setdefault("show", "headings"); tree_options.setdefault("selectmode", "browse")
+        self.tree = ttk.Treeview(self, columns=list(columns), yscrollcommand=self._on_tree_scroll, **tree_options)
+        self.vsb = ttk.Scrollbar(self, orient="vertical", command=self._on_scrollbar)
+        self.vsb.pack(side="right", fill="y")
+        self.tree.pack(side="left", fill="both", expand=True)
+        self._values: Dict[str, tuple] = {}
+        self._tags: Dict[str, tuple] = {}
+        self._order: List[str] = []            # every row, in display order
+        self._hidden: Set[str] = set()         # detached rows
+        self._view: Optional[List[str]] = None # visible rows, rebuilt on demand
+        self._index = SearchIndex()            # row text by iid
+        self._query = ""
+        self._match: Optional[Set[str]] = None # rows matching _query, None without a query
+        self._window: List[str] = []           # rows materialized in the Treeview
+        self._start = 0                        # view index of _window[0]
+        self._first = 0                        # view index of the top row on screen
+        self._page = 40
+        self._selected: Optional[str] = None
+        self._columns = list(columns)
+        self._titles: Dict[str, str] = {}      # heading texts without the sort marks
+        self._sorted: List[Tuple[str, bool]] = []   # (column, reverse), major key first
+        self._sort_keys: Dict[int, Dict[str, Tuple[int, Any]]] = {}  # column -> iid -> key
+        self._iids = itertools.count(1)
+        # Called (from idle) when the view comes near the last row; a paged source
+        # appends its next page with append_rows
+        self.on_scroll_end: Optional[Callable[[], None]] = None
+        self._pending = False
+        try:
+            self._rowheight = int(ttk.Style(self).lookup("Treeview", "rowheight") or DEFAULT_ROWHEIGHT)
+        except (tk.TclError, ValueError):
+            self._rowheight = DEFAULT_ROWHEIGHT
+        self.tree.bind("<Configure>", self._on_configure, add="+")
+        self.tree.bind("<<TreeviewSelect>>", self._on_select, add="+")
+
+    # ---- Treeview passthrough ----
+    def heading(self, column, **kw):
+        if "text" in kw:
+            self._titles[column] = kw["text"]
+            kw["text"] = self._heading_text(column)
+        return self.tree.heading(column, **kw)
+
+    def column(self, column, **kw):
+        return self.tree.column(column, **kw)
+
+    def tag_configure(self, tagname, **kw):
+        return self.tree.tag_configure(tagname, **kw)
+
+    def bind(self, sequence=None, func=None, add="+"):
+        # Added to the tree's own bindings by default; <Configure> and selection drive the window
+        return self.tree.bind(sequence, func, add)
+
+    def __getitem__(self, key):
+        return self.tree[key]
+
+    # ---- model ----
+    def _invalidate(self) -> None:
+        self._view = None
+        self._schedule()
+
+    def _schedule(self) -> None:
+        # Bursts of model changes are drawn once, when Tk is idle
+        if not self._pending:
+            self._pending = True
+            self.after_idle(self._render)
+
+    def view(self) -> List[str]:
+        if self._view is None:
+            rows, match, hidden = self._order, self._match, self._hidden
+            if match is not None and len(match) < len(rows):
+                rows = [i for i in rows if i in match]
+            if hidden:
+                rows = [i for i in rows if i not in hidden]
+            self._view = list(rows) if rows is self._order else rows
+        return self._view
+
+    def _shown(self, iid: str) -> bool:
+        return iid not in self._hidden and (self._match is None or iid in self._match)
+
+    def _index_rows(self, iids: List[str]) -> bool:
+        """Update the search text of new or changed rows; True when one of them started or
+        stopped matching the current query."""
+        index, values = self._index, self._values
+        index.set_many((i, " ".join(str(v) for v in values[i])) for i in iids)
+        for keys in self._sort_keys.values():
+            for i in iids:
+                keys.pop(i, None)
+        match = self._match
+        if match is None:
+            return False
+        q, flipped = self._query, False
+        for i in iids:
+            hit = q in index.text(i)
+            if hit != (i in match):
+                flipped = True
+                if hit:
+                    match.add(i)
+                else:
+                    match.discard(i)
+        return flipped
+
+    def _unindex_rows(self, iids: Iterable[str]) -> None:
+        iids = list(iids)
+        for keys in self._sort_keys.values():
+            for i in iids:
+                keys.pop(i, None)
+        for i in iids:
+            self._index.discard(i)
+            if self._match is not None:
+                self._match.discard(i)
+
+    def set_rows(self, rows: Iterable[Tuple[str, tuple, tuple]]) -> None:
+        """Replace every row with (iid, values, tags) triples; selection and filter are kept
+        for the iids that remain."""
+        self._values = {}; self._tags = {}; self._order = []; self._sort_keys = {}
+        for iid, values, tags in rows:
+            self._values[iid] = tuple(values); self._order.append(iid)
+            if tags:
+                self._tags[iid] = tuple(tags)
+        self._hidden &= self._values.keys()
+        self._index.clear()
+        self._index_rows(self._order)
+        if self._query:
+            self._match = self._index.search(self._query)
+        if self._selected not in self._values:
+            self._selected = None
+        if self._sorted:
+            self.sort_by(self._sorted)
+        self._window = []  # same iids may carry new values: redraw the window
+        self._invalidate()
+
+    def append_rows(self, rows: Iterable[Tuple[str, tuple, tuple]]) -> None:
+        """Add (iid, values, tags) rows after the existing ones, e.g. a further page;
+        iids already present are skipped."""
+        new = []
+        for iid, values, tags in rows:
+            if iid in self._values:
+                continue
+            self._values[iid] = tuple(values); new.append(iid)
+            if tags:
+                self._tags[iid] = tuple(tags)
+        if not new:
+            return
+        self._order.extend(new)
+        self._index_rows(new)
+        if self._sorted:
+            self.sort_by(self._sorted)
+        else:
+            self._invalidate()
+
+    def reconcile(self, rows: Iterable[Tuple[str, tuple, tuple]]) -> Tuple[int, int, int]:
+        """Bring the model to the given (iid, values, tags) rows by key: new iids are
+        inserted, missing ones deleted and rows whose values or tags differ updated; the
+        rest are left alone. The row at the top of the view and the selection stay where
+        they are. Returns (inserted, updated, deleted)."""
+        values, tags_by = self._values, self._tags
+        on_screen = set(self._window)
+        order: List[str] = []
+        changed: List[str] = []
+        inserted = updated = 0
+        for iid, vals, tags in rows:
+            vals = tuple(vals); tags = tuple(tags) if tags else ()
+            order.append(iid)
+            old = values.get(iid)
+            if old is not None:
+                if old == vals and tags_by.get(iid, ()) == tags:
+                    continue
+                updated += 1
+            else:
+                inserted += 1
+            values[iid] = vals; changed.append(iid)
+            if tags:
+                tags_by[iid] = tags
+            else:
+                tags_by.pop(iid, None)
+            if iid in on_screen:
+                self.tree.item(iid, values=vals, tags=tags)
+        keep = set(order)
+        gone = [i for i in self._order if i not in keep]
+        for i in gone:
+            del values[i]; tags_by.pop(i, None)
+        self._unindex_rows(gone)
+        flipped = self._index_rows(changed)
+        if not (inserted or updated or gone) and order == self._order:
+            return 0, 0, 0
+        view = self.view()
+        top = view[self._first] if self._first < len(view) else None
+        if self._sorted:
+            # A sorted view keeps the column order rather than the order of the data
+            if inserted or updated:
+                self._order = order
+                self.sort_by(self._sorted)
+            else:
+                self._order = [i for i in self._order if i in keep]
+        elif order != self._order:
+            self._order = order
+        elif not (inserted or gone or flipped):
+            # Values changed in place; the rows on screen are already updated
+            return 0, updated, 0
+        if gone:
+            self._hidden.difference_update(gone)
+            if self._selected not in keep:
+                self._selected = None
+        self._invalidate()
+        if top is not None and top in keep:
+            try:
+                self._first = self.view().index(top)
+            except ValueError:
+                pass
+        return inserted, updated, len(gone)
+
+    def insert(self, parent: str, index, iid: Optional[str] = None, values: Sequence[Any] = (), tags: Sequence[str] = (), **kw) -> str:
+        if iid is None:
+            iid = f"row{next(self._iids)}"
+        if iid in self._values:
+            raise tk.TclError(f'Item {iid} already exists')
+        self._values[iid] = tuple(values)
+        if tags:
+            self._tags[iid] = tuple(tags) if not isinstance(tags, str) else (tags,)
+        self._index_rows([iid])
+        if index == "end" or int(index) >= len(self._order):
+            self._order.append(iid)
+        else:
+            self._order.insert(int(index), iid)
+        if self._sorted:
+            # A sorted view places the row by its keys, not at `index`
+            self.sort_by(self._sorted)
+        else:
+            self._invalidate()
+        return iid
+
+    def delete(self, *iids: str) -> None:
+        gone = {i for i in iids if i in self._values}
+        if not gone:
+            return
+        for i in gone:
+            del self._values[i]; self._tags.pop(i, None)
+        self._unindex_rows(gone)
+        self._order = [i for i in self._order if i not in gone]
+        self._hidden -= gone
+        if self._selected in gone:
+            self._selected = None
+        self._invalidate()
+
+    def exists(self, iid: str) -> bool:
+        return iid in self._values
+
+    def item(self, iid: str, option: Optional[str] = None, **kw):
+        if iid not in self._values:
+            raise tk.TclError(f"Item {iid} not found")
+        if not kw:
+            if option == "values":
+                return self._values[iid]
+            if option == "tags":
+                return self._tags.get(iid, ())
+            if option is None:
+                return {"values": self._values[iid], "tags": self._tags.get(iid, ())}
+            return self.tree.item(iid, option) if iid in self._window else ""
+        if "values" in kw:
+            old, new = self._values[iid], tuple(kw["values"])
+            self._values[iid] = new
+            if self._index_rows([iid]):
+                # Started or stopped matching the search
+                self._invalidate()
+            if any(old[p:p + 1] != new[p:p + 1] for p in (self._columns.index(c) for c, _ in self._sorted)):
+                # A sort column changed: the row may belong elsewhere in the sorted view
+                self.sort_by(self._sorted)
+        if "tags" in kw:
+            tags = kw["tags"]
+            self._tags[iid] = (tags,) if isinstance(tags, str) else tuple(tags or ())
+        if iid in self._window:
+            # On screen: update the widget row in place, no re-render needed
+            self.tree.item(iid, values=self._values[iid], tags=self._tags.get(iid, ()))
+
+    def get_children(self, item: str = "") -> List[str]:
+        return list(self.view())
+
+    def row_text(self, iid: str) -> str:
+        """Lowercased text of a row's cells, as the search matches it."""
+        return self._index.text(iid)
+
+    def detach(self, *iids: str) -> None:
+        new = {i for i in iids if i in self._values and i not in self._hidden}
+        if new:
+            self._hidden |= new
+            self._invalidate()
+
+    def reattach(self, iid: str, parent: str = "", index="end") -> None:
+        # A row comes back at its place in the model order
+        if iid in self._hidden:
+            self._hidden.discard(iid)
+            self._invalidate()
+
+    def search(self, query: str) -> None:
+        """Show only rows whose text contains the query, case-insensitively; "" shows
+        every row."""
+        q = query.strip().lower()
+        if q == self._query:
+            return
+        self._query = q
+        self._match = self._index.search(q) if q else None
+        self._invalidate()
+
+    def _column_keys(self, pos: int) -> Dict[str, Tuple[int, Any]]:
+        # Typed keys are computed once per cell and dropped when the row changes
+        keys = self._sort_keys.setdefault(pos, {})
+        if len(keys) != len(self._values):
+            values = self._values
+            for i in self._order:
+                if i not in keys:
+                    row = values[i]
+                    keys[i] = sort_key(row[pos] if pos < len(row) else "")
+        return keys
+
+    def sort_by(self, columns: Sequence[Tuple[str, bool]]) -> None:
+        """Stable sort of all rows by (column, reverse) pairs, the first one the major key;
+        the widget is redrawn once, for the visible window."""
+        for column, reverse in reversed(columns):
+            keys = self._column_keys(self._columns.index(column))
+            self._order.sort(key=keys.__getitem__, reverse=reverse)
+        self._sorted = list(columns)
+        for c in self._titles:
+            self.tree.heading(c, text=self._heading_text(c))
+        self._invalidate()
+
+    def sort_column(self, column: str, add: bool = False) -> None:
+        """Heading click: sort by the column, reversed when it is clicked again. With add
+        (Shift+click) the column becomes the next key of the current sort instead."""
+        current = list(self._sorted)
+        pos = next((n for n, (c, _) in enumerate(current) if c == column), None)
+        if add:
+            if pos is None:
+                current.append((column, False))
+            else:
+                current[pos] = (column, not current[pos][1])
+        else:
+            current = [(column, current == [(column, False)])]
+        self.sort_by(current)
+
+    def sortable(self) -> None:
+        """Sort on heading clicks; Shift+click adds the column to the sort."""
+        for c in self._columns:
+            self.tree.heading(c, command=lambda c=c: self.sort_column(c))
+        self.tree.bind("<Shift-Button-1>", self._on_shift_click, add="+")
+
+    def _on_shift_click(self, event):
+        if self.tree.identify_region(event.x, event.y) != "heading":
+            return None
+        n = int(self.tree.identify_column(event.x)[1:]) - 1
+        if 0 <= n < len(self._columns):
+            self.sort_column(self._columns[n], add=True)
+        return "break"
+
+    def _heading_text(self, column: str) -> str:
+        title = self._titles.get(column, column)
+        for n, (c, reverse) in enumerate(self._sorted):
+            if c == column:
+                return f"{title} {'▼' if reverse else '▲'}{n + 1 if len(self._sorted) > 1 else ''}"
+        return title
+
+    def move(self, iid: str, parent: str, index: int) -> None:
+        self._order.remove(iid)
+        self._order.insert(index, iid)
+        self._invalidate()
+
+    # ---- selection ----
+    def selection(self) -> Tuple[str, ...]:
+        return (self._selected,) if self._selected is not None and self._shown(self._selected) else ()
+
+    def selection_set(self, *iids) -> None:
+        if iids and isinstance(iids[0], (list, tuple)):
+            iids = tuple(iids[0])
+        self._selected = iids[0] if iids and iids[0] in self._values else None
+        if self._selected in self._window:
+            self.tree.selection_set(self._selected)
+        self.tree.event_generate("<<TreeviewSelect>>")
+
+    def see(self, iid: str) -> None:
+        view = self.view()
+        try:
+            pos = view.index(iid)
+        except ValueError:
+            return
+        if not self._first <= pos < self._first + self._page:
+            self._first = max(0, pos - self._page // 2)
+            self._schedule()
+
+    def _on_select(self, event=None) -> None:
+        sel = self.tree.selection()
+        if sel:
+            self._selected = sel[0]
+        elif self._selected in self._window:
+            # Deselected by the user; a selected row that is just scrolled away stays selected
+            self._selected = None
+
+    # ---- window ----
+    def _on_configure(self, event) -> None:
+        page = max(1, (event.height - self._rowheight) // self._rowheight)
+        if page != self._page:
+            self._page = page
+            self._schedule()
+
+    def _render(self) -> None:
+        self._pending = False
+        view = self.view(); total = len(view)
+        self._first = max(0, min(self._first, total - self._page))
+        n = min(total, self._page + 2 * OVERSCAN)
+        start = max(0, min(self._first - OVERSCAN, total - n))
+        rows = view[start:start + n]
+        if rows != self._window:
+            self.tree.delete(*self.tree.get_children())
+            values, tags = self._values, self._tags
+            for iid in rows:
+                self.tree.insert("", "end", iid=iid, values=values[iid], tags=tags.get(iid, ()))
+            self._window = rows
+        self._start = start
+        if self._selected is not None and self._selected in rows:
+            self.tree.selection_set(self._selected)
+        self.tree.yview_moveto((self._first - start) / n if n else 0.0)
+        self._update_scrollbar()
+
+    def _update_scrollbar(self) -> None:
+        total = len(self.view())
+        if total <= self._page:
+            self.vsb.set(0.0, 1.0)
+        else:
+            self.vsb.set(self._first / total, min(1.0, (self._first + self._page) / total))
+        if self.on_scroll_end is not None and self._first + self._page >= total - OVERSCAN:
+            self.after_idle(self.on_scroll_end)
+
+    def _on_tree_scroll(self, lo, hi) -> None:
+        # The widget scrolled inside the window (wheel, keys, see): follow it, and move the
+        # window before the view reaches its edge
+        n = len(self._window)
+        if not n or self._pending:
+            return
+        self._first = self._start + int(round(float(lo) * n))
+        total = len(self.view())
+        near_top = self._start > 0 and self._first - self._start < OVERSCAN // 2
+        near_end = self._start + n < total and self._start + n - (self._first + self._page) < OVERSCAN // 2
+        if near_top or near_end:
+            self._schedule()
+        else:
+            self._update_scrollbar()
+
+    def _on_scrollbar(self, action: str, amount, unit: str = None) -> None:
+        total = len(self.view())
+        if action == "moveto":
+            first = int(float(amount) * total)
+        else:
+            step = self._page if unit == "pages" else 1
+            first = self._first + int(amount) * step
+        self._first = max(0, min(first, total - self._page))
+        start, n = self._start, len(self._window)
+        if start <= self._first and self._first + self._page <= start + n and n:
+            # Still inside the materialized window: scroll the widget only
+            self.tree.yview_moveto((self._first - start) / n)
+            self._update_scrollbar()
+        else:
+            self._schedule()
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""Notices saves of other workstations by watching the stores' version stamps.
+
+On Linux the data folder is watched with inotify, so a local save is seen at once;
+stamps are compared every `interval` seconds in any case, which is what catches
+writes coming over a network share (inotify does not see those) and other systems.
+"""
+from __future__ import annotations
+import os, select, threading, time
+from typing import Dict, Iterable, List, Optional
+from constants import DATA_DIR
+from storage import store_version
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+
+def _inotify_fd() -> Optional[int]:
+    try:
+        import ctypes, ctypes.util
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or None, use_errno=True)
+        fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if fd < 0:
+            return None
+        if libc.inotify_add_watch(fd, os.fsencode(str(DATA_DIR)), IN_CLOSE_WRITE | IN_MOVED_TO) < 0:
+            os.close(fd)
+            return None
+        return fd
+    except (OSError, AttributeError):
+        return None
+
+class ChangeWatcher:
+    """Background thread collecting the stores whose version stamp moved.
+
+    poll() is meant for the UI thread; it returns and forgets the stores changed since
+    the previous call. Our own saves show up as well: storage.pull_* tells them apart.
+    """
+
+    def __init__(self, stores: Iterable[str] = ("items", "needs"), interval: float = 2.0):
+        self._stores = list(stores); self._interval = interval
+        # Read by the thread itself: in remote mode a stamp is a request to the server
+        self._seen: Dict[str, Optional[int]] = {}
+        self._changed: set = set()
+        self._mutex = threading.Lock(); self._stop = threading.Event()
+        DATA_DIR.mkdir(parents=True, exist_ok=True)
+        self._fd = _inotify_fd()
+        self._thread = threading.Thread(target=self._run, name="change-watcher", daemon=True)
+        self._thread.start()
+
+    def poll(self) -> List[str]:
+        with self._mutex:
+            changed = sorted(self._changed); self._changed.clear()
+        return changed
+
+    def touch(self, store: str) -> None:
+        """Report `store` again on the next poll (e.g. when it could not be refreshed yet)."""
+        with self._mutex:
+            self._changed.add(store)
+
+    def close(self) -> None:
+        self._stop.set()
+        self._thread.join(self._interval + 1)
+        if self._fd is not None:
+            os.close(self._fd); self._fd = None
+
+    @staticmethod
+    def _version(store: str) -> Optional[int]:
+        try:
+            return store_version(store)
+        except OSError:
+            # Remote storage while the server is unreachable: try again next round
+            return None
+
+    def _wait(self) -> None:
+        if self._fd is None:
+            self._stop.wait(self._interval)
+            return
+        ready, _, _ = select.select([self._fd], [], [], self._interval)
+        if ready:
+            # The events only wake us up; the stamps say what changed
+            try:
+                os.read(self._fd, 64 * 1024)
+            except BlockingIOError:
+                return
+            # Bursts of events (temp files, renames) settle before the stamps are read
+            time.sleep(0.05)
+
+    def _run(self) -> None:
+        self._seen = {s: self._version(s) for s in self._stores}
+        while not self._stop.is_set():
+            self._wait()
+            for store in self._stores:
+                version = self._version(store)
+                if version is not None and version != self._seen[store]:
+                    self._seen[store] = version
+                    with self._mutex:
+                        self._changed.add(store)